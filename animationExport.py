@@ -0,0 +1,297 @@
+import collections
+import os
+import subprocess
+import time
+
+import matplotlib
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+import numpy as np
+from PIL import Image
+
+from structs import ParticleData
+from trajectory import interpolateFrames
+from parallel import workerPool, attachFrames
+from instrumentation import phase, count
+
+
+# Extensions written by piping the frames to ffmpeg
+videoExtensions = (".mp4", ".mov", ".mkv", ".webm", ".avi")
+
+# Frames being rendered or waiting to be written, per worker (bounds the memory used by frames in flight)
+_framesInFlightPerWorker = 2
+
+# Renderer of this process (a worker, or the main process when rendering there), set by _initRenderer
+_renderer = None
+
+
+def _initRenderer(layout: dict):
+
+    global _renderer
+    _renderer = FrameRenderer(layout)
+
+
+# Draws the dye of single frames over an image of the static layer (streamlines, initial dye, labels and legend) with
+# the Agg backend. layout has the figure size and dpi, the axes position and limits, the static layer and the styles of
+# the dye lines, as made by Plotting._animationLayout
+class FrameRenderer():
+
+    def __init__(self, layout: dict):
+
+        self.figure = Figure(figsize=layout["size"], dpi=layout["dpi"])
+        self.canvas = FigureCanvasAgg(self.figure)
+        self.figure.figimage(layout["background"], origin="upper")
+
+        # Same axes as the static figure, with nothing but the dye drawn
+        self.ax = self.figure.add_axes(layout["axesPosition"])
+        self.ax.set_xlim(*layout["xLimits"])
+        self.ax.set_ylim(*layout["yLimits"])
+        self.ax.set_axis_off()
+        self.ax.patch.set_visible(False)
+
+        self.artists = [self.ax.plot([], [], animated=True, **style)[0] for style in layout["styles"]]
+
+        # The static layer is drawn once, then restored for every frame
+        self.canvas.draw()
+        self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+
+    # RGB image (height, width, 3) of the dye at positions (2, numParticles)
+    def render(self, positions: np.array) -> np.array:
+
+        self.canvas.restore_region(self.background)
+        for artist in self.artists:
+            artist.set_data(*positions)
+            self.ax.draw_artist(artist)
+
+        return np.asarray(self.canvas.buffer_rgba())[:, :, :3].copy()
+
+
+# Renders the dye at an iteration of the shared trajectory in a worker (reconstructed from the stored frames, see
+# trajectory.interpolateFrames), or at positions when given, saving it straight away when writing a PNG sequence
+def _renderSharedFrame(task):
+
+    framesSource, velocitiesSource, storeEvery, frameIndex, positions, pngPath = task
+
+    start = time.perf_counter()
+    if positions is not None:
+        image = _renderer.render(positions)
+
+    else:
+        frames, sharedMemory = attachFrames(*framesSource)
+        velocities, velocitiesMemory = (None, None) if velocitiesSource is None else attachFrames(*velocitiesSource)
+        try:
+            image = _renderer.render(interpolateFrames(frames, velocities, storeEvery, frameIndex))
+            del frames, velocities
+        finally:
+            if sharedMemory is not None:
+                sharedMemory.close()
+            if velocitiesMemory is not None:
+                velocitiesMemory.close()
+
+    if pngPath is not None:
+        Image.fromarray(image).save(pngPath)
+        image = None
+
+    return image, time.perf_counter() - start
+
+
+# Path of frame number frameNumber of a PNG sequence, path is a printf style pattern (frames/dye_%05d.png) or the
+# number is added before the extension
+def pngSequencePath(path: str, frameNumber: int) -> str:
+
+    if "%" in path:
+        return path % frameNumber
+
+    root, extension = os.path.splitext(path)
+    return f"{root}_{frameNumber:05d}{extension}"
+
+
+# Streams RGB frames into ffmpeg (from matplotlib's animation.ffmpeg_path setting)
+class _FFmpegWriter():
+
+    def __init__(self, path: str, fps: float, width: int, height: int):
+
+        command = [matplotlib.rcParams["animation.ffmpeg_path"], "-y", "-loglevel", "error",
+                   "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-r", str(fps), "-i", "-",
+                   # yuv420p (playable everywhere) needs an even width and height
+                   "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-pix_fmt", "yuv420p", path]
+
+        try:
+            self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+        except FileNotFoundError:
+            raise RuntimeError(
+                f"ffmpeg ({command[0]}) was not found, install it or set matplotlib.rcParams['animation.ffmpeg_path'], "
+                "or export a .gif or .png sequence instead") from None
+
+    def write(self, image: np.array):
+        self.process.stdin.write(image.tobytes())
+
+    def close(self):
+
+        _, errors = self.process.communicate()
+        if self.process.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed: {errors.decode(errors='replace').strip()}")
+
+
+# Collects frames (as 256 colour images, a third of the size of RGB) and saves them as a GIF with Pillow once all are
+# rendered (GIFs can't be written a frame at a time)
+class _GifWriter():
+
+    def __init__(self, path: str, fps: float):
+
+        self.path = path
+        self.fps = fps
+        self.images = []
+
+    def write(self, image: np.array):
+        self.images.append(Image.fromarray(image).quantize(method=Image.Quantize.MEDIANCUT))
+
+    def close(self):
+
+        if self.images:
+            self.images[0].save(self.path, save_all=True, append_images=self.images[1:],
+                                duration=1000 / self.fps, loop=0)
+
+
+# PNG sequence (frames rendered by workers are saved by the workers)
+class _PngWriter():
+
+    def __init__(self, path: str, frameNumbers):
+
+        self.path = path
+        self.frameNumbers = iter(frameNumbers)
+
+    def write(self, image: np.array):
+
+        frameNumber = next(self.frameNumbers)
+        if image is not None:
+            Image.fromarray(image).save(pngSequencePath(self.path, frameNumber))
+
+    def close(self):
+        pass
+
+
+def _makeWriter(path: str, fps: float, layout: dict, numFrames: int):
+
+    extension = os.path.splitext(path)[1].lower()
+    height, width = layout["background"].shape[:2]
+
+    if extension in videoExtensions:
+        return _FFmpegWriter(path, fps, width, height)
+    if extension == ".gif":
+        return _GifWriter(path, fps)
+    if extension == ".png":
+        return _PngWriter(path, range(numFrames))
+
+    raise ValueError(
+        f"Unknown animation type {extension}, choose from {', '.join(videoExtensions)}, .gif or .png (a sequence)")
+
+
+# Renders the frames frameIndices of the trajectory over the static layer and writes them to path as they are done
+# (a video through ffmpeg, a GIF or a PNG sequence). With more than one worker frames are rendered in a pool of
+# processes reading the trajectory from shared memory. Returns the time taken per frame
+def renderAnimation(particleData: ParticleData, layout: dict, frameIndices, path: str, fps: float,
+                    workers: int = 1) -> dict:
+
+    frameIndices = list(frameIndices)
+    isPngSequence = os.path.splitext(path)[1].lower() == ".png"
+
+    folder = os.path.dirname(pngSequencePath(path, 0) if isPngSequence else path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+
+    writer = _makeWriter(path, fps, layout, len(frameIndices))
+    renderSeconds = 0
+    writeSeconds = 0
+    start = time.perf_counter()
+
+    try:
+        if workers > 1:
+            for image, seconds in _renderInPool(particleData, layout, frameIndices, path, workers, isPngSequence):
+                renderSeconds += seconds
+
+                with phase("animation.write"):
+                    writeStart = time.perf_counter()
+                    writer.write(image)
+                    writeSeconds += time.perf_counter() - writeStart
+
+        else:
+            renderer = FrameRenderer(layout)
+            for frameIndex in frameIndices:
+
+                with phase("animation.render"):
+                    renderStart = time.perf_counter()
+                    image = renderer.render(particleData.positionsAtTime(frameIndex))
+                    renderSeconds += time.perf_counter() - renderStart
+
+                with phase("animation.write"):
+                    writeStart = time.perf_counter()
+                    writer.write(image)
+                    writeSeconds += time.perf_counter() - writeStart
+
+        with phase("animation.write"):
+            writeStart = time.perf_counter()
+            writer.close()
+            writeSeconds += time.perf_counter() - writeStart
+
+    except BaseException:
+        if isinstance(writer, _FFmpegWriter):
+            writer.process.kill()
+        raise
+
+    seconds = time.perf_counter() - start
+    numFrames = max(len(frameIndices), 1)
+    count("animationFrames", len(frameIndices))
+
+    # Rendering in the workers overlaps, so the wall time per frame is below the render time per frame
+    return {
+        "frames": len(frameIndices),
+        "seconds": seconds,
+        "secondsPerFrame": seconds / numFrames,
+        "renderSecondsPerFrame": renderSeconds / numFrames,
+        "writeSecondsPerFrame": writeSeconds / numFrames
+    }
+
+
+# (image, render seconds) of each frame in order, rendered by a pool of worker processes. Only a few frames per worker
+# are in flight at once so frames are never all held in memory
+def _renderInPool(particleData: ParticleData, layout: dict, frameIndices: list, path: str, workers: int,
+                  isPngSequence: bool):
+
+    # Workers read the frames from the trajectory in shared memory (or from its file on disk)
+    particleData.reserveIterations(0, shared=True)
+    trajectory = particleData.trajectory
+    frames = trajectory.frames
+    framesSource = (trajectory.sharedLocation, frames.shape, frames.dtype.str)
+
+    storeEvery = particleData.storeEvery
+    velocityStore = particleData.frameVelocities
+    velocitiesSource = None
+    if storeEvery > 1 and velocityStore is not None:
+        velocitiesSource = (velocityStore.sharedLocation, velocityStore.frames.shape, velocityStore.frames.dtype.str)
+
+    # Iterations after the last stored frame are only held by this process so are sent with the task (the workers
+    # count iterations from the first stored frame)
+    firstIteration = particleData.firstIteration
+    lastStored = firstIteration + (len(frames) - 1) * storeEvery
+
+    # Only plain arrays are sent to the workers, so they can also be spawned
+    pool, finalizer = workerPool(workers, initializer=_initRenderer, initargs=(layout,))
+
+    try:
+        pending = collections.deque()
+        for frameNumber, frameIndex in enumerate(frameIndices):
+
+            pngPath = pngSequencePath(path, frameNumber) if isPngSequence else None
+            positions = particleData.positionsAtTime(frameIndex) if frameIndex > lastStored else None
+            task = (framesSource, velocitiesSource, storeEvery, frameIndex - firstIteration, positions, pngPath)
+            pending.append(pool.apply_async(_renderSharedFrame, (task,)))
+
+            if len(pending) >= workers * _framesInFlightPerWorker:
+                yield pending.popleft().get()
+
+        while pending:
+            yield pending.popleft().get()
+
+    finally:
+        finalizer()
@@ -0,0 +1,181 @@
+import numpy as np
+
+
+# |a| only has a derivative of sign(a) for real a (it isn't complex differentiable), so complex values are refused and
+# the flow falls back to finite differences
+def _absoluteDerivative(a):
+
+    if np.iscomplexobj(a):
+        raise TypeError("np.absolute of a complex value can't be differentiated")
+
+    return np.sign(a)
+
+
+# Derivative of each supported single input ufunc in terms of its input a
+_unaryDerivatives = {
+    np.negative: lambda a: -np.ones_like(a),
+    np.positive: lambda a: np.ones_like(a),
+    np.exp: np.exp,
+    np.expm1: np.exp,
+    np.log: lambda a: 1 / a,
+    np.log2: lambda a: 1 / (a * np.log(2)),
+    np.log10: lambda a: 1 / (a * np.log(10)),
+    np.log1p: lambda a: 1 / (1 + a),
+    np.sqrt: lambda a: 0.5 / np.sqrt(a),
+    np.square: lambda a: 2 * a,
+    np.reciprocal: lambda a: -1 / a ** 2,
+    np.sin: np.cos,
+    np.cos: lambda a: -np.sin(a),
+    np.tan: lambda a: 1 / np.cos(a) ** 2,
+    np.arcsin: lambda a: 1 / np.sqrt(1 - a ** 2),
+    np.arccos: lambda a: -1 / np.sqrt(1 - a ** 2),
+    np.arctan: lambda a: 1 / (1 + a ** 2),
+    np.sinh: np.cosh,
+    np.cosh: np.sinh,
+    np.tanh: lambda a: 1 / np.cosh(a) ** 2,
+    np.arcsinh: lambda a: 1 / np.sqrt(a ** 2 + 1),
+    np.arccosh: lambda a: 1 / np.sqrt(a ** 2 - 1),
+    np.arctanh: lambda a: 1 / (1 - a ** 2),
+    np.absolute: _absoluteDerivative
+}
+
+# Ufuncs that are not differentiable (comparisons etc.), these act on the values only
+_valueOnlyUfuncs = {
+    np.greater, np.greater_equal, np.less, np.less_equal, np.equal, np.not_equal,
+    np.sign, np.floor, np.ceil, np.isfinite, np.isnan
+}
+
+
+# Multiply the gradient (leading axis is the derivative direction) by a factor broadcast over the values
+def _chain(grad, factor):
+
+    extraDims = np.ndim(factor) - (grad.ndim - 1)
+    if extraDims > 0:
+        grad = grad.reshape(grad.shape[:1] + (1,) * extraDims + grad.shape[1:])
+
+    return grad * factor
+
+
+# Forward mode automatic differentiation number, carries the value and its derivative in each direction
+class Dual():
+
+    def __init__(self, value, grad):
+        self.value = np.asarray(value)
+        self.grad = np.asarray(grad)
+
+    @property
+    def real(self):
+        return Dual(np.real(self.value), np.real(self.grad))
+
+    @property
+    def imag(self):
+        return Dual(np.imag(self.value), np.imag(self.grad))
+
+    def conjugate(self):
+        return Dual(np.conjugate(self.value), np.conjugate(self.grad))
+
+    # Arithmetic is routed through the ufuncs so numpy arrays and Duals mix freely
+    def __add__(self, other): return np.add(self, other)
+    def __radd__(self, other): return np.add(other, self)
+    def __sub__(self, other): return np.subtract(self, other)
+    def __rsub__(self, other): return np.subtract(other, self)
+    def __mul__(self, other): return np.multiply(self, other)
+    def __rmul__(self, other): return np.multiply(other, self)
+    def __truediv__(self, other): return np.true_divide(self, other)
+    def __rtruediv__(self, other): return np.true_divide(other, self)
+    def __pow__(self, other): return np.power(self, other)
+    def __rpow__(self, other): return np.power(other, self)
+    def __neg__(self): return np.negative(self)
+    def __pos__(self): return self
+    def __abs__(self): return np.absolute(self)
+
+    # Comparisons only look at the values
+    def __lt__(self, other): return np.less(self, other)
+    def __le__(self, other): return np.less_equal(self, other)
+    def __gt__(self, other): return np.greater(self, other)
+    def __ge__(self, other): return np.greater_equal(self, other)
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+
+        if method != "__call__" or "out" in kwargs:
+            return NotImplemented
+
+        values = [x.value if isinstance(x, Dual) else x for x in inputs]
+
+        if ufunc in _valueOnlyUfuncs:
+            return ufunc(*values)
+
+        if ufunc in _unaryDerivatives:
+            (a,) = values
+            return Dual(ufunc(a), _chain(inputs[0].grad, _unaryDerivatives[ufunc](a)))
+
+        a, b = values
+        da = inputs[0].grad if isinstance(inputs[0], Dual) else None
+        db = inputs[1].grad if isinstance(inputs[1], Dual) else None
+        value = ufunc(a, b)
+
+        # Partial derivatives with respect to the first and second input
+        if ufunc is np.add:
+            partials = (1, 1)
+        elif ufunc is np.subtract:
+            partials = (1, -1)
+        elif ufunc is np.multiply:
+            partials = (b, a)
+        elif ufunc is np.true_divide:
+            partials = (1 / b, - value / b)
+        elif ufunc is np.power:
+            partials = (b * a ** (b - 1),
+                        value * np.log(a) if db is not None else 0)
+        elif ufunc is np.arctan2:
+            partials = (b / (a ** 2 + b ** 2), - a / (a ** 2 + b ** 2))
+        elif ufunc is np.hypot:
+            partials = (a / value, b / value)
+        else:
+            raise TypeError(f"{ufunc.__name__} is not supported by automatic differentiation")
+
+        grad = 0
+        if da is not None:
+            grad = grad + _chain(da, partials[0])
+        if db is not None:
+            grad = grad + _chain(db, partials[1])
+
+        return Dual(value, grad)
+
+
+# Finds dW/dz of a holomorphic complex potential with a single evaluation
+def complexDerivative(complexPotential, z):
+
+    z = np.asarray(z, dtype=np.complex128)
+    w = complexPotential(Dual(z, np.ones((1,) + z.shape, dtype=np.complex128)))
+
+    # A potential that doesn't depend on z (or returns something else) has no derivative to give
+    if not isinstance(w, Dual):
+        if np.ndim(w) == 0:
+            return np.zeros(z.shape, dtype=np.complex128)
+        raise TypeError("Complex potential did not return a value that can be differentiated")
+
+    return np.broadcast_to(w.grad[0], z.shape)
+
+
+# Finds (d/dx, d/dy) of a real function of x, y with a single evaluation
+def gradient2D(func, x, y):
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    shape = np.broadcast_shapes(x.shape, y.shape)
+
+    seedX = np.zeros((2,) + shape)
+    seedX[0] = 1
+    seedY = np.zeros((2,) + shape)
+    seedY[1] = 1
+
+    f = func(Dual(np.broadcast_to(x, shape), seedX),
+             Dual(np.broadcast_to(y, shape), seedY))
+
+    if not isinstance(f, Dual):
+        if np.ndim(f) == 0:
+            return np.zeros(shape), np.zeros(shape)
+        raise TypeError("Function did not return a value that can be differentiated")
+
+    grad = np.broadcast_to(f.grad, (2,) + shape)
+    return grad[0], grad[1]
@@ -0,0 +1,88 @@
+import threading
+
+import numba
+
+
+# Keeps iterating the particles of a Visualizer in a daemon thread so that the interactive plot can be used while the
+# later frames are still being simulated. Frames are handed over through the (thread safe) trajectory
+class BackgroundSimulation():
+
+    # Iterations simulated between updates of the number of frames available
+    batchIterations = 1
+
+    def __init__(self, visualizer, numIter: int):
+
+        self.visualizer = visualizer
+        self.particleData = visualizer.particleData
+        self.targetFrames = self.particleData.numIterations + 1 + numIter
+
+        self.error = None
+        self._stopEvent = threading.Event()
+        self._progress = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name="FlowVisualizer simulation")
+
+    @property
+    def running(self):
+        return self._thread.is_alive()
+
+    # Number of iterations simulated so far (including the initial dye)
+    @property
+    def framesAvailable(self):
+        return self.particleData.numIterations + 1
+
+    def start(self):
+
+        # numba's threading layer has to be started from the main thread (tbb hangs at exit otherwise)
+        numba.get_num_threads()
+
+        self._thread.start()
+        return self
+
+    # Stop after the batch being simulated (frames already handed over are kept)
+    def stop(self):
+
+        self._stopEvent.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _run(self):
+
+        try:
+            while not self._stopEvent.is_set():
+
+                remaining = self.targetFrames - self.framesAvailable
+                if remaining <= 0:
+                    break
+
+                self.visualizer._iterate(min(self.batchIterations, remaining))
+
+                with self._progress:
+                    self._progress.notify_all()
+
+            # A trajectory on disk can be opened from the frames simulated
+            self.visualizer.particleData.flush()
+
+        except Exception as error:  # Raised again in the thread waiting for the frames
+            self.error = error
+
+        finally:
+            with self._progress:
+                self._progress.notify_all()
+
+    # Wait until numIter more frames have been simulated (used as ParticleData.simulator while running)
+    def waitForIterations(self, numIter: int):
+
+        targetFrames = self.framesAvailable + numIter
+
+        with self._progress:
+            self._progress.wait_for(lambda: self.framesAvailable >= min(targetFrames, self.targetFrames)
+                                    or not self.running)
+
+        if self.error is not None:
+            raise self.error
+
+        # Frames past the end of the background simulation (or after it was stopped) are simulated here
+        if not self.running and self.framesAvailable < targetFrames:
+            self.visualizer._iterate(targetFrames - self.framesAvailable)
+            self.visualizer.particleData.flush()
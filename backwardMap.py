@@ -0,0 +1,126 @@
+import numpy as np
+
+from structs import SimFlowFuncs, SimSetupData
+from iterator import advancePositions
+from parallel import workerPool, workerFlow, shardsPerWorker
+from instrumentation import phase, count
+
+
+# Velocity functions of SimFlowFuncs that return a single velocity array and those returning a pair of arrays
+_singleVelocityFuncs = ("vx", "vy", "vr", "vtheta", "v")
+_pairedVelocityFuncs = ("vxy", "vrtheta")
+
+
+def _negated(func):
+    return lambda *args: - func(*args)
+
+
+def _negatedPair(func):
+
+    def negatedPair(*args):
+        first, second = func(*args)
+        return - first, - second
+
+    return negatedPair
+
+
+# The flow with every velocity reversed, advecting through it for a time runs the flow backwards by that time
+def reversedFlow(flowData: SimFlowFuncs) -> SimFlowFuncs:
+
+    reversedFlowData = SimFlowFuncs()
+    for name in _singleVelocityFuncs:
+        if getattr(flowData, name):
+            setattr(reversedFlowData, name, _negated(getattr(flowData, name)))
+
+    for name in _pairedVelocityFuncs:
+        if getattr(flowData, name):
+            setattr(reversedFlowData, name, _negatedPair(getattr(flowData, name)))
+
+    return reversedFlowData
+
+
+# Advances positions numIter time steps
+def _advanceTile(positions: np.array, flowData: SimFlowFuncs, setupData: SimSetupData, numIter: int) -> np.array:
+
+    stepSizes = None
+    for _ in range(numIter):
+        positions, _, stepSizes = advancePositions(positions, flowData, setupData, stepSizes)
+
+    return positions
+
+
+def _advanceTileInWorker(task):
+
+    positions, numIter = task
+    return _advanceTile(positions, *workerFlow(), numIter)
+
+
+# Where the points at positions (2, numPoints) were numIter time steps earlier, found by advecting them through the
+# reversed flow with the same integrator and steps as the simulation. Points are independent, so with more than one
+# worker they are split into tiles advanced in a pool of processes
+def backAdvect(positions: np.array, flowData: SimFlowFuncs, setupData: SimSetupData, numIter: int,
+               workers: int = 1) -> np.array:
+
+    flow = reversedFlow(flowData)
+    tiles = [tile for tile in np.array_split(positions, max(workers, 1) * shardsPerWorker, axis=1)
+             if tile.shape[1] > 0]
+
+    with phase("backwardMap"):
+        if workers > 1 and len(tiles) > 1:
+            startPositions = np.concatenate(list(_advanceInPool(tiles, flow, setupData, numIter, workers)), axis=1)
+        else:
+            startPositions = np.concatenate([_advanceTile(tile, flow, setupData, numIter) for tile in tiles], axis=1)
+
+    count("backwardMapPoints", positions.shape[1])
+
+    return startPositions
+
+
+# Tiles advanced in order by a pool of worker processes (set up as for parallel.ParallelIterator)
+def _advanceInPool(tiles: list, flowData: SimFlowFuncs, setupData: SimSetupData, numIter: int, workers: int):
+
+    pool, finalizer = workerPool(min(workers, len(tiles)), flowData, setupData)
+
+    try:
+        yield from pool.imap(_advanceTileInWorker, [(tile, numIter) for tile in tiles])
+    finally:
+        finalizer()
+
+
+# Whether each point of positions (2, numPoints) is inside any of the dye regions (see ParticleData.dyeRegions)
+def insideDyeRegions(positions: np.array, dyeRegions: list) -> np.array:
+
+    x, y = positions
+    inside = np.zeros(x.shape, dtype=bool)
+
+    for region in dyeRegions:
+        if region[0] == "rectangle":
+            _, xMin, xMax, yMin, yMax = region
+            inside |= (x >= xMin) & (x <= xMax) & (y >= yMin) & (y <= yMax)
+
+        elif region[0] == "circle":
+            _, centerX, centerY, radius = region
+            inside |= (x - centerX) ** 2 + (y - centerY) ** 2 <= radius ** 2
+
+        else:
+            raise ValueError(f"Unknown dye region {region[0]}")
+
+    return inside
+
+
+# Image (rows from the bottom) of which pixel centres of extent (xMin, xMax, yMin, yMax) hold dye from dyeRegions after
+# numIter time steps. Every pixel is traced back to where it started, so the edges stay sharp however much the
+# regions are stretched, and the time taken is set by the resolution rather than the dye
+def dyeRegionImage(dyeRegions: list, flowData: SimFlowFuncs, setupData: SimSetupData, numIter: int, extent,
+                   shape, workers: int = 1) -> np.array:
+
+    xMin, xMax, yMin, yMax = extent
+    height, width = shape
+
+    xs = xMin + (np.arange(width) + 0.5) * ((xMax - xMin) / width)
+    ys = yMin + (np.arange(height) + 0.5) * ((yMax - yMin) / height)
+    xsMatrix, ysMatrix = np.meshgrid(xs, ys)
+
+    startPositions = backAdvect(np.array([xsMatrix.ravel(), ysMatrix.ravel()]), flowData, setupData, numIter, workers)
+
+    return insideDyeRegions(startPositions, dyeRegions).reshape(shape)
@@ -0,0 +1,188 @@
+import os
+import sys
+
+# The shared flow cases are next to this file
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flowCases import flowCases, makeFlow, makeParticleData  # noqa: E402
+import matplotlib.pyplot as plt  # noqa: E402
+from structs import PlottingData, SimSetupData  # noqa: E402
+from plotter import Plotting  # noqa: E402
+from animationExport import FrameRenderer  # noqa: E402
+from backwardMap import dyeRegionImage  # noqa: E402
+
+
+# Plot settings used by every benchmark (nothing is shown or saved, flow maps are recomputed unless cached is set)
+def _plottingData(flowMapResolution: int, cached: bool = False) -> PlottingData:
+
+    plottingData = PlottingData()
+    plottingData.showFigure = False
+    plottingData.saveFigure = False
+    plottingData.flowMapResolution = flowMapResolution
+    plottingData.cacheFlowMaps = cached
+    plottingData.cacheFlowMapsOnDisk = False
+
+    return plottingData
+
+
+# Sampling the flow on the streamline grid (asv style, time_ and peakmem_ methods)
+class FlowMapSuite():
+
+    params = (list(flowCases), [100, 300, 1000])
+    param_names = ["flowType", "flowMapResolution"]
+    timeout = 600
+
+    def setup(self, flowType, flowMapResolution):
+        self.plotter = Plotting(makeFlow(flowType).getSimFlowFunc(),
+                                makeParticleData(10), _plottingData(flowMapResolution))
+
+    def time_getFlowMap(self, flowType, flowMapResolution):
+        self.plotter._getFlowMap()
+
+    def peakmem_getFlowMap(self, flowType, flowMapResolution):
+        self.plotter._getFlowMap()
+
+
+# Finding and drawing the streamlines with each method (contour is only possible for flows with a stream function)
+class StreamlineSuite():
+
+    params = (list(flowCases), ["streamplot", "contour", "trace"])
+    param_names = ["flowType", "streamlineMethod"]
+    timeout = 600
+
+    def setup(self, flowType, streamlineMethod):
+
+        plottingData = _plottingData(300)
+        plottingData.streamlineMethod = streamlineMethod
+        self.plotter = Plotting(makeFlow(flowType).getSimFlowFunc(), makeParticleData(10), plottingData)
+
+        if streamlineMethod == "contour" and self.plotter.flowData.psi is None:
+            raise NotImplementedError("No stream function for this flow")
+
+        # The flow map is the same for every method so isn't timed
+        self.plotter._getFlowMap()
+        self.plotter.plottingData.cacheFlowMaps = True
+        self.plotter.plottingData.cacheFlowMapsOnDisk = False
+
+    def teardown(self, flowType, streamlineMethod):
+        plt.close("all")
+
+    def time_plotStreamlines(self, flowType, streamlineMethod):
+
+        fig, ax = plt.subplots()
+        self.plotter._integrateStreamlines(ax, 2, streamlineMethod)
+        fig.canvas.draw()
+
+
+# Drawing the static and interactive plots with the Agg backend
+class PlotSuite():
+
+    params = ([1000, 100000], [100, 300])
+    param_names = ["numParticles", "flowMapResolution"]
+    timeout = 600
+
+    def setup(self, numParticles, flowMapResolution):
+
+        particleData = makeParticleData(numParticles)
+        particleData.appendPositions(particleData.positions[0] * 0.9)
+
+        self.plotter = Plotting(makeFlow("complexPotential").getSimFlowFunc(),
+                                particleData, _plottingData(flowMapResolution))
+
+    def teardown(self, numParticles, flowMapResolution):
+        plt.close("all")
+
+    def time_plotParticles(self, numParticles, flowMapResolution):
+        self.plotter.plotParticles()
+        plt.gcf().canvas.draw()
+
+    def time_plotInteractiveParticles(self, numParticles, flowMapResolution):
+        self.plotter.plotInteractiveParticles(args={"interactive": True, "timeStep": 0.05})
+        plt.gcf().canvas.draw()
+
+    def peakmem_plotParticles(self, numParticles, flowMapResolution):
+        self.plotter.plotParticles()
+        plt.gcf().canvas.draw()
+
+
+# Drawing one animation frame over the static layer (as done for each frame of Plotting.exportAnimation)
+class AnimationFrameSuite():
+
+    params = [1000, 100000, 1000000]
+    param_names = ["numParticles"]
+    timeout = 600
+
+    def setup(self, numParticles):
+
+        particleData = makeParticleData(numParticles)
+        plottingData = _plottingData(300)
+        plottingData.plotInitPoints = False
+
+        plotter = Plotting(makeFlow("complexPotential").getSimFlowFunc(), particleData, plottingData)
+        self.renderer = FrameRenderer(plotter._animationLayout())
+        self.positions = particleData.positions[0]
+
+    def time_renderFrame(self, numParticles):
+        self.renderer.render(self.positions)
+
+
+# Re-drawing a plot whose streamlines are in the (memory) flow map cache
+class CachedPlotSuite(PlotSuite):
+
+    def setup(self, numParticles, flowMapResolution):
+
+        particleData = makeParticleData(numParticles)
+        particleData.appendPositions(particleData.positions[0] * 0.9)
+
+        self.plotter = Plotting(makeFlow("complexPotential").getSimFlowFunc(),
+                                particleData, _plottingData(flowMapResolution, cached=True))
+
+        # Fills the cache
+        self.plotter.plotParticles()
+        plt.close("all")
+
+
+# Drawing the dye as markers or as a density image (see densityRaster.py), with the streamlines cached so only the dye
+# is timed
+class DyeRenderingSuite():
+
+    params = ([100000, 1000000], ["vector", "raster"])
+    param_names = ["numParticles", "dyeRendering"]
+    timeout = 600
+
+    def setup(self, numParticles, dyeRendering):
+
+        particleData = makeParticleData(numParticles)
+        particleData.appendPositions(particleData.positions[0] * 0.9)
+
+        plottingData = _plottingData(300, cached=True)
+        plottingData.dyeRendering = dyeRendering
+
+        self.plotter = Plotting(makeFlow("complexPotential").getSimFlowFunc(), particleData, plottingData)
+
+        # Fills the cache
+        self.plotter.plotParticles()
+        plt.close("all")
+
+    def teardown(self, numParticles, dyeRendering):
+        plt.close("all")
+
+    def time_plotParticles(self, numParticles, dyeRendering):
+        self.plotter.plotParticles()
+        plt.gcf().canvas.draw()
+
+
+# Tracing every pixel of the dye region image back through 10 time steps (see backwardMap.py)
+class DyeRegionSuite():
+
+    params = (list(flowCases), [100, 200])
+    param_names = ["flowType", "resolution"]
+    timeout = 600
+
+    def setup(self, flowType, resolution):
+        self.flowData = makeFlow(flowType).getSimFlowFunc()
+        self.setupData = SimSetupData(timeStep=0.05)
+
+    def time_dyeRegionImage(self, flowType, resolution):
+        dyeRegionImage([("circle", 0, 0, 1)], self.flowData, self.setupData, 10, (-2, 2, -2, 2),
+                       (resolution, resolution))
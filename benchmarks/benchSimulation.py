@@ -0,0 +1,233 @@
+import os
+import shutil
+import sys
+import tempfile
+import tracemalloc
+
+# The shared flow cases are next to this file
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flowCases import flowCases, makeFlow, makeParticleData  # noqa: E402
+import numpy as np  # noqa: E402
+from structs import SimSetupData, ParticleData  # noqa: E402
+from iterator import iterateParticles  # noqa: E402
+from checkpoint import writeCheckpoint  # noqa: E402
+
+
+# One iteration of the particles for each way of specifying the flow (asv style, time_, peakmem_ and track_ methods)
+class IterateSuite():
+
+    params = ([1000, 10000, 100000, 1000000], list(flowCases), [8, 32])
+    param_names = ["numParticles", "flowType", "subtimeSteps"]
+    timeout = 600
+
+    def setup(self, numParticles, flowType, subtimeSteps):
+
+        self.flowData = makeFlow(flowType).getSimFlowFunc()
+        self.particleData = makeParticleData(numParticles)
+        self.setupData = SimSetupData(timeStep=0.05, subtimeSteps=subtimeSteps)
+
+        # Compiled kernels (elements) are compiled before timing
+        iterateParticles(makeParticleData(10), self.flowData, self.setupData)
+
+    def time_iterate(self, numParticles, flowType, subtimeSteps):
+        iterateParticles(self.particleData, self.flowData, self.setupData)
+
+    def peakmem_iterate(self, numParticles, flowType, subtimeSteps):
+        iterateParticles(self.particleData, self.flowData, self.setupData)
+
+    # Peak memory allocated by the iteration (on top of the stored positions)
+    def track_iterateAllocated(self, numParticles, flowType, subtimeSteps):
+
+        tracemalloc.start()
+        iterateParticles(self.particleData, self.flowData, self.setupData)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        return peak
+
+    track_iterateAllocated.unit = "bytes"
+
+
+# The integrators on the same flow (rk4 uses the substeps, dopri5 adapts)
+class IntegratorSuite():
+
+    params = ([10000, 100000], ["euler", "rk4", "dopri5"])
+    param_names = ["numParticles", "integrator"]
+    timeout = 600
+
+    def setup(self, numParticles, integrator):
+
+        self.flowData = makeFlow("complexPotential").getSimFlowFunc()
+        self.particleData = makeParticleData(numParticles)
+        self.setupData = SimSetupData(timeStep=0.05, integrator=integrator)
+
+    def time_iterate(self, numParticles, integrator):
+        iterateParticles(self.particleData, self.flowData, self.setupData)
+
+
+# The same iterations simulated and stored in float64 and float32 (see SimSetupData.precision), with how far the float32
+# positions end up from the float64 ones
+class PrecisionSuite():
+
+    params = ([10000, 100000], ["float64", "float32"])
+    param_names = ["numParticles", "precision"]
+    timeout = 600
+
+    def setup(self, numParticles, precision):
+
+        self.flowData = makeFlow("complexPotential").getSimFlowFunc()
+        self.particleData = makeParticleData(numParticles)
+        self.particleData.setDtype(precision)
+        self.setupData = SimSetupData(timeStep=0.05, precision=precision)
+
+    def time_iterate(self, numParticles, precision):
+        iterateParticles(self.particleData, self.flowData, self.setupData)
+
+    # Memory of each stored frame
+    def track_frameBytes(self, numParticles, precision):
+        return self.particleData.positions[0].nbytes
+
+    track_frameBytes.unit = "bytes"
+
+    # Largest distance from the float64 positions after 10 iterations (as a fraction of the 4 wide plot)
+    def track_deviation(self, numParticles, precision):
+
+        reference = makeParticleData(numParticles)
+        referenceSetupData = SimSetupData(timeStep=0.05)
+        for _ in range(10):
+            iterateParticles(reference, self.flowData, referenceSetupData)
+            iterateParticles(self.particleData, self.flowData, self.setupData)
+
+        deviation = np.hypot(*(reference.positions[-1] - self.particleData.positions[-1])) / 4
+        return float(np.nanmax(deviation))
+
+
+# Iterations simulated storing every storeEvery-th frame (see SimSetupData.storeEvery), with the memory stored and how
+# far the positions rebuilt in between end up from a run storing every frame
+class StoreEverySuite():
+
+    params = ([10000, 100000], [1, 5, 10])
+    param_names = ["numParticles", "storeEvery"]
+    timeout = 600
+
+    def setup(self, numParticles, storeEvery):
+
+        self.flowData = makeFlow("complexPotential").getSimFlowFunc()
+        self.particleData = makeParticleData(numParticles)
+        self.particleData.setStoreEvery(storeEvery)
+        self.setupData = SimSetupData(timeStep=0.05, storeEvery=storeEvery)
+
+    def time_iterate(self, numParticles, storeEvery):
+        iterateParticles(self.particleData, self.flowData, self.setupData)
+
+    # Memory of the frames and frame velocities stored over 20 iterations
+    def track_storedBytes(self, numParticles, storeEvery):
+
+        for _ in range(20):
+            iterateParticles(self.particleData, self.flowData, self.setupData)
+
+        storedBytes = self.particleData.positions.nbytes
+        if self.particleData.frameVelocities is not None:
+            storedBytes += self.particleData.frameVelocities.frames.nbytes
+        return storedBytes
+
+    track_storedBytes.unit = "bytes"
+
+    # Root mean square distance of the rebuilt positions from the simulated ones over 20 iterations (as a fraction of
+    # the 4 wide plot). The largest distance isn't tracked as it comes from the few particles dropped next to a vortex
+    def track_deviation(self, numParticles, storeEvery):
+
+        reference = makeParticleData(numParticles)
+        referenceSetupData = SimSetupData(timeStep=0.05)
+        for _ in range(20):
+            iterateParticles(reference, self.flowData, referenceSetupData)
+            iterateParticles(self.particleData, self.flowData, self.setupData)
+
+        deviation = np.array([np.hypot(*(reference.positions[i] - self.particleData.positionsAtTime(i)))
+                              for i in range(21)]) / 4
+        return float(np.sqrt(np.nanmean(deviation ** 2)))
+
+
+# Iterations streamed into the trajectory in memory and on disk (see trajectory.DiskTrajectory), and reading frames back
+# from a store opened from disk
+class TrajectoryStoreSuite():
+
+    params = ([10000, 100000], ["memory", "disk"])
+    param_names = ["numParticles", "store"]
+    timeout = 600
+
+    def setup(self, numParticles, store):
+
+        self.flowData = makeFlow("complexPotential").getSimFlowFunc()
+        self.particleData = makeParticleData(numParticles)
+        self.setupData = SimSetupData(timeStep=0.05, subtimeSteps=8)
+
+        self.folder = tempfile.mkdtemp()
+        if store == "disk":
+            self.particleData.storeTrajectoryOnDisk(os.path.join(self.folder, "trajectory"))
+
+    def teardown(self, numParticles, store):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def time_iterate(self, numParticles, store):
+        iterateParticles(self.particleData, self.flowData, self.setupData)
+
+
+# Opening a trajectory of 10 iterations stored on disk and reading a frame between two iterations
+class TrajectoryOpenSuite():
+
+    params = [10000, 100000, 1000000]
+    param_names = ["numParticles"]
+    timeout = 600
+
+    def setup(self, numParticles):
+
+        self.folder = tempfile.mkdtemp()
+        particleData = makeParticleData(numParticles)
+        particleData.storeTrajectoryOnDisk(os.path.join(self.folder, "trajectory"))
+        for _ in range(10):
+            particleData.appendPositions(particleData.positions[-1] * 0.99)
+        particleData.flush()
+
+    def teardown(self, numParticles):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def time_openAndReadFrame(self, numParticles):
+        ParticleData.open(os.path.join(self.folder, "trajectory")).positionsAtTime(4.5)
+
+
+# Writing a checkpoint of the latest frame (see checkpoint.py)
+class CheckpointSuite():
+
+    params = [10000, 100000, 1000000]
+    param_names = ["numParticles"]
+    timeout = 600
+
+    def setup(self, numParticles):
+
+        self.flowData = makeFlow("complexPotential").getSimFlowFunc()
+        self.particleData = makeParticleData(numParticles)
+        self.setupData = SimSetupData(timeStep=0.05)
+        self.folder = tempfile.mkdtemp()
+
+    def teardown(self, numParticles):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def time_writeCheckpoint(self, numParticles):
+        writeCheckpoint(os.path.join(self.folder, "checkpoint.npz"), self.particleData, self.setupData,
+                        self.flowData)
+
+
+# Building the simulation flow functions, with and without compiling them into one kernel
+class FlowSetupSuite():
+
+    params = (list(flowCases), [False, True])
+    param_names = ["flowType", "jit"]
+    timeout = 600
+
+    def setup(self, flowType, jit):
+        self.flow = makeFlow(flowType)
+
+    def time_getSimFlowFunc(self, flowType, jit):
+        self.flow.getSimFlowFunc(jit=jit)
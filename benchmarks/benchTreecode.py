@@ -0,0 +1,66 @@
+import os
+import sys
+
+import numpy as np
+
+# Benchmarks are run from a checkout so the modules are imported from the folder above
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flowElements import FlowElements  # noqa: E402
+from treecode import ElementTree  # noqa: E402
+
+
+# Random vortices, sources and doublets inside [-2, 2]^2
+def _randomElements(numElements: int, seed: int = 0) -> FlowElements:
+
+    rng = np.random.default_rng(seed)
+    elements = FlowElements()
+
+    elements.add(rng.uniform(-2, 2, (numElements // 2, 2)),
+                 - 1j * rng.normal(size=numElements // 2) / (2 * np.pi), 1)
+    elements.add(rng.uniform(-2, 2, (numElements // 4, 2)),
+                 rng.normal(size=numElements // 4) / (2 * np.pi), 1)
+    elements.add(rng.uniform(-2, 2, (numElements - 3 * (numElements // 4), 2)),
+                 rng.normal(size=numElements - 3 * (numElements // 4)) / (2 * np.pi), 2)
+
+    return elements
+
+
+# Tree summation against direct summation (asv style, time_ and track_ methods)
+class TreecodeSuite():
+
+    params = ([1000, 10000, 100000], [(0.7, 8), (0.5, 12), (0.3, 16)])
+    param_names = ["numElements", "thetaOrder"]
+
+    numParticles = 20000
+
+    def setup(self, numElements, thetaOrder):
+
+        rng = np.random.default_rng(1)
+        self.xs, self.ys = rng.uniform(-2.5, 2.5, (2, self.numParticles))
+
+        self.elements = _randomElements(numElements)
+        self.tree = ElementTree(self.elements.parameters, thetaOrder[1])
+        self.theta = thetaOrder[0]
+
+        # Warm up the compiled kernels
+        self.tree.velocities(self.xs[:10], self.ys[:10], self.theta)
+        self.elements.velocities(self.xs[:10], self.ys[:10])
+
+    def time_direct(self, numElements, thetaOrder):
+        self.elements.velocities(self.xs, self.ys)
+
+    def time_tree(self, numElements, thetaOrder):
+        self.tree.velocities(self.xs, self.ys, self.theta)
+
+    def time_treeBuild(self, numElements, thetaOrder):
+        ElementTree(self.elements.parameters, thetaOrder[1])
+
+    # Error of the tree summation relative to the RMS speed of the direct summation
+    def track_relativeError(self, numElements, thetaOrder):
+
+        directVx, directVy = self.elements.velocities(self.xs, self.ys)
+        treeVx, treeVy = self.tree.velocities(self.xs, self.ys, self.theta)
+
+        rmsSpeed = np.sqrt(np.mean(directVx ** 2 + directVy ** 2))
+        return np.max(np.hypot(treeVx - directVx, treeVy - directVy)) / rmsSpeed
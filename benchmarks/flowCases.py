@@ -0,0 +1,68 @@
+import os
+import sys
+
+import numpy as np
+
+# Benchmarks are run from a checkout so the modules are imported from the folder above
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Plots are drawn without a window
+import matplotlib  # noqa: E402
+matplotlib.use("Agg")
+
+from useCustomFlow import Flow  # noqa: E402
+from structs import ParticleData  # noqa: E402
+
+
+# Flows covering each way a flow can be specified (the same shape of flow where possible)
+def _cartesianFlow(flow):
+    flow.cartesianFlow(lambda x, y: - y / (x ** 2 + y ** 2 + 0.1), lambda x, y: x / (x ** 2 + y ** 2 + 0.1))
+    flow.cartesianFlow(lambda x, y: 0.2 + 0 * x, lambda x, y: 0 * y, (0.5, 0.5))
+
+
+def _polarFlow(flow):
+    flow.polarFlow(lambda r, theta: 0 * r, lambda r, theta: 1 / (r ** 2 + 0.1))
+    flow.polarFlow(lambda r, theta: 0.1 / r, lambda r, theta: 0 * r, (0.5, 0.5))
+
+
+def _streamFunctionFlow(flow):
+    flow.streamFunctionFlow(lambda x, y: - 0.5 * np.log(x ** 2 + y ** 2 + 0.1))
+    flow.streamFunctionFlow(lambda x, y: 0.2 * y, (0.5, 0.5))
+
+
+def _complexPotentialFlow(flow):
+    flow.complexPotentialFlow(lambda z: - np.log(z) / 1j, functionOffset=(-1, 0))
+    flow.complexPotentialFlow(lambda z: np.log(z) / 1j, functionOffset=(1, 0))
+
+
+def _elementsFlow(flow):
+    rng = np.random.default_rng(0)
+    flow.vortices(rng.uniform(-2, 2, (2000, 2)), rng.normal(size=2000), coreRadii=0.05)
+    flow.uniformStream((0.2, 0))
+
+
+flowCases = {
+    "cartesian": _cartesianFlow,
+    "polar": _polarFlow,
+    "streamFunction": _streamFunctionFlow,
+    "complexPotential": _complexPotentialFlow,
+    "elements": _elementsFlow
+}
+
+
+def makeFlow(flowType: str) -> Flow:
+
+    flow = Flow()
+    flowCases[flowType](flow)
+
+    return flow
+
+
+# Particles spread uniformly over the default plot area
+def makeParticleData(numParticles: int, seed: int = 0) -> ParticleData:
+
+    rng = np.random.default_rng(seed)
+    particleData = ParticleData()
+    particleData.positions = rng.uniform(-2, 2, (1, 2, numParticles))
+
+    return particleData
@@ -0,0 +1,141 @@
+from dataclasses import asdict
+import json
+import os
+
+import numpy as np
+
+from structs import ParticleData, SimSetupData, SimFlowFuncs
+from integrators import subtimeStepCount
+
+
+# Changed whenever what is stored in a checkpoint changes (older checkpoints are then refused)
+_formatVersion = 2
+
+# Settings of SimSetupData that change the trajectory, a run is only resumed with the same ones (the rest, such as the
+# number of workers, can change between runs)
+trajectorySettings = ("timeStep", "subtimeSteps", "integrator", "relativeTolerance", "absoluteTolerance",
+                      "minSubtimeStep", "precision", "storeEvery", "sampledField", "sampledFieldResolution",
+                      "sampledFieldInterpolation", "sampledFieldTolerance")
+
+
+# Fingerprint of the flow as it was given, rather than of the field sampled from it (which is sampled again from the
+# same settings when resuming)
+def _flowFingerprint(flowData: SimFlowFuncs) -> str:
+
+    if flowData.sampledField is not None:
+        return flowData.sampledField.flowData.fingerprint
+
+    return flowData.fingerprint
+
+
+# The settings of setupData as stored in a checkpoint, with the number of substeps the integrator actually takes (so a
+# run set to the default matches one set to the same number explicitly)
+def _setupSettings(setupData: SimSetupData) -> dict:
+
+    setup = asdict(setupData)
+    setup["subtimeSteps"] = subtimeStepCount(setupData)
+    return setup
+
+
+# Writes the state needed to carry on simulating from the latest frame to path (an .npz file): the latest positions,
+# velocities and adaptive step sizes, the iteration reached, the setup and the fingerprint of the flow. Stored
+# trajectories are flushed to disk first, so the checkpoint never refers to frames that aren't there
+def writeCheckpoint(path: str, particleData: ParticleData, setupData: SimSetupData, flowData: SimFlowFuncs):
+
+    particleData.flush()
+
+    metadata = {
+        "formatVersion": _formatVersion,
+        "iteration": particleData.numIterations,
+        "setup": _setupSettings(setupData),
+        "fingerprint": _flowFingerprint(flowData),
+        "trajectoryPath": None if particleData.trajectoryPath is None else os.path.abspath(particleData.trajectoryPath),
+        "shapeOffsets": [int(offset) for offset in particleData.shapeOffsets],
+        "dyeRegions": [[region[0]] + [float(value) for value in region[1:]] for region in particleData.dyeRegions]
+    }
+
+    arrays = {
+        "positions": particleData.latestPositions,
+        "velocities": particleData.velocities,
+        "masses": particleData.masses,
+        "metadata": np.array(json.dumps(metadata))
+    }
+    if particleData.stepSizes is not None:
+        arrays["stepSizes"] = particleData.stepSizes
+
+    # Written under a temporary name first so a crash while writing leaves the previous checkpoint in place
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+
+    temporaryPath = f"{path}.{os.getpid()}.tmp"
+    with open(temporaryPath, "wb") as file:
+        np.savez(file, **arrays)
+    os.replace(temporaryPath, path)
+
+
+# The checkpoint at path as a dict of its metadata and arrays
+def readCheckpoint(path: str) -> dict:
+
+    with np.load(path, allow_pickle=False) as file:
+        checkpoint = json.loads(str(file["metadata"]))
+        for name in file.files:
+            if name != "metadata":
+                checkpoint[name] = file[name]
+
+    if checkpoint["formatVersion"] != _formatVersion:
+        raise ValueError(f"The checkpoint {path} was written by another version and can't be resumed")
+
+    return checkpoint
+
+
+# Particles to carry on simulating from the checkpoint at path with flowData and setupData. A ValueError is raised
+# (rather than silently simulating something else) if the flow's fingerprint doesn't match the flow checkpointed, or
+# a setting that changes the trajectory differs. A flow without a fingerprint (see flowCompiler.flowFingerprint) can't
+# be matched so is only resumed with force. The checkpointed trajectory stored on disk is continued (frames after the
+# checkpoint are dropped), otherwise the trajectory starts again from the checkpointed positions and iteration
+def resumeParticleData(path: str, flowData: SimFlowFuncs, setupData: SimSetupData, force: bool = False) -> ParticleData:
+
+    checkpoint = readCheckpoint(path)
+
+    fingerprint = _flowFingerprint(flowData)
+    if not force:
+        if fingerprint is None or checkpoint["fingerprint"] is None:
+            raise ValueError(f"The flow can't be matched to the flow of the checkpoint {path} as it has no fingerprint "
+                             "(it reads values that can't be hashed), resume with force=True if it is the same flow")
+        if fingerprint != checkpoint["fingerprint"]:
+            raise ValueError(f"The flow doesn't match the flow of the checkpoint {path} (the fingerprints differ)")
+
+    setup = _setupSettings(setupData)
+    changed = [name for name in trajectorySettings if setup[name] != checkpoint["setup"][name]]
+    if changed:
+        raise ValueError(f"The setup doesn't match the setup of the checkpoint {path} ({', '.join(changed)} changed)")
+
+    trajectoryPath = checkpoint["trajectoryPath"]
+    if trajectoryPath is not None:
+
+        # Carrying on without the frames before the checkpoint would silently lose them
+        if not os.path.exists(os.path.join(trajectoryPath, "index.json")):
+            raise FileNotFoundError(f"The trajectory {trajectoryPath} of the checkpoint {path} can't be found")
+
+        # The store has to reach the last stored frame at or before the checkpoint
+        particleData = ParticleData.open(trajectoryPath, writable=True)
+        iteration = checkpoint["iteration"]
+        if particleData.numIterations < iteration - (iteration - particleData.firstIteration) % particleData.storeEvery:
+            raise ValueError(f"The trajectory at {trajectoryPath} ends before the checkpoint {path}")
+
+        particleData.truncateIterations(checkpoint["iteration"], checkpoint["positions"])
+
+    else:
+        particleData = ParticleData(dtype=checkpoint["positions"].dtype)
+        particleData.positions = checkpoint["positions"][None]
+        particleData.setStoreEvery(setupData.storeEvery)
+        particleData.firstIteration = checkpoint["iteration"]
+
+    particleData.shapeOffsets = np.array(checkpoint["shapeOffsets"], dtype=np.int64)
+    particleData.dyeRegions = [tuple(region) for region in checkpoint["dyeRegions"]]
+    particleData.velocities = checkpoint["velocities"]
+    particleData.masses = checkpoint["masses"]
+    particleData.stepSizes = checkpoint.get("stepSizes")
+
+    return particleData
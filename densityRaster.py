@@ -0,0 +1,198 @@
+from matplotlib.colors import to_rgba
+from numba import njit
+import numpy as np
+
+
+# Pixel coordinates (pixel i covering [i, i + 1)) of points in extent (xMin, xMax, yMin, yMax) on an image of shape
+# (height, width), rows counted from the bottom (for imshow with origin="lower")
+def _pixelCoordinates(positions: np.array, extent, shape):
+
+    xMin, xMax, yMin, yMax = extent
+    height, width = shape
+
+    return (np.ascontiguousarray((positions[0] - xMin) * (width / (xMax - xMin)), dtype=np.float64),
+            np.ascontiguousarray((positions[1] - yMin) * (height / (yMax - yMin)), dtype=np.float64))
+
+
+# Adds a point at pixel coordinates (x, y) to counts, antialiased points are split between the four pixels with the
+# nearest centres (bilinear splatting) instead of all going into the pixel they are in
+@njit(cache=True, inline="always")
+def _splatPoint(counts, x, y, antialias):
+
+    height, width = counts.shape
+
+    # Also skips nan (and points too far out to convert to pixel indices)
+    if not (x > -1 and x < width + 1 and y > -1 and y < height + 1):
+        return
+
+    if not antialias:
+        i = int(np.floor(x))
+        j = int(np.floor(y))
+        if i >= 0 and i < width and j >= 0 and j < height:
+            counts[j, i] += 1
+        return
+
+    x -= 0.5
+    y -= 0.5
+    i0 = int(np.floor(x))
+    j0 = int(np.floor(y))
+    fx = x - i0
+    fy = y - j0
+
+    for dj in range(2):
+        j = j0 + dj
+        if j < 0 or j >= height:
+            continue
+        wy = fy if dj == 1 else 1 - fy
+
+        for di in range(2):
+            i = i0 + di
+            if i >= 0 and i < width:
+                counts[j, i] += (fx if di == 1 else 1 - fx) * wy
+
+
+@njit(cache=True)
+def _splatPoints(counts, px, py, antialias):
+
+    for k in range(len(px)):
+        _splatPoint(counts, px[k], py[k], antialias)
+
+
+# Adds samples along the segments from each point to the next (where connected) to counts, one per pixel the part of
+# the segment inside the image crosses. The end of a segment is the start of the next so is only added at the end of a
+# shape
+@njit(cache=True)
+def _splatLines(counts, px, py, connected, antialias):
+
+    height, width = counts.shape
+
+    for k in range(len(connected)):
+        if not connected[k]:
+            continue
+
+        x0 = px[k]
+        y0 = py[k]
+        dx = px[k + 1] - x0
+        dy = py[k + 1] - y0
+        if not (np.isfinite(x0) and np.isfinite(y0) and np.isfinite(dx) and np.isfinite(dy)):
+            continue
+
+        # Clip to the image, the part inside is x0 + t dx for t0 <= t <= t1
+        t0 = 0.0
+        t1 = 1.0
+        for origin, delta, size in ((x0, dx, width), (y0, dy, height)):
+            if delta == 0:
+                if origin < 0 or origin > size:
+                    t1 = -1.0
+            else:
+                enter = - origin / delta
+                leave = (size - origin) / delta
+                t0 = max(t0, min(enter, leave))
+                t1 = min(t1, max(enter, leave))
+        if t1 < t0:
+            continue
+
+        steps = max(int(np.ceil(max(abs(dx), abs(dy)) * (t1 - t0))), 1)
+        shapeEnd = k + 1 == len(connected) or not connected[k + 1]
+        for step in range(steps + 1 if shapeEnd or t1 < 1 else steps):
+            t = t0 + (t1 - t0) * step / steps
+            _splatPoint(counts, x0 + t * dx, y0 + t * dy, antialias)
+
+
+# Particles per pixel of an image of shape (height, width) covering extent
+def densityImage(positions: np.array, extent, shape, antialias: bool = True) -> np.array:
+
+    px, py = _pixelCoordinates(positions, extent, shape)
+    counts = np.zeros(shape, dtype=np.float32)
+    _splatPoints(counts, px, py, antialias)
+
+    return counts
+
+
+# Fraction of each pixel covered by the dye lines joining neighbouring particles of each shape (shapes start at the
+# particle indices shapeStarts). Segments are sampled once per pixel they cross, so the time taken grows with the
+# number of particles and the length of the lines in pixels, not with the number of particles in a pixel
+def lineCoverageImage(positions: np.array, shapeStarts, extent, shape, antialias: bool = True) -> np.array:
+
+    px, py = _pixelCoordinates(positions, extent, shape)
+
+    # Every particle is joined to the next, other than the end of one shape to the start of the next
+    connected = np.ones(max(len(px) - 1, 0), dtype=np.bool_)
+    shapeEnds = np.asarray(shapeStarts, dtype=np.int64) - 1
+    connected[shapeEnds[(shapeEnds >= 0) & (shapeEnds < len(connected))]] = False
+
+    counts = np.zeros(shape, dtype=np.float32)
+    _splatLines(counts, px, py, connected, antialias)
+
+    return np.minimum(counts, 1, out=counts)
+
+
+# Coverage of squares of size pixels centred on each pixel (taking the largest coverage where squares overlap), found
+# along each axis in turn
+def _widen(coverage: np.array, size: int) -> np.array:
+
+    for axis in (0, 1):
+        widened = coverage.copy()
+        source = np.moveaxis(coverage, axis, 0)
+        target = np.moveaxis(widened, axis, 0)
+
+        for offset in range(- ((size - 1) // 2), size // 2 + 1):
+            if offset > 0:
+                np.maximum(target[offset:], source[:- offset], out=target[offset:])
+            elif offset < 0:
+                np.maximum(target[:offset], source[- offset:], out=target[:offset])
+
+        coverage = widened
+
+    return coverage
+
+
+# RGBA image (height, width, 4) of dye layers drawn in order, one over the other. Each layer is (positions, color,
+# isLine): lines are drawn solid where they cover a pixel, points with an opacity that builds up with the particles in
+# a pixel (a single particle in a pixel is opaque without antialiasing). Lines and points are widened to lineWidth and
+# markerSize pixels
+def dyeImage(layers: list, shapeStarts, extent, shape, antialias: bool = True, lineWidth: int = 1,
+             markerSize: int = 1) -> np.array:
+
+    image = np.zeros(tuple(shape) + (4,), dtype=np.float32)
+
+    for positions, color, isLine in layers:
+
+        if isLine:
+            alpha = _widen(lineCoverageImage(positions, shapeStarts, extent, shape, antialias), lineWidth)
+        else:
+            alpha = _widen(np.minimum(densityImage(positions, extent, shape, antialias), 1), markerSize)
+
+        # Drawn over what is already there (premultiplied alpha)
+        red, green, blue, opacity = to_rgba(color)
+        alpha *= opacity
+        image *= (1 - alpha)[:, :, None]
+        image += alpha[:, :, None] * np.array([red, green, blue, 1], dtype=np.float32)
+
+    # Back to straight alpha for imshow, as bytes (a quarter of the memory at the resolution of saved figures)
+    coverage = image[:, :, 3:]
+    np.divide(image[:, :, :3], coverage, out=image[:, :, :3], where=coverage > 0)
+
+    return np.round(image * 255).astype(np.uint8)
+
+
+# Image artist showing dye layers (see dyeImage) rasterized at the resolution they are drawn at, for dyes with too many
+# particles to draw as markers
+class DyeRaster():
+
+    def __init__(self, ax, extent, shape, shapeStarts, antialias: bool = True, lineWidth: int = 1,
+                 markerSize: int = 1, **imshowArgs):
+
+        self.extent = extent
+        self.shape = tuple(shape)
+        self.shapeStarts = shapeStarts
+        self.antialias = antialias
+        self.lineWidth = lineWidth
+        self.markerSize = markerSize
+
+        self.image = ax.imshow(np.zeros(self.shape + (4,), dtype=np.uint8), extent=extent, origin="lower",
+                               interpolation="nearest", aspect=ax.get_aspect(), **imshowArgs)
+
+    def update(self, layers: list):
+        self.image.set_data(dyeImage(layers, self.shapeStarts, self.extent, self.shape, self.antialias,
+                                     self.lineWidth, self.markerSize))
@@ -14,10 +14,14 @@ flow = Flow()
 
 # flow.streamFunctionFlow(lambda x, y : x * y)
 
-flow.complexPotentialFlow(lambda z: - np.log(z) / 1j, functionOffset=(-1, 0))
-flow.complexPotentialFlow(lambda z: np.log(z) / 1j, functionOffset=(-1, -4))
-flow.complexPotentialFlow(lambda z: np.log(z) / 1j, functionOffset=(1, 0))
-flow.complexPotentialFlow(lambda z: - np.log(z) / 1j, functionOffset=(1, -4))
+# flow.complexPotentialFlow(lambda z: - np.log(z) / 1j, functionOffset=(-1, 0))
+# flow.complexPotentialFlow(lambda z: np.log(z) / 1j, functionOffset=(-1, -4))
+# flow.complexPotentialFlow(lambda z: np.log(z) / 1j, functionOffset=(1, 0))
+# flow.complexPotentialFlow(lambda z: - np.log(z) / 1j, functionOffset=(1, -4))
+
+# The same vortex array using the analytic elements
+flow.vortices([(-1, 0), (-1, -4), (1, 0), (1, -4)],
+              2 * np.pi * np.array([-1, 1, 1, -1]))
 
 # Define the dye to put into the fluid
 
@@ -35,6 +39,5 @@ flowSim = visualize.Visualizer(
     plottingData=visualize.PlottingData()
 )
 
-# Simulate the flow
-flowSim.iterate(numIter=100)
+# Plot the flow (frames are simulated as the time slider reaches them)
 flowSim.plot(interactive=True)
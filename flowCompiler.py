@@ -0,0 +1,317 @@
+import dis
+import hashlib
+import importlib.util
+import os
+import types
+import warnings
+
+import numpy as np
+from numba import njit
+
+from flowElements import elementVelocity
+
+
+# Folder the generated kernels (and numba's on disk cache of them) are kept in
+kernelCacheFolder = os.path.join(".flowcache", "kernels")
+
+# Step used for finite differences (matches Flow.streamFunctionFlow and Flow.complexPotentialFlow)
+_h = 1e-5
+
+
+# Raised for a value whose effect on the flow can't be hashed reliably, the flow then has no fingerprint (so nothing
+# computed from it is cached)
+class _Unfingerprintable(Exception):
+    pass
+
+
+# Adds everything that affects what a function computes to the hash: its code, the values captured in closures and
+# default arguments and the globals it reads (functions it calls are hashed in turn)
+def _hashFunction(func, digest, seen):
+
+    # Functions calling each other (or themselves) are only hashed once
+    if id(func) in seen:
+        digest.update(f"function {func.__qualname__}".encode())
+        return
+    seen.add(id(func))
+
+    code = func.__code__
+    _hashCode(code, digest)
+
+    for cell in func.__closure__ or ():
+        _hashValue(cell.cell_contents, digest, seen)
+    for default in func.__defaults__ or ():
+        _hashValue(default, digest, seen)
+
+    for name in sorted(_globalNames(code)):
+        digest.update(f"global {name}".encode())
+        if name in func.__globals__:
+            _hashValue(func.__globals__[name], digest, seen)
+
+
+# Names a code object (and the code nested in it, such as inner lambdas) looks up as globals
+def _globalNames(code) -> set:
+
+    names = {instruction.argval for instruction in dis.get_instructions(code)
+             if instruction.opname in ("LOAD_GLOBAL", "LOAD_NAME")}
+
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= _globalNames(const)
+
+    return names
+
+
+def _hashCode(code, digest):
+
+    digest.update(code.co_code)
+    digest.update(repr(code.co_names).encode())
+
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            _hashCode(const, digest)
+        else:
+            digest.update(repr(const).encode())
+
+
+def _hashValue(value, digest, seen):
+
+    if isinstance(value, types.FunctionType):
+        _hashFunction(value, digest, seen)
+    elif hasattr(value, "py_func"):  # Numba dispatcher
+        _hashFunction(value.py_func, digest, seen)
+    elif isinstance(value, (np.ndarray, np.generic)):
+        if value.dtype.hasobject:
+            raise _Unfingerprintable(f"array of {value.dtype}")
+        digest.update(f"{value.dtype.str}{value.shape}".encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, (tuple, list)):
+        digest.update(f"{type(value).__name__}{len(value)}".encode())
+        for item in value:
+            _hashValue(item, digest, seen)
+    elif value is None or isinstance(value, (bool, int, float, complex, str, bytes)):
+        digest.update(f"{type(value).__name__}:{value!r}".encode())
+    elif isinstance(value, types.ModuleType):
+        digest.update(value.__name__.encode())
+    elif isinstance(value, (types.BuiltinFunctionType, np.ufunc)):
+        digest.update(f"{getattr(value, '__module__', None)}.{value.__name__}".encode())
+    else:
+        # Anything else (its repr could hold a memory address, which changes between runs)
+        raise _Unfingerprintable(type(value).__name__)
+
+
+# Stable hash of the primitives added to a Flow (same flow definition -> same hash across runs). None if the flow reads
+# a value that can't be hashed, such as an arbitrary object
+def flowFingerprint(flowFunctions: dict) -> str:
+
+    digest = hashlib.sha1()
+    seen = set()
+
+    try:
+        for flowType in sorted(flowFunctions):
+            for entry in flowFunctions[flowType]:
+                digest.update(entry["type"].encode())
+                digest.update(repr(entry["offset"]).encode())
+
+                for func in entry["functions"]:
+                    _hashValue(func, digest, seen)
+
+                if "elements" in entry:
+                    for parameter in entry["elements"].parameters:
+                        _hashValue(parameter, digest, seen)
+
+    except _Unfingerprintable:
+        return None
+
+    return digest.hexdigest()
+
+
+# Source lines evaluating one primitive for a single particle at (x, y)
+def _primitiveSource(entry: dict, names: list) -> list:
+
+    offset = entry["offset"]
+
+    # Analytic elements are evaluated by their own (already compiled) function
+    if entry["type"] == "flowElements":
+        return [
+            f"vxElements, vyElements = {names[0]}(x, y, {', '.join(names[1:])})",
+            "vx += vxElements",
+            "vy += vyElements"
+        ]
+
+    if entry["type"] in ("polarFlow", "polarFlowCartesianOffset", "polarFlowPolarOffset"):
+
+        if entry["type"] == "polarFlowCartesianOffset":
+            coords = [f"px = x + {float(offset[0])!r}",
+                      f"py = y + {float(offset[1])!r}",
+                      "pr = np.sqrt(px * px + py * py)",
+                      "ptheta = np.arctan2(py, px)"]
+        elif entry["type"] == "polarFlowPolarOffset":
+            coords = [f"pr = r - {float(offset[0])!r}",
+                      f"ptheta = theta - {float(offset[1])!r}"]
+        else:
+            coords = ["pr = r", "ptheta = theta"]
+
+        return coords + [
+            f"vr = {names[0]}(pr, ptheta)",
+            f"vtheta = {names[1]}(pr, ptheta)",
+            "vx += vr * cosTheta - r * vtheta * sinTheta",
+            "vy += vr * sinTheta + r * vtheta * cosTheta"
+        ]
+
+    if offset:
+        coords = [f"px = x - {float(offset[0])!r}",
+                  f"py = y - {float(offset[1])!r}"]
+    else:
+        coords = ["px = x", "py = y"]
+
+    if entry["type"] == "cartesianFlow":
+        return coords + [
+            f"vx += {names[0]}(px, py)",
+            f"vy += {names[1]}(px, py)"
+        ]
+
+    # Use the derivative given by the user where there is one
+    if entry["type"] == "streamFunctionFlow" and len(names) == 2:
+        return coords + [
+            f"gradientX, gradientY = {names[1]}(px, py)",
+            "vx += gradientY",
+            "vy -= gradientX"
+        ]
+
+    if entry["type"] == "streamFunctionFlow":
+        return coords + [
+            f"vx += ({names[0]}(px, py + h) - {names[0]}(px, py - h)) / (2 * h)",
+            f"vy -= ({names[0]}(px + h, py) - {names[0]}(px - h, py)) / (2 * h)"
+        ]
+
+    if entry["type"] == "complexPotentialFlow" and len(names) == 2:
+        return coords + [
+            f"dWdz = {names[1]}(complex(px, py))",
+            "vx += dWdz.real",
+            "vy -= dWdz.imag"
+        ]
+
+    # dW/dz = vx - i vy, the potential is holomorphic so a difference along x is enough
+    if entry["type"] == "complexPotentialFlow":
+        return coords + [
+            f"dWdz = ({names[0]}(complex(px + h, py)) - {names[0]}(complex(px - h, py))) / (2 * h)",
+            "vx += dWdz.real",
+            "vy -= dWdz.imag"
+        ]
+
+    raise ValueError(f"Can not compile flow of type {entry['type']}")
+
+
+# Source of a module with one fused kernel evaluating every primitive in one pass over the particles
+def _kernelSource(flowFunctions: dict):
+
+    body = []
+    functions = {}
+
+    entries = [entry for flowType in sorted(flowFunctions)
+               for entry in flowFunctions[flowType]]
+
+    for entryIndex, entry in enumerate(entries):
+        names = [f"f{entryIndex}_{funcIndex}"
+                 for funcIndex in range(len(entry["functions"]))]
+        functions.update(zip(names, entry["functions"]))
+
+        # Element parameter arrays become globals of the kernel module (numba treats them as constants)
+        if "elements" in entry:
+            names = ["elementVelocity"] + [f"e{entryIndex}_{name}" for name in entry["elements"].parameterNames]
+            functions.update(zip(names, (elementVelocity,) + entry["elements"].parameters))
+
+        body.append(f"# {entry['type']}")
+        body += _primitiveSource(entry, names)
+
+    source = [
+        "import numpy as np",
+        "from numba import njit, prange",
+        "",
+        "",
+        "@njit(parallel=True, cache=True)",
+        "def kernel(xs, ys, vxs, vys):",
+        f"    h = {_h!r}",
+        "    for i in prange(xs.shape[0]):",
+        "        x = xs[i]",
+        "        y = ys[i]",
+        "        r = np.sqrt(x * x + y * y)",
+        "        theta = np.arctan2(y, x)",
+        "        cosTheta = np.cos(theta)",
+        "        sinTheta = np.sin(theta)",
+        "        vx = 0.0",
+        "        vy = 0.0",
+    ] + ["        " + line for line in body] + [
+        "        vxs[i] = vx",
+        "        vys[i] = vy",
+        ""
+    ]
+
+    # Polar coordinates are only needed by polar primitives
+    if not any(entry["type"].startswith("polarFlow") for entry in entries):
+        source = [line for line in source
+                  if not line.strip().startswith(("r =", "theta =", "cosTheta =", "sinTheta ="))]
+
+    return "\n".join(source), functions
+
+
+# Build (or load from the disk cache) the fused kernel for the flow, returns None if numba can't compile it. A flow
+# without a fingerprint is compiled in memory each time instead of being cached
+def compileFlowKernel(flowFunctions: dict, fingerprint: str):
+
+    try:
+        source, functions = _kernelSource(flowFunctions)
+    except ValueError as error:
+        warnings.warn(f"{error}, falling back to the uncompiled flow")
+        return None
+
+    if fingerprint is None:
+        source = source.replace("cache=True", "cache=False")
+        module = types.ModuleType("flowKernel")
+
+        def execModule(module):
+            exec(compile(source, "<flowKernel>", "exec"), module.__dict__)
+
+    else:
+        # The module is only written once so numba's cache (keyed on the file) stays valid
+        moduleName = f"flowKernel_{fingerprint}"
+        modulePath = os.path.join(kernelCacheFolder, f"{moduleName}.py")
+
+        if not os.path.exists(modulePath):
+            os.makedirs(kernelCacheFolder, exist_ok=True)
+            with open(modulePath, "w") as moduleFile:
+                moduleFile.write(source)
+
+        spec = importlib.util.spec_from_file_location(moduleName, modulePath)
+        module = importlib.util.module_from_spec(spec)
+        execModule = spec.loader.exec_module
+
+    try:
+        # The user functions are compiled individually and inlined into the kernel by numba
+        for name, func in functions.items():
+            if isinstance(func, np.ndarray) or hasattr(func, "py_func"):
+                setattr(module, name, func)
+            else:
+                setattr(module, name, njit(func))
+
+        execModule(module)
+
+    except Exception as error:
+        warnings.warn(
+            f"Numba could not compile the flow ({type(error).__name__}), falling back to the uncompiled flow")
+        return None
+
+    # Some kernels compile but can't be reloaded from numba's cache, those are compiled without it
+    for kernel in (module.kernel, njit(parallel=True)(module.kernel.py_func)):
+        try:
+            # Compile now (rather than on first use) so unsupported functions are found here
+            testPoint = np.array([0.1234])
+            kernel(testPoint, testPoint, np.empty(1), np.empty(1))
+            return kernel
+
+        except Exception as error:
+            compileError = error
+
+    warnings.warn(
+        f"Numba could not compile the flow ({type(compileError).__name__}), falling back to the uncompiled flow")
+    return None
@@ -0,0 +1,171 @@
+import numpy as np
+from numba import njit, prange
+
+
+# Core regularization models (used when an element has a core radius > 0)
+coreModels = {
+    "rankine": 1,
+    "lambOseen": 2
+}
+
+
+# Complex velocity w = vx - i vy of every element at a single point
+# Each element contributes w = c / (z - z0) ** p (p = 0 uniform stream, 1 vortex / source, 2 doublet)
+@njit(cache=True)
+def elementVelocity(x, y, xs, ys, cRe, cIm, powers, coreRadii, coreModelIds):
+
+    wRe = 0.0
+    wIm = 0.0
+
+    for j in range(xs.shape[0]):
+
+        if powers[j] == 0:
+            wRe += cRe[j]
+            wIm += cIm[j]
+            continue
+
+        dx = x - xs[j]
+        dy = y - ys[j]
+        r2 = dx * dx + dy * dy
+
+        # The velocity at the element itself is taken to be zero
+        if r2 == 0.0:
+            continue
+
+        # 1 / (z - z0) = conj(z - z0) / |z - z0| ** 2
+        invRe = dx / r2
+        invIm = - dy / r2
+        if powers[j] == 2:
+            invRe, invIm = invRe * invRe - invIm * invIm, 2 * invRe * invIm
+
+        # Smooth the singularity inside the core
+        factor = 1.0
+        if coreRadii[j] > 0:
+            q = r2 / (coreRadii[j] * coreRadii[j])
+            if coreModelIds[j] == 1:
+                factor = min(q, 1.0)
+            else:
+                factor = 1 - np.exp(- q)
+            if powers[j] == 2:
+                factor *= factor
+
+        wRe += factor * (cRe[j] * invRe - cIm[j] * invIm)
+        wIm += factor * (cRe[j] * invIm + cIm[j] * invRe)
+
+    return wRe, - wIm
+
+
+# Velocities of every element at every particle in one pass over the particles
+@njit(parallel=True, cache=True)
+def _elementVelocitiesKernel(xs, ys, exs, eys, cRe, cIm, powers, coreRadii, coreModelIds, vxs, vys):
+
+    for i in prange(xs.shape[0]):
+        vxs[i], vys[i] = elementVelocity(xs[i], ys[i], exs, eys, cRe, cIm,
+                                         powers, coreRadii, coreModelIds)
+
+
+# Analytic flow elements stored as parameter arrays (one entry per element)
+class FlowElements():
+
+    # Names of the parameter arrays (in the order elementVelocity takes them)
+    parameterNames = ("xs", "ys", "cRe", "cIm",
+                      "powers", "coreRadii", "coreModelIds")
+
+    # Tree summation settings (see treecode.py), direct summation is used below minTreeElements
+    minTreeElements = 1000
+    treeTheta = 0.5
+    treeOrder = 12
+    treeLeafSize = 32
+
+    def __init__(self):
+
+        # Elements are added in batches and joined into single arrays when next used
+        self._batches = []
+        self._parameters = None
+
+    def __len__(self):
+        return len(self.parameters[0])
+
+    # Tuple of the parameter arrays of every element
+    @property
+    def parameters(self):
+
+        if self._parameters is None:
+            if self._batches:
+                self._parameters = tuple(np.concatenate(arrays)
+                                         for arrays in zip(*self._batches))
+            else:
+                self._parameters = (np.zeros(0), np.zeros(0), np.zeros(0), np.zeros(0),
+                                    np.zeros(0, dtype=np.int64), np.zeros(0),
+                                    np.zeros(0, dtype=np.int64))
+
+            self._batches = [self._parameters]
+
+        return self._parameters
+
+    # Adds elements with complex velocity coefficient / (z - position) ** power
+    def add(self, positions, coefficients, power: int, coreRadii=0, coreModel="rankine"):
+
+        if coreModel not in coreModels:
+            raise ValueError(
+                f"Unknown core model {coreModel}, choose from {', '.join(coreModels)}")
+
+        positions = np.atleast_2d(np.asarray(positions, dtype=np.float64))
+        if positions.shape[-1] != 2:
+            raise ValueError("Element positions must have shape (2,) or (n, 2)")
+
+        numElements = positions.shape[0]
+        coefficients = np.broadcast_to(
+            np.asarray(coefficients, dtype=np.complex128), (numElements,))
+
+        self._batches.append((
+            positions[:, 0].copy(),
+            positions[:, 1].copy(),
+            coefficients.real.copy(),
+            coefficients.imag.copy(),
+            np.full(numElements, power, dtype=np.int64),
+            np.broadcast_to(np.asarray(coreRadii, dtype=np.float64),
+                            (numElements,)).copy(),
+            np.full(numElements, coreModels[coreModel], dtype=np.int64)
+        ))
+        self._parameters = None
+
+    # Velocities (vx, vy) of all the elements at the points x, y
+    def velocities(self, x, y):
+
+        x, y = np.broadcast_arrays(np.asarray(x, dtype=np.float64),
+                                   np.asarray(y, dtype=np.float64))
+        xs = np.ascontiguousarray(x).ravel()
+        ys = np.ascontiguousarray(y).ravel()
+
+        vxs = np.empty_like(xs)
+        vys = np.empty_like(ys)
+        _elementVelocitiesKernel(xs, ys, *self.parameters, vxs, vys)
+
+        return vxs.reshape(x.shape), vys.reshape(y.shape)
+
+    # Whether streamFunction gives the stream function of every element (smoothed cores aren't included)
+    @property
+    def hasStreamFunction(self):
+        return not np.any(self.parameters[5] > 0)
+
+    # Stream function (imaginary part of the complex potential) of all the elements at the points x, y
+    # W = c z (p = 0), c log(z - z0) (p = 1), - c / (z - z0) (p = 2)
+    def streamFunction(self, x, y):
+
+        z = np.asarray(x, dtype=np.float64) + 1j * np.asarray(y, dtype=np.float64)
+        psi = np.zeros(z.shape)
+
+        xs, ys, cRe, cIm, powers = self.parameters[:5]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for j in range(xs.shape[0]):
+
+                c = complex(cRe[j], cIm[j])
+                if powers[j] == 0:
+                    psi += (c * z).imag
+                elif powers[j] == 1:
+                    psi += (c * np.log(z - complex(xs[j], ys[j]))).imag
+                else:
+                    psi -= (c / (z - complex(xs[j], ys[j]))).imag
+
+        return psi
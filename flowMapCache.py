@@ -0,0 +1,133 @@
+from collections import OrderedDict
+import hashlib
+import os
+import zipfile
+
+import matplotlib
+import numpy as np
+
+
+# Folder the flow maps and streamlines are kept in between runs
+flowMapCacheFolder = os.path.join(".flowcache", "flowmaps")
+
+# Changed whenever what is stored for an entry, or how it is keyed, changes (older files are then never read)
+_formatVersion = 3
+
+
+# Stable key of everything that a flow map (or the streamlines drawn from it) depends on
+def cacheKey(*parts) -> str:
+
+    digest = hashlib.sha1(f"flowMap{_formatVersion}".encode())
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            part = part.tolist()
+        elif isinstance(part, np.generic):
+            part = part.item()
+        digest.update(repr(part).encode())
+        digest.update(b"\0")
+
+    return digest.hexdigest()
+
+
+# Key of the streamlines, which also depend on how matplotlib integrates them
+def streamlineCacheKey(flowMapKey: str, *parts) -> str:
+    return cacheKey(flowMapKey, matplotlib.__version__, *parts)
+
+
+# Flow maps and streamlines (dicts of arrays) kept in memory, least recently used first out once over maxBytes, and
+# as .npz files on disk so that re-runs of the same scenario skip the evaluation and the streamline integration
+class FlowMapCache():
+
+    def __init__(self, maxBytes: int = 64 * 2 ** 20, folder: str = flowMapCacheFolder):
+
+        self.maxBytes = maxBytes
+        self.folder = folder
+
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+        self.hits = 0
+        self.diskHits = 0
+        self.misses = 0
+
+    # Empties the memory tier (and the disk tier with disk=True)
+    def clear(self, disk: bool = False):
+
+        self._entries.clear()
+        self._bytes = 0
+
+        if disk and os.path.isdir(self.folder):
+            for fileName in os.listdir(self.folder):
+                if fileName.endswith(".npz"):
+                    os.remove(os.path.join(self.folder, fileName))
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.folder, f"{key}.npz")
+
+    # Arrays stored under key (None if not cached), looking on disk after memory if useDisk
+    def get(self, key: str, useDisk: bool = True):
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+        if useDisk:
+            entry = self._load(key)
+            if entry is not None:
+                self.diskHits += 1
+                self._remember(key, entry)
+                return entry
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, entry: dict, useDisk: bool = True):
+
+        self._remember(key, entry)
+        if useDisk:
+            self._save(key, entry)
+
+    def _remember(self, key: str, entry: dict):
+
+        if key in self._entries:
+            self._bytes -= sum(array.nbytes for array in self._entries.pop(key).values())
+
+        self._entries[key] = entry
+        self._bytes += sum(array.nbytes for array in entry.values())
+
+        # Evict the least recently used entries (the newest is always kept)
+        while self._bytes > self.maxBytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= sum(array.nbytes for array in evicted.values())
+
+    def _load(self, key: str):
+
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with np.load(path, allow_pickle=False) as file:
+                return {name: file[name] for name in file.files}
+
+        # Partly written or otherwise unreadable files are treated as missing
+        except (OSError, ValueError, EOFError, zipfile.BadZipFile):
+            os.remove(path)
+            return None
+
+    def _save(self, key: str, entry: dict):
+
+        os.makedirs(self.folder, exist_ok=True)
+
+        # Written under a temporary name first so other runs never read half a file
+        path = self._path(key)
+        temporaryPath = f"{path}.{os.getpid()}.tmp"
+        with open(temporaryPath, "wb") as file:
+            np.savez(file, **entry)
+        os.replace(temporaryPath, path)
+
+
+# Shared by every plot, so re-rendering the same flow in a session doesn't read the disk again
+flowMapCache = FlowMapCache()
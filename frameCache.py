@@ -0,0 +1,56 @@
+from collections import OrderedDict
+
+import numpy as np
+
+from structs import ParticleData
+
+
+# Least recently used cache of the dye positions interpolated between iterations, bounded in bytes. Whole iterations
+# are views of the trajectory so are returned without interpolating or caching
+class FrameCache():
+
+    def __init__(self, particleData: ParticleData, maxBytes: int):
+
+        self.particleData = particleData
+        self.maxBytes = maxBytes
+
+        self._frames = OrderedDict()
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        self._frames.clear()
+        self._bytes = 0
+
+    # Positions (x, y) of every particle at a (fractional) iteration index, both coordinates from one interpolation
+    def positionsAtIndex(self, iterationIndex: float) -> np.array:
+
+        # Times divided by the time step land just off whole iterations
+        nearest = round(iterationIndex)
+        if abs(iterationIndex - nearest) < 1e-9:
+            iterationIndex = nearest
+
+            # Stored iterations (simulated first if needed) are views of the trajectory
+            if self.particleData.isStored(nearest) or nearest >= self.particleData.numIterations:
+                return self.particleData.positionsAtTime(nearest)
+
+        frame = self._frames.get(iterationIndex)
+        if frame is not None:
+            self._frames.move_to_end(iterationIndex)
+            self.hits += 1
+            return frame
+
+        self.misses += 1
+        frame = self.particleData.positionsAtTime(iterationIndex)
+
+        self._frames[iterationIndex] = frame
+        self._bytes += frame.nbytes
+
+        # Evict the least recently used frames (the newest is always kept)
+        while self._bytes > self.maxBytes and len(self._frames) > 1:
+            _, evicted = self._frames.popitem(last=False)
+            self._bytes -= evicted.nbytes
+
+        return frame
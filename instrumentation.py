@@ -0,0 +1,210 @@
+import collections
+import contextlib
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+
+# Profiler that phase and count record into (None when profiling is off, which keeps their cost to one check)
+_activeProfiler = None
+
+_nullPhase = contextlib.nullcontext()
+
+
+# Times the code in a with block as the named phase of the active profiler
+def phase(name: str):
+
+    if _activeProfiler is None:
+        return _nullPhase
+
+    return _activeProfiler.phase(name)
+
+
+# Adds amount to the named counter of the active profiler
+def count(name: str, amount: int = 1):
+
+    if _activeProfiler is not None:
+        _activeProfiler.count(name, amount)
+
+
+# Context manager recording one timed phase
+class _Phase():
+
+    __slots__ = ("profiler", "name", "start", "memory")
+
+    def __init__(self, profiler, name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+
+        if self.profiler.traceAllocations:
+            self.memory = tracemalloc.get_traced_memory()[0]
+        self.start = time.perf_counter_ns()
+
+        return self
+
+    def __exit__(self, *exc):
+
+        end = time.perf_counter_ns()
+        allocated = tracemalloc.get_traced_memory()[0] - self.memory \
+            if self.profiler.traceAllocations else 0
+
+        self.profiler._record(self.name, self.start, end - self.start, allocated)
+
+
+# Records the wall time of each phase of a run (flow evaluation, conversions, storing positions, plotting), counters
+# such as the number of flow evaluations and, optionally, the memory allocated by each phase
+class Profiler():
+
+    def __init__(self, traceAllocations: bool = False, keepEvents: bool = True, maxEvents: int = 100000):
+
+        # Allocations are traced with tracemalloc, which slows numpy down so is off by default
+        self.traceAllocations = traceAllocations
+
+        # Phases are kept for the trace export, only the latest maxEvents (under 200 bytes each) so that a long run
+        # doesn't use more and more memory (the totals are always kept)
+        self.keepEvents = keepEvents
+        self.maxEvents = maxEvents
+
+        self.hooks = []
+        self.reset()
+
+    # Clears everything recorded so far (hooks are kept)
+    def reset(self):
+
+        # name -> [calls, total ns, net bytes allocated]
+        self.phases = {}
+        self.counters = {}
+
+        # (name, start ns, duration ns, thread id) of the latest phases
+        self.events = collections.deque(maxlen=self.maxEvents)
+
+        self._origin = time.perf_counter_ns()
+        self._peakMemory = 0
+
+    @property
+    def enabled(self):
+        return _activeProfiler is self
+
+    # Make this the profiler that the simulation and plots record into
+    def enable(self):
+
+        global _activeProfiler
+        _activeProfiler = self
+
+        if self.traceAllocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def disable(self):
+
+        global _activeProfiler
+        if _activeProfiler is self:
+            _activeProfiler = None
+
+        if self.traceAllocations and tracemalloc.is_tracing():
+            self._peakMemory = max(self._peakMemory, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *exc):
+        self.disable()
+
+    def phase(self, name: str):
+        return _Phase(self, name)
+
+    def count(self, name: str, amount: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    # Calls callback(name, durationSeconds, allocatedBytes) at the end of every phase
+    def addHook(self, callback):
+        self.hooks.append(callback)
+
+    def removeHook(self, callback):
+        self.hooks.remove(callback)
+
+    def _record(self, name: str, start: int, duration: int, allocated: int):
+
+        totals = self.phases.get(name)
+        if totals is None:
+            totals = self.phases[name] = [0, 0, 0]
+        totals[0] += 1
+        totals[1] += duration
+        totals[2] += allocated
+
+        if self.keepEvents:
+            self.events.append((name, start, duration, threading.get_ident()))
+
+        for hook in self.hooks:
+            hook(name, duration * 1e-9, allocated)
+
+    # Totals of everything recorded, times in seconds (phases are inclusive of the phases inside them)
+    def report(self) -> dict:
+
+        report = {
+            "phases": {
+                name: {"calls": calls, "seconds": duration * 1e-9, "allocatedBytes": allocated}
+                for name, (calls, duration, allocated) in sorted(self.phases.items(), key=lambda item: - item[1][1])
+            },
+            "counters": dict(self.counters)
+        }
+
+        # Throughput of the iterations
+        iterateSeconds = report["phases"].get("iterate", {}).get("seconds", 0)
+        if iterateSeconds > 0:
+            report["particlesPerSecond"] = self.counters.get("particleSteps", 0) / iterateSeconds
+            report["flowEvaluationsPerSecond"] = self.counters.get("flowEvaluations", 0) / iterateSeconds
+
+        if self.traceAllocations:
+            peakMemory = self._peakMemory
+            if tracemalloc.is_tracing():
+                peakMemory = max(peakMemory, tracemalloc.get_traced_memory()[1])
+            report["peakTracedBytes"] = peakMemory
+
+        return report
+
+    # Readable table of the report
+    def summary(self) -> str:
+
+        report = self.report()
+        lines = [f"{'phase':<24} {'calls':>8} {'seconds':>10} {'MB allocated':>13}"]
+        for name, totals in report["phases"].items():
+            lines.append(f"{name:<24} {totals['calls']:>8} {totals['seconds']:>10.4f} "
+                         f"{totals['allocatedBytes'] / 1e6:>13.2f}")
+
+        for name, value in report["counters"].items():
+            lines.append(f"{name:<24} {value:>8}")
+
+        if "particlesPerSecond" in report:
+            lines.append(f"{'particles per second':<24} {report['particlesPerSecond']:>8.3g}")
+
+        return "\n".join(lines)
+
+    def exportJSON(self, path: str):
+        with open(path, "w") as file:
+            json.dump(self.report(), file, indent=4)
+
+    # Trace viewable in chrome://tracing or Perfetto
+    def exportChromeTrace(self, path: str):
+
+        pid = os.getpid()
+        traceEvents = [
+            {"name": name, "ph": "X", "pid": pid, "tid": tid,
+             "ts": (start - self._origin) / 1000, "dur": duration / 1000}
+            for name, start, duration, tid in self.events
+        ]
+
+        # Counter totals are added at the end of the trace
+        end = max(((start + duration - self._origin) / 1000 for _, start, duration, _ in self.events), default=0)
+        traceEvents += [
+            {"name": name, "ph": "C", "pid": pid, "ts": end, "args": {name: value}}
+            for name, value in self.counters.items()
+        ]
+
+        with open(path, "w") as file:
+            json.dump({"traceEvents": traceEvents, "displayTimeUnit": "ms"}, file)
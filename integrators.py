@@ -0,0 +1,208 @@
+import numpy as np
+
+
+# Dormand–Prince 5(4) Butcher tableau
+_dpA = (
+    (),
+    (1 / 5,),
+    (3 / 40, 9 / 40),
+    (44 / 45, - 56 / 15, 32 / 9),
+    (19372 / 6561, - 25360 / 2187, 64448 / 6561, - 212 / 729),
+    (9017 / 3168, - 355 / 33, 46732 / 5247, 49 / 176, - 5103 / 18656),
+    (35 / 384, 0, 500 / 1113, 125 / 192, - 2187 / 6784, 11 / 84)
+)
+
+# 5th order weights (equal to the last row of A, which is what makes FSAL possible)
+_dpB = (35 / 384, 0, 500 / 1113, 125 / 192, - 2187 / 6784, 11 / 84, 0)
+
+# Difference between the 5th and embedded 4th order weights (used for the error estimate)
+_dpE = (
+    35 / 384 - 5179 / 57600,
+    0,
+    500 / 1113 - 7571 / 16695,
+    125 / 192 - 393 / 640,
+    - 2187 / 6784 + 92097 / 339200,
+    11 / 84 - 187 / 2100,
+    - 1 / 40
+)
+
+# Step size controller settings
+_safetyFactor = 0.9
+_minScaleFactor = 0.2
+_maxScaleFactor = 5
+
+# Rows of scratch used by the integrators (the new positions and velocities, and the stages)
+rk4ScratchRows = 6
+dormandPrinceScratchRows = 13
+
+
+# Substeps per time step of the fixed step integrators when SimSetupData.subtimeSteps is None, a higher order
+# integrator needs far fewer for the same error
+defaultSubtimeSteps = {
+    "euler": 32,
+    "rk4": 1
+}
+
+
+# Number of substeps per time step of the fixed step integrators
+def subtimeStepCount(setupData) -> int:
+
+    if setupData.subtimeSteps is not None:
+        return setupData.subtimeSteps
+
+    return defaultSubtimeSteps.get(setupData.integrator, 1)
+
+
+# Writes the sum of weight * array over the non-zero weights into out (scratch is overwritten)
+def _weightedSum(weights, arrays, out: np.array, scratch: np.array) -> np.array:
+
+    first = True
+    for weight, array in zip(weights, arrays):
+        if not weight:
+            continue
+
+        if first:
+            np.multiply(array, weight, out=out)
+            first = False
+        else:
+            out += np.multiply(array, weight, out=scratch)
+
+    return out
+
+
+# Classic 4th order Runge-Kutta with a fixed number of substeps. The velocity at the end of each substep is the first
+# stage of the next one, so the velocity returned is the one at the new positions for one extra call per iteration.
+# velocityFunc(positions, out) writes the velocities into out, the stages are kept in scratch (rk4ScratchRows rows
+# of the shape of positions, allocated when not given) which the new positions and velocities returned are views of
+def rk4Step(positions: np.array, velocityFunc, timeStep: float, setupData, stepSizes=None, scratch=None):
+
+    if scratch is None:
+        scratch = np.empty((rk4ScratchRows,) + positions.shape, dtype=positions.dtype)
+
+    subtimeSteps = subtimeStepCount(setupData)
+    h = timeStep / subtimeSteps
+    new_positions, k1, k2, k3, k4, stagePositions = scratch[:rk4ScratchRows]
+    new_positions[:] = positions
+
+    velocityFunc(new_positions, out=k1)
+    for _ in range(subtimeSteps):
+        velocityFunc(_stagePositions(new_positions, 0.5 * h, k1, stagePositions), out=k2)
+        velocityFunc(_stagePositions(new_positions, 0.5 * h, k2, stagePositions), out=k3)
+        velocityFunc(_stagePositions(new_positions, h, k3, stagePositions), out=k4)
+
+        # k1 + 2 k2 + 2 k3 + k4 (k2 is free once it has been added)
+        increment = np.multiply(k2, 2, out=stagePositions)
+        increment += k1
+        increment += np.multiply(k3, 2, out=k2)
+        increment += k4
+        increment *= h / 6
+
+        new_positions += increment
+        velocityFunc(new_positions, out=k1)
+
+    return new_positions, k1, None
+
+
+# positions + step * velocities written into out
+def _stagePositions(positions: np.array, step, velocities: np.array, out: np.array) -> np.array:
+
+    np.multiply(velocities, step, out=out)
+    out += positions
+    return out
+
+
+# Adaptive Dormand–Prince 5(4) with per-particle step size control and FSAL reuse. velocityFunc and scratch are as for
+# rk4Step (dormandPrinceScratchRows rows, the stages of the particles still moving are packed at the start of it)
+def dormandPrinceStep(positions: np.array, velocityFunc, timeStep: float, setupData, stepSizes=None, scratch=None):
+
+    numParticles = positions.shape[1]
+    if scratch is None:
+        scratch = np.empty((dormandPrinceScratchRows,) + positions.shape, dtype=positions.dtype)
+
+    new_positions, k1 = scratch[:2]
+    stageScratch = scratch[2:dormandPrinceScratchRows].reshape(-1)
+    new_positions[:] = positions
+
+    # Each particle keeps its own clock and step size
+    timeDone = np.zeros(numParticles)
+    if stepSizes is None or stepSizes.shape != (numParticles,):
+        stepSizes = np.full(numParticles, timeStep)
+    else:
+        stepSizes = stepSizes.copy()
+
+    # First stage of the first step (later steps reuse the last stage, FSAL)
+    velocityFunc(new_positions, out=k1)
+
+    active = np.arange(numParticles)
+    while active.size:
+
+        # Contiguous arrays for the particles still moving (take is only unbuffered with a mode other than raise, the
+        # indices are always valid)
+        stages = stageScratch[:(dormandPrinceScratchRows - 2) * 2 * active.size].reshape(-1, 2, active.size)
+        y, stagePositions, term, y5 = stages[:4]
+        k = stages[4:]
+
+        # Do not step past the end of the iteration
+        h = np.minimum(stepSizes[active], timeStep - timeDone[active])
+        np.take(new_positions, active, axis=1, out=y, mode="clip")
+
+        # Evaluate the stages for the particles still moving
+        np.take(k1, active, axis=1, out=k[0], mode="clip")
+        for stage in range(1, 7):
+            increment = _weightedSum(_dpA[stage], k, out=stagePositions, scratch=term)
+            increment *= h
+            increment += y
+            velocityFunc(increment, out=k[stage])
+
+        # The 7th stage is evaluated at the 5th order solution
+        y5 = _weightedSum(_dpB, k, out=y5, scratch=term)
+        y5 *= h
+        y5 += y
+
+        # Scaled RMS error norm per particle (the stages before the last are free by now)
+        error = _weightedSum(_dpE, k, out=stagePositions, scratch=term)
+        error *= h
+        scale = np.maximum(np.abs(y, out=term), np.abs(y5, out=k[1]), out=term)
+        scale *= setupData.relativeTolerance
+        scale += setupData.absoluteTolerance
+        error /= scale
+        errorNorm = np.sqrt(np.mean(np.square(error, out=error), axis=0))
+
+        # Accept steps within tolerance, or that cannot shrink any further (singularities)
+        accepted = (errorNorm <= 1) | (h <= setupData.minSubtimeStep)
+        acceptedIndex = active[accepted]
+
+        new_positions[:, acceptedIndex] = y5[:, accepted]
+        k1[:, acceptedIndex] = k[6][:, accepted]
+        timeDone[acceptedIndex] += h[accepted]
+
+        # Standard step size controller for a 5th order method
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scaleFactor = _safetyFactor * errorNorm ** -0.2
+        scaleFactor = np.clip(np.nan_to_num(scaleFactor, nan=_minScaleFactor),
+                              _minScaleFactor, _maxScaleFactor)
+        proposed = h * scaleFactor
+
+        # A step shortened to land on the end of the iteration says nothing about the next one
+        truncated = accepted & (h < stepSizes[active])
+        proposed[truncated] = np.maximum(proposed[truncated],
+                                         stepSizes[active][truncated])
+        stepSizes[active] = np.maximum(proposed, setupData.minSubtimeStep)
+
+        # Keep only the particles that have not reached the end of the iteration
+        active = active[timeDone[active] < timeStep * (1 - 1e-12)]
+
+    return new_positions, k1, stepSizes
+
+
+# Integrators that can be selected with SimSetupData.integrator (euler is handled by the iterator)
+integrators = {
+    "rk4": rk4Step,
+    "dopri5": dormandPrinceStep
+}
+
+# Rows of scratch each integrator uses (see rk4Step)
+integratorScratchRows = {
+    "rk4": rk4ScratchRows,
+    "dopri5": dormandPrinceScratchRows
+}
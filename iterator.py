@@ -1,55 +1,208 @@
 import numpy as np
-from numba import njit
 from structs import SimFlowFuncs, ParticleData, SimSetupData
+from integrators import integrators, integratorScratchRows, subtimeStepCount
+from instrumentation import phase, count
 
 
-# Helper functions
-def _posToPol(x, y): return [
-    np.sqrt(x ** 2 + y ** 2),
-    np.arctan2(y, x)
-]
+# Rough upper bound on the temporary memory used per particle while advancing a block (the scratch arrays, the
+# integrator stages and the temporaries made inside the flow functions)
+_bytesPerParticle = 512
 
+# Rows of the (2, numParticles) scratch arrays used by _advanceBlockEuler and getVelocitiesFromPositionsCartConverted
+_eulerScratchRows = 6
+_conversionScratchRows = 5
 
-def _polToPos(r, theta): return np.array([
-    r * np.cos(theta),
-    r * np.sin(theta)
-])
 
+# Helper functions (written into out when given, so that blocks can reuse their scratch arrays)
+def _posToPol(x, y, out=None):
 
-def _polVeltoCartVel(x, y, vr, vtheta):
+    if out is None:
+        out = np.empty((2,) + np.shape(x), dtype=np.result_type(x, y))
 
-    r = np.sqrt(x ** 2 + y ** 2)
-    theta = np.arctan2(y, x)
+    r, theta = out
+    np.multiply(x, x, out=r)
+    np.multiply(y, y, out=theta)
+    r += theta
+    np.sqrt(r, out=r)
+    np.arctan2(y, x, out=theta)
 
-    return [
-        vr * np.cos(theta) - r * vtheta * np.sin(theta),
-        vr * np.sin(theta) + r * vtheta * np.cos(theta)
-    ]
+    return out
+
+
+# Coordinates of the particles at one substep. The polar coordinates and cos, sin of theta are worked out once, when
+# first needed, and then shared by every flow function and conversion
+class Coordinates():
+
+    __slots__ = ("x", "y", "_buffer", "_hasPolar", "_hasTrig")
+
+    # x, y are views of positions (updated in place by movePolar), buffer is an optional (4, numParticles) scratch array
+    def __init__(self, positions: np.array, buffer: np.array = None):
+
+        self.x, self.y = positions
+        self._buffer = np.empty((4,) + self.x.shape, dtype=self.x.dtype) if buffer is None else buffer
+        self._hasPolar = False
+        self._hasTrig = False
+
+    @property
+    def r(self):
+        return self._polar()[0]
+
+    @property
+    def theta(self):
+        return self._polar()[1]
+
+    @property
+    def cos(self):
+        return self._trig()[0]
+
+    @property
+    def sin(self):
+        return self._trig()[1]
+
+    def _polar(self):
+
+        if not self._hasPolar:
+            _posToPol(self.x, self.y, out=self._buffer[:2])
+            self._hasPolar = True
+
+        return self._buffer[:2]
+
+    # cos and sin of theta from x / r and y / r (no transcendental functions needed)
+    def _trig(self):
+
+        if not self._hasTrig:
+            r = self._polar()[0]
+            cos, sin = self._buffer[2:]
+
+            with np.errstate(divide="ignore", invalid="ignore"):
+                np.divide(self.x, r, out=cos)
+                np.divide(self.y, r, out=sin)
+
+            # theta is 0 at the origin
+            atOrigin = r == 0
+            if atOrigin.any():
+                cos[atOrigin] = 1
+                sin[atOrigin] = 0
+
+            self._hasTrig = True
+
+        return self._buffer[2:]
+
+    # Call after x, y have been changed in place
+    def moved(self):
+        self._hasPolar = False
+        self._hasTrig = False
+
+    # Move the particles by dr, dtheta, the new r, theta are kept (so the next substep doesn't work them out again)
+    def movePolar(self, dr, dtheta):
+
+        r, theta, cos, sin = self._buffer
+        self._polar()
+
+        r += dr
+        theta += dtheta
+
+        # Keep theta between -pi and pi as arctan2 would give it
+        theta += np.pi
+        np.remainder(theta, 2 * np.pi, out=theta)
+        theta -= np.pi
+
+        np.cos(theta, out=cos)
+        np.sin(theta, out=sin)
+        np.multiply(r, cos, out=self.x)
+        np.multiply(r, sin, out=self.y)
+
+        # A particle moved through the origin has a negative r so the polar coordinates are worked out again
+        self._hasPolar = not (r < 0).any()
+        self._hasTrig = self._hasPolar
+
+
+# Whether the flow has any polar flow functions
+def _hasPolarFlow(flowData: SimFlowFuncs):
+    return bool(flowData.vrtheta or (flowData.vr and flowData.vtheta))
+
+
+# Whether the flow has any flow functions giving cartesian velocities
+def _hasCartesianFlow(flowData: SimFlowFuncs):
+    return bool((flowData.vx and flowData.vy) or flowData.vxy or flowData.v)
+
+
+# scratch is an optional (numParticles,) array that is overwritten
+def _polVeltoCartVel(coordinates: Coordinates, vr, vtheta, out=None, scratch=None):
+
+    if out is None:
+        out = np.empty((2,) + coordinates.x.shape, dtype=coordinates.x.dtype)
+    if scratch is None:
+        scratch = np.empty(coordinates.x.shape, dtype=coordinates.x.dtype)
+
+    r, cos, sin = coordinates.r, coordinates.cos, coordinates.sin
+
+    # vr cos(theta) - r vtheta sin(theta)
+    np.multiply(vr, cos, out=out[0])
+    np.multiply(r, vtheta, out=scratch)
+    out[0] -= np.multiply(scratch, sin, out=out[1])
+
+    # vr sin(theta) + r vtheta cos(theta)
+    scratch *= cos
+    np.multiply(vr, sin, out=out[1])
+    out[1] += scratch
+
+    return out
 
 # Returns an array of poistions from flow data
 
 
-def getVelocitiesFromPositions(positions: np.array, flowData: SimFlowFuncs) -> list:
+def getVelocitiesFromPositions(positions: np.array, flowData: SimFlowFuncs, out=None, coordinates=None) -> list:
+
+    # Velocities are written into out = (cartesian, polar) arrays when given
+    if out is None:
+        out = np.empty(positions.shape, dtype=positions.dtype), np.empty(positions.shape, dtype=positions.dtype)
 
     # Velocity in the x, y plane
-    cartParticleVelocities = np.zeros(positions.shape)
+    cartParticleVelocities = out[0]
+    cartParticleVelocities.fill(0)
 
     # Velocity in the r, theta plane
-    polarParticleVelocities = np.zeros(positions.shape)
+    polarParticleVelocities = out[1]
+    polarParticleVelocities.fill(0)
+
+    count("flowEvaluations")
+    count("particleEvaluations", positions.shape[1])
 
     # Cartesian coordinates
     if flowData.vx and flowData.vy:
 
-        cartParticleVelocities[0, :] += flowData.vx(*positions)
-        cartParticleVelocities[1, :] += flowData.vy(*positions)
+        with phase("flow.cartesian"):
+            cartParticleVelocities[0, :] += flowData.vx(*positions)
+            cartParticleVelocities[1, :] += flowData.vy(*positions)
+
+    # Fused cartesian coordinates
+    if flowData.vxy:
+
+        with phase("flow.cartesian"):
+            vxs, vys = flowData.vxy(*positions)
+            cartParticleVelocities[0, :] += vxs
+            cartParticleVelocities[1, :] += vys
 
     # Polar coordinates
-    if flowData.vr and flowData.vtheta:
+    if _hasPolarFlow(flowData):
+
+        # r, theta (and cos, sin of theta) are shared by the flow functions and the later conversions
+        if coordinates is None:
+            coordinates = Coordinates(positions)
+
+        with phase("conversion.polar"):
+            r, theta = coordinates.r, coordinates.theta
+
+        with phase("flow.polar"):
+            if flowData.vrtheta:
+                vrs, vthetas = flowData.vrtheta(coordinates)
+                polarParticleVelocities[0, :] += vrs
+                polarParticleVelocities[1, :] += vthetas
 
-        # returns r, theta
-        polarParticleVelocities[0, :] += flowData.vr(*_posToPol(*positions))
-        polarParticleVelocities[1,
-                                :] += flowData.vtheta(*_posToPol(*positions))
+            if flowData.vr and flowData.vtheta:
+                polarParticleVelocities[0, :] += flowData.vr(r, theta)
+                polarParticleVelocities[1, :] += flowData.vtheta(r, theta)
 
     # Mixed coodinates
     if flowData.v:
@@ -67,8 +220,9 @@ def getVelocitiesFromPositions(positions: np.array, flowData: SimFlowFuncs) -> l
         thetaHat = [- y, x] / np.linalg.norm(positions)
 
         # Calculate particleVelocities
-        cartParticleVelocities += flowData.v(x,
-                                             y, xHat, yHat, r, theta, rHat, thetaHat)
+        with phase("flow.mixed"):
+            cartParticleVelocities += flowData.v(x,
+                                                 y, xHat, yHat, r, theta, rHat, thetaHat)
 
     # Return the found velocities
     return cartParticleVelocities, polarParticleVelocities
@@ -76,56 +230,228 @@ def getVelocitiesFromPositions(positions: np.array, flowData: SimFlowFuncs) -> l
 # Returns an array of poistions from flow data and converts all velocity types to cartesian
 
 
-def getVelocitiesFromPositionsCartConverted(postions: np.array, flowData: SimFlowFuncs) -> np.array:
+def getVelocitiesFromPositionsCartConverted(postions: np.array, flowData: SimFlowFuncs, out=None,
+                                            scratch=None) -> np.array:
+
+    # Velocities are written into out when given, scratch is an optional contiguous (_conversionScratchRows, 2,
+    # numParticles) array that is overwritten
+    if out is None:
+        out = np.empty(postions.shape, dtype=postions.dtype)
+    if scratch is None:
+        scratch = np.empty((_conversionScratchRows,) + postions.shape, dtype=postions.dtype)
+
+    coordinates = Coordinates(postions, buffer=scratch[1:3].reshape(4, -1))
 
     # Find new velocities of particles
     cartParticleVelocities, polarParticleVelocities = getVelocitiesFromPositions(
 
         positions=postions,
-        flowData=flowData
+        flowData=flowData,
+        out=(out, scratch[0]),
+        coordinates=coordinates
     )
 
     # Get overall velocities
     particleVelocities = cartParticleVelocities
-    particleVelocities += _polVeltoCartVel(*postions, *polarParticleVelocities)
+    if _hasPolarFlow(flowData):
+        with phase("conversion.polar"):
+            particleVelocities += _polVeltoCartVel(coordinates, *polarParticleVelocities,
+                                                   out=scratch[3], scratch=scratch[4, 0])
 
     return particleVelocities
 
 
+# Velocities of the particles at positions as the change in position per iteration (at the start of a step), worked out
+# in blocks so that the temporary memory stays within the evaluation memory like advancePositions
+def frameVelocities(positions: np.array, flowData: SimFlowFuncs, setupData: SimSetupData, out=None) -> np.array:
+
+    if out is None:
+        out = np.empty(positions.shape, dtype=positions.dtype)
+
+    blockSize = evaluationBlockSize(setupData)
+    for start in range(0, positions.shape[1], blockSize):
+        block = positions[:, start:start + blockSize]
+        out[:, start:start + blockSize] = getVelocitiesFromPositionsCartConverted(block, flowData) * setupData.timeStep
+
+    return out
+
+
+# Stores the velocities at the stored frames that don't have them yet (such as the initial dye), used to reconstruct
+# the iterations between frames when only every storeEvery-th iteration is stored
+def storeFrameVelocities(particleData: ParticleData, flowData: SimFlowFuncs, setupData: SimSetupData):
+
+    if particleData.storeEvery == 1:
+        return
+
+    frames = particleData.positions
+    stored = 0 if particleData.frameVelocities is None else len(particleData.frameVelocities)
+    for frame in range(stored, len(frames)):
+        particleData.appendFrameVelocities(frameVelocities(frames[frame], flowData, setupData))
+
+
 def iterateParticles(particleData: ParticleData, flowData: SimFlowFuncs, setupData: SimSetupData):
 
-    new_positions = particleData.positions[-1].copy()
+    with phase("iterate"):
+
+        # The new positions are written straight into the next frame of the trajectory (when the iteration is stored)
+        iteration = particleData.numIterations + 1
+        with phase("trajectory.store"):
+            new_positions = particleData.nextPositions()
+
+        _, particleData.velocities, particleData.stepSizes = advancePositions(
+            positions=particleData.latestPositions,
+            flowData=flowData,
+            setupData=setupData,
+            stepSizes=particleData.stepSizes,
+            out=new_positions
+        )
+
+        # The velocities at a stored frame are added before it, so a frame that can be seen always has them
+        if particleData.storeEvery > 1 and particleData.isStored(iteration):
+            with phase("trajectory.velocities"):
+                storeFrameVelocities(particleData, flowData, setupData)
+                particleData.appendFrameVelocities(frameVelocities(new_positions, flowData, setupData))
+
+        # Update particleData positions to have latest set
+        particleData.commitPositions(new_positions)
+
+    count("iterations")
+    count("particleSteps", new_positions.shape[1])
+
+
+# Number of particles advanced together, small enough that a block's arrays stay in cache (and within the memory cap)
+def evaluationBlockSize(setupData: SimSetupData) -> int:
+
+    blockSize = setupData.blockSize
+    if setupData.maxEvaluationMemory is not None:
+        blockSize = min(blockSize, setupData.maxEvaluationMemory // _bytesPerParticle)
+
+    return max(int(blockSize), 1)
+
+
+# Advances the positions one time step, returns the new positions, velocities and adaptive step sizes
+def advancePositions(positions: np.array, flowData: SimFlowFuncs, setupData: SimSetupData, stepSizes=None, out=None):
+
+    if setupData.integrator != "euler" and setupData.integrator not in integrators:
+        raise ValueError(
+            f"Unknown integrator {setupData.integrator}, choose from euler, {', '.join(integrators)}")
+
+    numParticles = positions.shape[1]
+    blockSize = min(evaluationBlockSize(setupData), max(numParticles, 1))
+
+    # New positions are written into out (which must not overlap positions), everything is worked out in the precision
+    # of the positions (the adaptive step sizes and clocks are always kept in float64)
+    if out is None:
+        out = np.empty(positions.shape, dtype=positions.dtype)
+    velocities = np.empty(positions.shape, dtype=positions.dtype)
+    new_stepSizes = None
+
+    # Particles are independent, so each block is taken through the whole step before moving onto the next one. The
+    # scratch arrays of a block are taken from the start of one buffer so they are contiguous for the last (shorter)
+    # block too
+    scratchRows = _eulerScratchRows if setupData.integrator == "euler" else \
+        integratorScratchRows[setupData.integrator] + _conversionScratchRows
+    scratch = np.empty(scratchRows * 2 * blockSize, dtype=positions.dtype)
+    for start in range(0, numParticles, blockSize):
+        end = min(start + blockSize, numParticles)
+        blockScratch = scratch[:scratchRows * 2 * (end - start)].reshape(scratchRows, 2, end - start)
+
+        if setupData.integrator == "euler":
+            _advanceBlockEuler(positions[:, start:end], flowData, setupData,
+                               out[:, start:end], velocities[:, start:end], blockScratch)
+            continue
+
+        blockPositions, blockVelocities, blockStepSizes = _advanceBlockIntegrator(
+            positions[:, start:end], flowData, setupData,
+            None if stepSizes is None else stepSizes[start:end], blockScratch)
+
+        out[:, start:end] = blockPositions
+        velocities[:, start:end] = blockVelocities
+
+        if blockStepSizes is not None:
+            if new_stepSizes is None:
+                new_stepSizes = np.empty(numParticles)
+            new_stepSizes[start:end] = blockStepSizes
+
+    return out, velocities, new_stepSizes
+
+
+# Advance a block with Euler substeps, the scratch arrays are reused for every substep
+def _advanceBlockEuler(positions: np.array, flowData: SimFlowFuncs, setupData: SimSetupData,
+                       out: np.array, velocities: np.array, scratch: np.array):
+
+    cartParticleVelocities, polarParticleVelocities, increment = scratch[:3]
+    conversionScratch = scratch[5, 0]
+    subtimeSteps = subtimeStepCount(setupData)
+    subtimeStep = setupData.timeStep / subtimeSteps
+    useCartesian = _hasCartesianFlow(flowData)
+    usePolar = _hasPolarFlow(flowData)
+
+    new_positions = out
+    new_positions[:] = positions
+
+    # r, theta, cos, sin of the particles (kept between substeps when only moved in polar coordinates)
+    coordinates = Coordinates(new_positions, buffer=scratch[3:5].reshape(4, -1))
 
     # Run for each substep in the iteration
-    for _ in range(setupData.subtimeSteps):
+    for _ in range(subtimeSteps):
         # Find new velocities of particles
-        cartParticleVelocities, polarParticleVelocities = getVelocitiesFromPositions(
+        getVelocitiesFromPositions(
             positions=new_positions,
-            flowData=flowData
+            flowData=flowData,
+            out=(cartParticleVelocities, polarParticleVelocities),
+            coordinates=coordinates
         )
 
         # Iterate the cartesian positions
-        new_positions += cartParticleVelocities * \
-            (setupData.timeStep / setupData.subtimeSteps)
+        if useCartesian:
+            new_positions += np.multiply(cartParticleVelocities,
+                                         subtimeStep, out=increment)
+            coordinates.moved()
 
         # Iterate the Polar coordinates
-        if flowData.vr and flowData.vtheta:  # Use if for performance
-            particlePositionsPolar = _posToPol(*new_positions)
-            particlePositionsPolar += polarParticleVelocities * \
-                (setupData.timeStep / setupData.subtimeSteps)
-            new_positions = _polToPos(*particlePositionsPolar)
-
-        # Get overall velocities
-        particleData.velocities = cartParticleVelocities
-
-        if flowData.vr and flowData.vtheta:  # Use if for performance
-            particleData.velocities += _polVeltoCartVel(
-                *new_positions, *polarParticleVelocities)
-
-    # Update particleData positions to have latest set
-    particleData.positions = np.append(particleData.positions,
-                                       np.expand_dims(new_positions, axis=0),
-                                       axis=0)
-
-    # Append the particle data to history
-    particleData.positionHistory.append(new_positions)
+        if usePolar:  # Use if for performance
+            with phase("conversion.polar"):
+                np.multiply(polarParticleVelocities, subtimeStep, out=increment)
+                coordinates.movePolar(*increment)
+
+    # Get overall velocities
+    velocities[:] = cartParticleVelocities
+
+    if usePolar:
+        with phase("conversion.polar"):
+            velocities += _polVeltoCartVel(coordinates, *polarParticleVelocities,
+                                           out=increment, scratch=conversionScratch)
+
+
+# Advance a block using one of the integrators from integrators.py, its stages and the velocity evaluations are kept
+# in scratch (the integrator's rows, then the rows of getVelocitiesFromPositionsCartConverted). The positions and
+# velocities returned are views of scratch
+def _advanceBlockIntegrator(positions: np.array, flowData: SimFlowFuncs, setupData: SimSetupData, stepSizes=None,
+                            scratch=None):
+
+    integratorRows = integratorScratchRows[setupData.integrator]
+    if scratch is None:
+        scratch = np.empty((integratorRows + _conversionScratchRows,) + positions.shape, dtype=positions.dtype)
+
+    # The adaptive integrator evaluates fewer particles as they finish, so the evaluation scratch is packed to match
+    conversionScratch = scratch[integratorRows:].reshape(-1)
+
+    def velocityFunc(positions, out):
+        numPoints = positions.shape[1]
+        return getVelocitiesFromPositionsCartConverted(
+            postions=positions,
+            flowData=flowData,
+            out=out,
+            scratch=conversionScratch[:_conversionScratchRows * 2 * numPoints].reshape(
+                _conversionScratchRows, 2, numPoints)
+        )
+
+    return integrators[setupData.integrator](
+        positions=positions,
+        velocityFunc=velocityFunc,
+        timeStep=setupData.timeStep,
+        setupData=setupData,
+        stepSizes=stepSizes,
+        scratch=scratch[:integratorRows]
+    )
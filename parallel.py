@@ -0,0 +1,240 @@
+import multiprocessing
+from multiprocessing import shared_memory
+import pickle
+import weakref
+
+import numpy as np
+import numba
+
+from structs import SimFlowFuncs, ParticleData, SimSetupData
+from iterator import advancePositions, frameVelocities, storeFrameVelocities
+import instrumentation
+from instrumentation import phase, count
+
+try:
+    import cloudpickle
+except ImportError:
+    cloudpickle = None
+
+
+# Number of shards given to each worker (more shards than workers balances uneven work such as adaptive steps)
+shardsPerWorker = 4
+
+# Flow and setup of this worker process, set once by _initWorker
+_workerFlowData = None
+_workerSetupData = None
+
+
+def _initWorker(payload, pickled: bool):
+
+    global _workerFlowData, _workerSetupData
+
+    # Lambdas can't be pickled normally so are sent with cloudpickle (not needed with fork)
+    if pickled:
+        payload = pickle.loads(payload)
+    _workerFlowData, _workerSetupData = payload
+
+    # Anything recorded in the workers would be lost (only the main process is profiled)
+    instrumentation._activeProfiler = None
+
+    # Parallelism comes from the processes, so each one keeps numba to a single thread
+    numba.set_num_threads(1)
+
+
+# Flow and setup handed to this worker process by workerPool
+def workerFlow():
+    return _workerFlowData, _workerSetupData
+
+
+# Whether worker processes can be forked from this one, switching numba to its fork safe threading layer if it
+# hasn't started yet (forking after the tbb or omp layers have started hangs or aborts)
+def forkSafeThreading() -> bool:
+
+    if "fork" not in multiprocessing.get_all_start_methods():
+        return False
+
+    try:
+        return numba.threading_layer() == "workqueue"
+    except ValueError:  # No parallel kernel has run yet
+        numba.config.THREADING_LAYER = "workqueue"
+        return True
+
+
+# Pool of processes, forked when that is safe (see forkSafeThreading) and spawned otherwise, with a finalizer that
+# terminates it (also called when the pool is garbage collected or the interpreter exits). With flowData the workers
+# are handed the flow and setup (see workerFlow): forked workers inherit them, otherwise they are sent once per worker
+# with cloudpickle (lambdas can't be pickled normally). Otherwise each worker runs initializer(*initargs)
+def workerPool(workers: int, flowData: SimFlowFuncs = None, setupData: SimSetupData = None, initializer=None,
+               initargs: tuple = ()):
+
+    fork = forkSafeThreading()
+    context = multiprocessing.get_context("fork" if fork else "spawn")
+
+    if flowData is not None:
+        initializer = _initWorker
+        if fork:
+            initargs = ((flowData, setupData), False)
+        elif cloudpickle is not None:
+            initargs = (cloudpickle.dumps((flowData, setupData)), True)
+        else:
+            raise ImportError(
+                "cloudpickle is needed to send the flow to worker processes on this platform "
+                "(or once numba has started a threading layer other than workqueue)")
+
+    pool = context.Pool(workers, initializer=initializer, initargs=initargs)
+    return pool, weakref.finalize(pool, pool.terminate)
+
+
+# Attach to a shared memory block without the worker taking ownership of it
+def _attachSharedMemory(name: str):
+
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13
+        pass
+
+    # Registering it isn't skipped so is switched off while attaching (unregistering it afterwards would also remove
+    # the creator's registration when the worker shares the creator's resource tracker)
+    from multiprocessing import resource_tracker
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+# Frames of a trajectory shared by another process (see Trajectory.sharedLocation), with the block of shared memory to
+# close once done with them (None for a file, which is unmapped with the frames)
+def attachFrames(location, shape, dtype):
+
+    kind, name = location
+    if kind == "file":
+        return np.memmap(name, dtype=dtype, mode="r+", shape=shape), None
+
+    sharedMemory = _attachSharedMemory(name)
+    return np.ndarray(shape, dtype=dtype, buffer=sharedMemory.buf), sharedMemory
+
+
+# Advance particles start to end for numIter iterations, writing each stored frame (and the velocities at it when only
+# every storeEvery-th iteration is stored) into the shared trajectory. Starts from positions when the latest iteration
+# isn't stored
+def _advanceShard(task):
+
+    framesSource, velocitiesSource, storeEvery, firstIteration, numIter, start, end, stepSizes, positions = task
+
+    frames, sharedMemory = attachFrames(*framesSource)
+    velocityFrames, velocitiesMemory = (None, None) if velocitiesSource is None else attachFrames(*velocitiesSource)
+    try:
+        if positions is None:
+            positions = frames[firstIteration // storeEvery, :, start:end]
+
+        for iteration in range(firstIteration + 1, firstIteration + numIter + 1):
+            stored = iteration % storeEvery == 0
+            out = frames[iteration // storeEvery, :, start:end] if stored else np.empty_like(positions)
+
+            _, velocities, stepSizes = advancePositions(
+                positions=positions,
+                flowData=_workerFlowData,
+                setupData=_workerSetupData,
+                stepSizes=stepSizes,
+                out=out
+            )
+
+            if stored and velocityFrames is not None:
+                frameVelocities(out, _workerFlowData, _workerSetupData,
+                                out=velocityFrames[iteration // storeEvery, :, start:end])
+            positions = out
+
+        # Positions after the last iteration are sent back when they aren't stored
+        latestPositions = None if stored else positions
+        del frames, velocityFrames, positions, out
+    finally:
+        if sharedMemory is not None:
+            sharedMemory.close()
+        if velocitiesMemory is not None:
+            velocitiesMemory.close()
+
+    return start, end, velocities, stepSizes, latestPositions
+
+
+# Iterates particles in a pool of processes, each working on a shard of the particles
+class ParallelIterator():
+
+    def __init__(self, flowData: SimFlowFuncs, setupData: SimSetupData, workers: int):
+
+        self.flowData = flowData
+        self.setupData = setupData
+        self.workers = workers
+        self.pool, self._finalizer = workerPool(workers, flowData, setupData)
+
+    def close(self):
+        self._finalizer()
+
+    # Iterate the particles numIter steps, results are written in place into the trajectory
+    def iterate(self, particleData: ParticleData, numIter: int):
+
+        if numIter == 0:
+            return
+
+        with phase("iterate"):
+            self._iterate(particleData, numIter)
+
+        count("iterations", numIter)
+        count("particleSteps", numIter * particleData.positions.shape[2])
+
+    def _iterate(self, particleData: ParticleData, numIter: int):
+
+        # Velocities at the frames already stored (the initial dye) are added here, the workers add those of the new
+        # frames
+        storeFrameVelocities(particleData, self.flowData, self.setupData)
+
+        # The frames for the whole run are allocated in shared memory (or on disk) up front
+        particleData.reserveIterations(numIter, shared=True)
+        trajectory = particleData.trajectory
+        buffer = trajectory._buffer
+        framesSource = (trajectory.sharedLocation, buffer.shape, buffer.dtype.str)
+
+        storeEvery = particleData.storeEvery
+        velocitiesSource = None
+        if storeEvery > 1:
+            velocityStore = particleData.frameVelocities
+            velocitiesSource = (velocityStore.sharedLocation, velocityStore._buffer.shape,
+                                velocityStore._buffer.dtype.str)
+
+        numParticles = buffer.shape[2]
+        bounds = np.linspace(0, numParticles, self.workers * shardsPerWorker + 1).astype(int)
+        stepSizes = particleData.stepSizes
+        # Iterations are counted from the first stored frame in the workers
+        iteration = particleData.numIterations - particleData.firstIteration
+        tail = None if iteration % storeEvery == 0 else particleData.latestPositions
+
+        tasks = [
+            (framesSource, velocitiesSource, storeEvery, iteration, numIter, start, end,
+             None if stepSizes is None else stepSizes[start:end], None if tail is None else tail[:, start:end])
+            for start, end in zip(bounds[:-1], bounds[1:]) if end > start
+        ]
+
+        velocities = np.zeros((2, numParticles), dtype=buffer.dtype)
+        newStepSizes = None
+        latestPositions = None
+        for start, end, shardVelocities, shardStepSizes, shardPositions in self.pool.imap_unordered(
+                _advanceShard, tasks):
+            velocities[:, start:end] = shardVelocities
+
+            if shardStepSizes is not None:
+                if newStepSizes is None:
+                    newStepSizes = np.zeros(numParticles)
+                newStepSizes[start:end] = shardStepSizes
+
+            if shardPositions is not None:
+                if latestPositions is None:
+                    latestPositions = np.empty((2, numParticles), dtype=buffer.dtype)
+                latestPositions[:, start:end] = shardPositions
+
+        # The velocities of the new frames are committed first, so a frame that can be seen always has them
+        if velocitiesSource is not None:
+            particleData.frameVelocities.commitFrames((iteration + numIter) // storeEvery - iteration // storeEvery)
+        particleData.commitIterations(numIter, latestPositions)
+        particleData.velocities = velocities
+        particleData.stepSizes = newStepSizes
@@ -1,6 +1,11 @@
 import matplotlib.pyplot as plt
 from matplotlib.widgets import Slider
-import mpl_interactions.ipyplot as iplt
+from matplotlib.backend_bases import TimerBase
+from matplotlib.collections import LineCollection
+from matplotlib.patches import FancyArrowPatch
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.colors import to_rgba
 
 from dataclasses import dataclass
 from time import gmtime, strftime
@@ -8,8 +13,15 @@ import os
 
 import numpy as np
 
-from structs import ParticleData, SimFlowFuncs, PlottingData
+from structs import ParticleData, SimFlowFuncs, PlottingData, SimSetupData, precisionDtype
 from iterator import getVelocitiesFromPositionsCartConverted
+from instrumentation import phase, count
+from frameCache import FrameCache
+from flowMapCache import flowMapCache, cacheKey, streamlineCacheKey
+from streamlines import contourStreamlines, traceStreamlines
+from animationExport import renderAnimation
+from densityRaster import DyeRaster
+from backwardMap import dyeRegionImage
 
 
 @dataclass
@@ -24,6 +36,9 @@ class Plotting():
     # The data used to aid with plot formatting
     plottingData: PlottingData
 
+    # The data the particles were simulated with (needed to trace the dye regions back)
+    setupData: SimSetupData = None
+
     # Pre-processing step auto run after init
     def __post_init__(self):
 
@@ -38,9 +53,69 @@ class Plotting():
         self.yMax = self.plottingData.plotCenter[1] + \
             self.plottingData.plotSimWidth * 0.5
 
+    # How long the dye has been simulated for, as put in the legend (in iterations if the time step isn't known)
+    def _timePastLabel(self, timeStep: float = None) -> str:
+
+        if timeStep is None and self.setupData is not None:
+            timeStep = self.setupData.timeStep
+
+        if timeStep is None:
+            return f"{self.particleData.numIterations} iterations"
+
+        return f"{self.particleData.timePast(timeStep):g}s"
+
+    # Key of the flow map in the flow map cache (None if the flow has no fingerprint so can't be cached)
+    def _flowMapKey(self):
+
+        if not self.plottingData.cacheFlowMaps or self.flowData.fingerprint is None:
+            return None
+
+        return cacheKey(self.flowData.fingerprint, float(self.xMin), float(self.xMax), float(self.yMin),
+                        float(self.yMax), self.plottingData.flowMapResolution, self.plottingData.minVelocity,
+                        self.plottingData.maxVelocity, self._precision().str)
+
+    # Floating point type the flow map velocities are kept in, that of the simulation (see SimSetupData.precision)
+    def _precision(self) -> np.dtype:
+        return np.dtype(np.float64) if self.setupData is None else precisionDtype(self.setupData.precision)
+
+    # Looks a flow map or streamlines up in the cache (counted by the profiler)
+    def _cached(self, key):
+
+        entry = flowMapCache.get(key, useDisk=self.plottingData.cacheFlowMapsOnDisk)
+        count("flowMapCacheHits" if entry is not None else "flowMapCacheMisses")
+
+        return entry
+
     # Gets an array of flow data (used by stream plots)
     def _getFlowMap(self):
 
+        with phase("flowMap"):
+
+            key = self._flowMapKey()
+            if key is None:
+                return self._computeFlowMap()
+
+            entry = self._cached(key)
+            if entry is None:
+                xsMatrix, ysMatrix, vxsMatrix, vysMatrix = self._computeFlowMap()
+                entry = {"xs": xsMatrix, "ys": ysMatrix, "vxs": vxsMatrix, "vys": vysMatrix}
+                flowMapCache.put(key, entry, useDisk=self.plottingData.cacheFlowMapsOnDisk)
+
+            return entry["xs"], entry["ys"], entry["vxs"], entry["vys"]
+
+    def _computeFlowMap(self):
+
+        # Reuse the grid the flow was sampled on for the simulation
+        sampledField = self.flowData.sampledField
+        if sampledField is not None and sampledField.matchesGrid(
+                self.xMin, self.xMax, self.yMin, self.yMax, self.plottingData.flowMapResolution):
+
+            return (sampledField.xsMatrix, sampledField.ysMatrix,
+                    np.clip(sampledField.vxGrid, self.plottingData.minVelocity,
+                            self.plottingData.maxVelocity).astype(self._precision(), copy=False),
+                    np.clip(sampledField.vyGrid, self.plottingData.minVelocity,
+                            self.plottingData.maxVelocity).astype(self._precision(), copy=False))
+
         # Create divisions for the coodinates in x direction
         Xcoords = np.linspace(
             start=self.xMin,
@@ -77,84 +152,376 @@ class Plotting():
         vys = np.clip(vys, self.plottingData.minVelocity,
                       self.plottingData.maxVelocity)
 
-        # Reshape velocity outputs into matrices
-        vxsMatrix = vxs.reshape(xsMatrix.shape)
-        vysMatrix = vys.reshape(ysMatrix.shape)
+        # Reshape velocity outputs into matrices (the grid stays float64 so that its spacing stays even)
+        vxsMatrix = vxs.reshape(xsMatrix.shape).astype(self._precision(), copy=False)
+        vysMatrix = vys.reshape(ysMatrix.shape).astype(self._precision(), copy=False)
 
         # Return the calculated values
         return xsMatrix, ysMatrix, vxsMatrix, vysMatrix
 
+    # How the streamlines are found, "auto" uses the stream function contours when the flow has a stream function
+    def _streamlineMethod(self):
+
+        method = self.plottingData.streamlineMethod
+        if method == "auto":
+            return "contour" if self.flowData.psi is not None else "trace"
+
+        if method not in ("contour", "trace", "streamplot"):
+            raise ValueError(
+                f"Unknown streamline method {method}, choose from auto, contour, trace or streamplot")
+        if method == "contour" and self.flowData.psi is None:
+            raise ValueError("The contour streamline method needs a flow with a stream function (psi)")
+
+        return method
+
+    # Streamlines of the flow map, faster flow -> thicker line (drawn from the cache when the same streamlines have
+    # been found before)
+    def _plotStreamlines(self, ax, streamlineWidth):
+
+        method = self._streamlineMethod()
+
+        flowMapKey = self._flowMapKey()
+        if flowMapKey is None:
+            self._integrateStreamlines(ax, streamlineWidth, method)
+            return
+
+        key = streamlineCacheKey(flowMapKey, method, streamlineWidth, self.plottingData.streamLinesPlotDensity,
+                                 self.plottingData.brokenStreamlines)
+        entry = self._cached(key)
+
+        if entry is None:
+            entry = self._integrateStreamlines(ax, streamlineWidth, method)
+            flowMapCache.put(key, entry, useDisk=self.plottingData.cacheFlowMapsOnDisk)
+            return
+
+        with phase("streamlines"):
+            self._drawStreamlines(ax, entry)
+
+    # Draws streamline arrays the same way as plt.streamplot draws its streamlines
+    def _drawStreamlines(self, ax, entry):
+
+        lineStarts = entry["lineStarts"]
+        lines = LineCollection([entry["points"][start:end] for start, end in zip(lineStarts[:-1], lineStarts[1:])],
+                               linewidths=entry["linewidths"], colors="k", zorder=2)
+        lines.sticky_edges.x[:] = [self.xMin, self.xMax]
+        lines.sticky_edges.y[:] = [self.yMin, self.yMax]
+        ax.add_collection(lines)
+
+        for tail, head, linewidth in zip(entry["arrowTails"], entry["arrowHeads"], entry["arrowLinewidths"]):
+            ax.add_patch(FancyArrowPatch(tuple(tail), tuple(head), arrowstyle="-|>", mutation_scale=10,
+                                         color="k", linewidth=linewidth, zorder=2))
+
+        ax.autoscale_view()
+
+    # Finds and draws the streamlines, returns them as arrays for the cache
+    def _integrateStreamlines(self, ax, streamlineWidth, method):
+
+        # Pre-calculations
+        x, y, v_x, v_y = self._getFlowMap()
+        flowSpeed = np.sqrt(v_x**2 + v_y**2)
+        # Faster flow -> Thicker line
+        streamlineWidth *= flowSpeed / np.max(flowSpeed)
+
+        with phase("streamlines"):
+
+            if method == "contour":
+                entry = contourStreamlines(x, y, self.flowData.psi(x, y), v_x, v_y, streamlineWidth,
+                                           self.plottingData.streamLinesPlotDensity)
+                self._drawStreamlines(ax, entry)
+                return entry
+
+            if method == "trace":
+                entry = traceStreamlines(x, y, v_x, v_y, streamlineWidth, self.plottingData.streamLinesPlotDensity,
+                                         self.plottingData.brokenStreamlines)
+                self._drawStreamlines(ax, entry)
+                return entry
+
+            stream = ax.streamplot(x, y, v_x, v_y,
+                                   density=self.plottingData.streamLinesPlotDensity,
+                                   linewidth=streamlineWidth,
+                                   broken_streamlines=self.plottingData.brokenStreamlines,
+                                   color="k"
+                                   )
+
+        # plt.streamplot draws every segment (pair of points) as its own line, a streamline ends where the next
+        # segment doesn't start at the end of the last one
+        segments = np.array(stream.lines.get_segments(), dtype=np.float64).reshape(-1, 2, 2)
+        linewidths = np.broadcast_to(np.asarray(stream.lines.get_linewidths(), dtype=np.float64), (len(segments),))
+        lineEnds = np.flatnonzero(np.any(segments[1:, 0] != segments[:-1, 1], axis=1)) + 1
+        bounds = np.concatenate(([0], lineEnds, [len(segments)])) if len(segments) else np.zeros(1, dtype=np.int64)
+
+        # Its arrow patches don't give their ends, so the arrows are placed again the way it places them (from the
+        # point half way along each streamline towards the next one)
+        arrowTails, arrowHeads, arrowLinewidths = [], [], []
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            line = np.concatenate((segments[start:end, 0], segments[end - 1:end, 1]))
+            distance = np.cumsum(np.hypot(*np.diff(line, axis=0).T))
+            index = np.searchsorted(distance, distance[-1] / 2)
+
+            arrowTails.append(line[index])
+            arrowHeads.append(line[index:index + 2].mean(axis=0))
+            arrowLinewidths.append(linewidths[start + index])
+
+        return {
+            "points": segments.reshape(-1, 2),
+            "lineStarts": np.arange(0, 2 * len(segments) + 1, 2),
+            "linewidths": np.array(linewidths),
+            "arrowTails": np.array(arrowTails, dtype=np.float64).reshape(-1, 2),
+            "arrowHeads": np.array(arrowHeads, dtype=np.float64).reshape(-1, 2),
+            "arrowLinewidths": np.array(arrowLinewidths, dtype=np.float64)
+        }
+
+    # Finding the best legend location checks every plotted point, which takes seconds for millions of particles
+    def _legendLocation(self):
+        return "best" if self.particleData.positions.shape[2] <= self.plottingData.bestLegendMaxParticles \
+            else "upper right"
+
+    # Whether the dye is drawn as an image (see densityRaster.py) rather than as markers and lines
+    def _rasterizeDye(self):
+
+        dyeRendering = self.plottingData.dyeRendering
+        if dyeRendering not in ("auto", "vector", "raster"):
+            raise ValueError(f"Unknown dye rendering {dyeRendering}, choose from auto, vector or raster")
+
+        return dyeRendering == "raster" or (
+            dyeRendering == "auto" and self.particleData.positions.shape[2] > self.plottingData.rasterMinParticles)
+
+    # Image of the dye over the plot area, with one pixel per pixel of the axes at dpi (lines as wide as plotted lines
+    # and particles as wide as the 1 point markers of the scatter)
+    def _dyeRaster(self, ax, dpi, **imshowArgs):
+
+        _, _, width, height = ax.get_position().bounds
+        figureWidth, figureHeight = ax.figure.get_size_inches()
+        shape = (max(round(height * figureHeight * dpi), 1), max(round(width * figureWidth * dpi), 1))
+
+        pixelsPerPoint = dpi / 72
+        lineWidth = max(round(plt.rcParams["lines.linewidth"] * pixelsPerPoint), 1)
+        markerSize = max(round(pixelsPerPoint), 1)
+
+        return DyeRaster(ax, (self.xMin, self.xMax, self.yMin, self.yMax), shape, self.particleData.shapeStarts,
+                         self.plottingData.rasterAntialias, lineWidth, markerSize, **imshowArgs)
+
+    # Empty lines standing in for the rasterized dye in the legend, in the colours the dye is drawn in. Returns the
+    # layers in drawing order as (isInitialDye, color, isLine)
+    def _rasterDyeLegend(self, ax, dyeLineLabel, dyeLabel):
+
+        layers = []
+        if self.plottingData.plotInitLine:
+            layers.append((True, ax.plot([], [], label="Inital dye")[0].get_color(), True))
+
+        if self.plottingData.plotFinalLine:
+            layers.append((False, ax.plot([], [], label=dyeLineLabel)[0].get_color(), True))
+
+        if self.plottingData.plotInitPoints:
+            ax.plot([], [], linestyle="none", marker="s", markersize=1, color="g", label="Inital dye")
+            layers.append((True, "g", False))
+
+        if self.plottingData.plotFinalPoints:
+            ax.plot([], [], linestyle="none", marker="s", markersize=1, color="r", label=dyeLabel)
+            layers.append((False, "r", False))
+
+        return layers
+
+    # Where the rectangle and circle dyes have been carried to after the frames simulated so far (see backwardMap.py),
+    # drawn under the particles
+    def _plotFinalRegion(self, ax, color="r", alpha=0.4):
+
+        if len(self.particleData.dyeRegions) == 0:
+            return
+        if self.setupData is None:
+            raise ValueError("The setupData the dye was simulated with is needed to plot the final dye region")
+
+        resolution = self.plottingData.finalRegionResolution
+        shape = (max(round(resolution * (self.yMax - self.yMin) / (self.xMax - self.xMin)), 1), resolution)
+
+        region = dyeRegionImage(self.particleData.dyeRegions, self.flowData, self.setupData,
+                                self.particleData.numIterations, (self.xMin, self.xMax, self.yMin, self.yMax),
+                                shape, self.setupData.workers)
+
+        image = np.zeros(shape + (4,))
+        image[region] = to_rgba(color, alpha)
+        ax.imshow(image, extent=(self.xMin, self.xMax, self.yMin, self.yMax), origin="lower",
+                  interpolation="bilinear", aspect=ax.get_aspect())
+
+        ax.fill([], [], color=color, alpha=alpha, label=f"Dye region after {self._timePastLabel()}")
+
     # Saves the plot with correct structure
     def _savePlot(self):
 
+        # Save the plot
+        plt.savefig(fname=self._plotPath(self.plottingData.plotSaveType), dpi=self.plottingData.plotSaveDpi)
+
+    # Path for a new plot with the given file extension (in a folder for the hour)
+    def _plotPath(self, saveType: str):
+
         # Get path names
         dateHour = strftime(self.plottingData.plotFolderFormat, gmtime())
         dateHourFolder = os.path.join("plots", dateHour)
         plotPath = os.path.join(
-            "plots", dateHour, f"{strftime(self.plottingData.plotFileFormat, gmtime())}.{self.plottingData.plotSaveType}")
+            "plots", dateHour, f"{strftime(self.plottingData.plotFileFormat, gmtime())}.{saveType}")
 
         # Check plot path exists (if not make it)
         if not os.path.exists(dateHourFolder):
             os.makedirs(dateHourFolder)
 
-        # Save the plot
-        plt.savefig(fname=plotPath, dpi=800)
+        return plotPath
+
+    # Static layer of the animation (everything but the moving dye) drawn once with the Agg backend, and what the
+    # renderers need to draw the dye over it in the same place (see animationExport.FrameRenderer)
+    def _animationLayout(self, streamlineWidth=2):
+
+        fig = Figure(dpi=self.plottingData.animationDpi)
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot()
+
+        self._plotStreamlines(ax, streamlineWidth)
+
+        if self.plottingData.plotInitLine:
+            ax.plot(*self.particleData.positions[0], label="Inital dye")
+
+        # The dye lines are left empty in the static layer (they are only there for the legend)
+        dyeArtists = []
+        if self.plottingData.plotFinalLine:
+            dyeArtists += ax.plot([], [], label="Dye line")
+
+        if self.plottingData.plotInitPoints:
+            ax.plot(*self.particleData.positions[0], linestyle="none",
+                    marker=",", color="g", label="Inital dye")
+
+        if self.plottingData.plotFinalPoints:
+            dyeArtists += ax.plot([], [], linestyle="none", marker=",", color="r", label="Dye")
+
+        ax.set_xlim(self.xMin, self.xMax)
+        ax.set_ylim(self.yMin, self.yMax)
+
+        if self.plottingData.includeGird:
+            ax.grid()
+        if self.plottingData.inlcudeLegend:
+            ax.legend(loc=self._legendLocation())
+        if self.plottingData.includeXLabel:
+            ax.set_xlabel(self.plottingData.xLabel)
+        if self.plottingData.includeYLabel:
+            ax.set_ylabel(self.plottingData.yLabel)
+
+        fig.canvas.draw()
+
+        return {
+            "size": tuple(fig.get_size_inches()),
+            "dpi": fig.dpi,
+            "background": np.asarray(fig.canvas.buffer_rgba()).copy(),
+            "axesPosition": ax.get_position().bounds,
+            "xLimits": ax.get_xlim(),
+            "yLimits": ax.get_ylim(),
+            "styles": [{"color": artist.get_color(), "linestyle": artist.get_linestyle(),
+                        "linewidth": artist.get_linewidth(), "marker": artist.get_marker(),
+                        "markersize": artist.get_markersize(), "zorder": artist.get_zorder()}
+                       for artist in dyeArtists]
+        }
+
+    # Renders the dye at the iterations frameIndices (every iteration simulated by default) as an animation with the
+    # Agg backend, without a window. The type is from the extension of path (see animationExport.renderAnimation), a
+    # new file in plots by default. Returns the time taken per frame
+    def exportAnimation(self, path: str = None, frameIndices=None, fps: float = None, workers: int = None,
+                        streamlineWidth=2) -> dict:
+
+        if path is None:
+            path = self._plotPath(self.plottingData.animationSaveType)
+        if frameIndices is None:
+            frameIndices = range(self.particleData.firstIteration, self.particleData.numIterations + 1)
+        if fps is None:
+            fps = self.plottingData.animationFps
+        if workers is None:
+            workers = self.plottingData.animationWorkers
+
+        with phase("animation.layout"):
+            layout = self._animationLayout(streamlineWidth)
+
+        return renderAnimation(self.particleData, layout, frameIndices, path, fps, min(workers, len(frameIndices)))
 
     def plotInteractiveParticles(self, streamlineWidth=2, args: dict = {}):
 
-        # Functions used for the interactive plotter
-        def f_x(time): return self.particleData.positionsAtTime(
-            time / args['timeStep'])[0]
-        def f_y(_, time): return self.particleData.positionsAtTime(
-            time / args['timeStep'])[1]
+        # Dye positions (x, y) at a time on the slider
+        frameCache = FrameCache(self.particleData, self.plottingData.frameCacheBytes)
 
-        # Pre-calculations
-        x, y, v_x, v_y = self._getFlowMap()
-        flowSpeed = np.sqrt(v_x**2 + v_y**2)
-        # Faster flow -> Thicker line
-        streamlineWidth *= flowSpeed / np.max(flowSpeed)
+        def positionsAt(time): return frameCache.positionsAtIndex(
+            time / args['timeStep'])
 
         fig, ax = plt.subplots()
         plt.subplots_adjust(bottom=0.25)
 
         # Plotting streamlines
-        stream = plt.streamplot(x, y, v_x, v_y,
-                                density=self.plottingData.streamLinesPlotDensity,
-                                linewidth=streamlineWidth,
-                                broken_streamlines=self.plottingData.brokenStreamlines,
-                                color="k"
-                                )
+        self._plotStreamlines(ax, streamlineWidth)
 
         # Interactive slider setup
+        valmax = self.plottingData.timeSteps_range[1] * args['timeStep']
+
+        # While simulating in the background the slider only reaches the frames done so far
+        if args.get('background'):
+            finalValmax = valmax
+            valmax = min(max(self.particleData.numIterations, 1) * args['timeStep'], finalValmax)
+
+        # Runs carried on from a checkpoint only have the frames from it on
+        valmin = max(self.plottingData.timeSteps_range[0], self.particleData.firstIteration * args['timeStep'])
+
         axfreq = plt.axes([0.15, 0.1, 0.65, 0.03])
         slider = Slider(axfreq,
                         label="Time",
-                        valmin=self.plottingData.timeSteps_range[0],
-                        valmax=self.plottingData.timeSteps_range[1] *
-                        args['timeStep'],
+                        valmin=valmin,
+                        valmax=max(valmax, valmin + args['timeStep']),
                         valstep=args['timeStep'],
-                        valinit=0)
+                        valinit=valmin)
 
-        # Plotting the line data
-        if self.plottingData.plotInitLine:
-            plt.plot(*self.particleData.positions[0],
-                     label=f"Inital dye")
+        if args.get('background'):
+            self._extendSliderTimer = self._startSliderExtension(
+                fig, slider, args['timeStep'], finalValmax, args.get('backgroundSimulation'))
 
-        if self.plottingData.plotFinalLine:
-            controls = iplt.plot(f_x, f_y,
-                                 label=f"Dye line after {self.particleData.timePast()}s",
-                                 time=slider, ax=ax)
+        # Creating the slider made its axes the current ones
+        plt.sca(ax)
 
-        # Plotting the scattering data
-        if self.plottingData.plotInitPoints:
-            plt.scatter(*self.particleData.positions[0],
-                        marker=",", c="g", s=1, label="Inital dye")
+        # Artists moved by the slider
+        dyeArtists = []
+        initialPositions = positionsAt(slider.val)
 
-        if self.plottingData.plotFinalPoints:
-            controls = iplt.scatter(f_x, f_y,
-                                    marker=",", c="r", s=1,
-                                    label=f"Dye line after {self.particleData.timePast()}s",
-                                    time=slider, ax=ax)
+        # Dyes of many particles are drawn as images, the moving dye over an image of the initial dye
+        if self._rasterizeDye():
+            layers = self._rasterDyeLegend(ax, f"Dye line after {self._timePastLabel(args['timeStep'])}",
+                                           f"Dye line after {self._timePastLabel(args['timeStep'])}")
+
+            self._dyeRaster(ax, fig.dpi).update(
+                [(self.particleData.positions[0], color, isLine) for isInitial, color, isLine in layers if isInitial])
+            raster = self._dyeRaster(ax, fig.dpi)
+            dyeArtists.append(raster.image)
+
+            def updateDye(positions):
+                raster.update([(positions, color, isLine) for isInitial, color, isLine in layers if not isInitial])
+
+            updateDye(initialPositions)
+
+        else:
+            # Plotting the line data
+            if self.plottingData.plotInitLine:
+                plt.plot(*self.particleData.positions[0],
+                         label="Inital dye")
+
+            if self.plottingData.plotFinalLine:
+                dyeArtists += ax.plot(*initialPositions,
+                                      label=f"Dye line after {self._timePastLabel(args['timeStep'])}")
+
+            # Plotting the scattering data (as single pixels, much faster to draw than a scatter for many particles)
+            if self.plottingData.plotInitPoints:
+                ax.plot(*self.particleData.positions[0], linestyle="none",
+                        marker=",", color="g", label="Inital dye")
+
+            if self.plottingData.plotFinalPoints:
+                dyeArtists += ax.plot(*initialPositions, linestyle="none",
+                                      marker=",", color="r",
+                                      label=f"Dye line after {self._timePastLabel(args['timeStep'])}")
+
+            def updateDye(positions):
+                for artist in dyeArtists:
+                    artist.set_data(*positions)
+
+        self._connectBlitting(fig, ax, slider, dyeArtists, lambda time: updateDye(positionsAt(time)))
 
         # Setting plot features
 
@@ -166,7 +533,7 @@ class Plotting():
         if self.plottingData.includeGird:
             plt.grid()
         if self.plottingData.inlcudeLegend:
-            plt.legend()
+            plt.legend(loc=self._legendLocation())
         if self.plottingData.includeXLabel:
             plt.xlabel(self.plottingData.xLabel)
         if self.plottingData.includeYLabel:
@@ -178,44 +545,127 @@ class Plotting():
         if self.plottingData.showFigure:
             plt.show()
 
-    def plotParticles(self, streamlineWidth=2):
+    # Moving the slider only redraws the dye and the slider, the rest of the figure is kept as a background image
+    # (captured again on every full draw, e.g. on resizing). updateDye(time) moves the dyeArtists to a time on the
+    # slider
+    def _connectBlitting(self, fig, ax, slider, dyeArtists, updateDye):
 
-        # Setting up how streamlines are plotted
+        sliderArtists = [slider.poly, slider._handle, slider.valtext]
+        for artist in dyeArtists + sliderArtists:
+            artist.set_animated(True)
+        slider.drawon = False
 
-        # Pre-calculations
-        x, y, v_x, v_y = self._getFlowMap()
-        flowSpeed = np.sqrt(v_x**2 + v_y**2)
-        # Faster flow -> Thicker line
-        streamlineWidth *= flowSpeed / np.max(flowSpeed)
+        state = {"background": None, "time": slider.val, "timer": None}
+
+        def drawAnimated():
+            for artist in dyeArtists:
+                ax.draw_artist(artist)
+            for artist in sliderArtists:
+                slider.ax.draw_artist(artist)
+
+        def onDraw(event):
+            state["background"] = fig.canvas.copy_from_bbox(fig.bbox)
+            drawAnimated()
+
+        def render():
+            state["timer"] = None
+
+            updateDye(state["time"])
+
+            if state["background"] is None:
+                fig.canvas.draw_idle()
+                return
+
+            fig.canvas.restore_region(state["background"])
+            drawAnimated()
+            fig.canvas.blit(fig.bbox)
+
+        def onChanged(time):
+            state["time"] = time
+
+            # Slider events arriving while a frame is drawn are merged into one update (without an event loop to
+            # run the timer the frame is drawn straight away)
+            if state["timer"] is None:
+                timer = fig.canvas.new_timer(interval=1)
+                if type(timer) is TimerBase:
+                    render()
+                    return
+
+                timer.single_shot = True
+                timer.add_callback(render)
+                state["timer"] = timer
+                timer.start()
+
+        fig.canvas.mpl_connect("draw_event", onDraw)
+        slider.on_changed(onChanged)
+
+    # Timer that extends the slider as frames are simulated, until it reaches finalValmax or the backgroundSimulation
+    # ends. An error raised by the background simulation stops the timer and is raised again here
+    def _startSliderExtension(self, fig, slider, timeStep, finalValmax, backgroundSimulation=None, interval=200):
+
+        def extend():
+            if backgroundSimulation is not None and backgroundSimulation.error is not None:
+                timer.stop()
+                raise backgroundSimulation.error
+
+            # Checked before the frames are counted so that the last frames are still added
+            finished = backgroundSimulation is not None and not backgroundSimulation.running
+            valmax = min(self.particleData.numIterations * timeStep, finalValmax)
+
+            if valmax > slider.valmax:
+                slider.valmax = valmax
+                slider.ax.set_xlim(slider.valmin, valmax)
+                fig.canvas.draw_idle()
+
+            if valmax >= finalValmax or finished:
+                timer.stop()
+
+        timer = fig.canvas.new_timer(interval=interval)
+        timer.add_callback(extend)
+        timer.start()
+
+        return timer
+
+    def plotParticles(self, streamlineWidth=2):
 
         fig, ax = plt.subplots()
         plt.subplots_adjust(bottom=0.25)
 
         # Plotting streamlines
-        stream = plt.streamplot(x, y, v_x, v_y,
-                                density=self.plottingData.streamLinesPlotDensity,
-                                linewidth=streamlineWidth,
-                                broken_streamlines=self.plottingData.brokenStreamlines,
-                                color="k"
-                                )
-
-        # Plotting the line data
-        if self.plottingData.plotInitLine:
-            plt.plot(*self.particleData.positions[0],
-                     label=f"Inital dye")
+        self._plotStreamlines(ax, streamlineWidth)
 
-        if self.plottingData.plotFinalLine:
-            plt.plot(*self.particleData.positions[-1],
-                     label=f"Dye line after {self.particleData.timePast()}s")
+        # Plotting the dye regions
+        if self.plottingData.plotFinalRegion:
+            self._plotFinalRegion(ax)
 
-        # Plotting the scattering data
-        if self.plottingData.plotInitPoints:
-            plt.scatter(*self.particleData.positions[0],
-                        marker=",", c="g", s=1, label="Inital dye")
+        # Dyes of many particles are drawn as an image at the resolution the plot is shown or saved at
+        if self._rasterizeDye():
+            layers = self._rasterDyeLegend(ax, f"Dye line after {self._timePastLabel()}",
+                                           f"Dye after {self._timePastLabel()}")
 
-        if self.plottingData.plotFinalPoints:
-            plt.scatter(*self.particleData.positions[-1], marker=",",
-                        c="r", s=1, label=f"Dye after {self.particleData.timePast()}s")
+            dpi = self.plottingData.plotSaveDpi if self.plottingData.saveFigure else fig.dpi
+            self._dyeRaster(ax, dpi).update(
+                [(self.particleData.positions[0] if isInitial else self.particleData.latestPositions, color, isLine)
+                 for isInitial, color, isLine in layers])
+
+        else:
+            # Plotting the line data
+            if self.plottingData.plotInitLine:
+                plt.plot(*self.particleData.positions[0],
+                         label="Inital dye")
+
+            if self.plottingData.plotFinalLine:
+                plt.plot(*self.particleData.latestPositions,
+                         label=f"Dye line after {self._timePastLabel()}")
+
+            # Plotting the scattering data
+            if self.plottingData.plotInitPoints:
+                plt.scatter(*self.particleData.positions[0],
+                            marker=",", c="g", s=1, label="Inital dye")
+
+            if self.plottingData.plotFinalPoints:
+                plt.scatter(*self.particleData.latestPositions, marker=",",
+                            c="r", s=1, label=f"Dye after {self._timePastLabel()}")
 
         # Setting plot features
 
@@ -227,7 +677,7 @@ class Plotting():
         if self.plottingData.includeGird:
             plt.grid()
         if self.plottingData.inlcudeLegend:
-            plt.legend()
+            plt.legend(loc=self._legendLocation())
         if self.plottingData.includeXLabel:
             plt.xlabel(self.plottingData.xLabel)
         if self.plottingData.includeYLabel:
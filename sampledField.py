@@ -0,0 +1,205 @@
+import hashlib
+
+import numpy as np
+
+from structs import SimFlowFuncs
+from iterator import getVelocitiesFromPositionsCartConverted
+
+
+# Catmull-Rom weights of the 4 grid points around a point a fraction t through a cell
+def _cubicWeights(t):
+
+    t2 = t * t
+    t3 = t2 * t
+
+    return (
+        0.5 * (- t3 + 2 * t2 - t),
+        0.5 * (3 * t3 - 5 * t2 + 2),
+        0.5 * (- 3 * t3 + 4 * t2 + t),
+        0.5 * (t3 - t2)
+    )
+
+
+# Fractions of the way through a cell (along each axis) at which the interpolation error is largest, for a smooth flow.
+# The error of linear interpolation peaks half way between grid points, that of Catmull-Rom splines about a quarter of
+# the way from either end (checking only the cell centres misses most of the error of potential flows, whose
+# velocities are harmonic so the leading bilinear error cancels there)
+_errorFractions = {
+    "bilinear": (0.5,),
+    "bicubic": (0.25, 0.75)
+}
+
+
+# Velocity field of a steady flow sampled once on a grid and interpolated between the grid points
+class SampledField():
+
+    def __init__(self, flowData: SimFlowFuncs, xMin: float, xMax: float, yMin: float, yMax: float,
+                 resolution: int = 300, interpolation: str = "bilinear", exactTolerance: float = None):
+
+        if interpolation not in ("bilinear", "bicubic"):
+            raise ValueError(
+                f"Unknown interpolation {interpolation}, choose from bilinear, bicubic")
+
+        self.flowData = flowData
+        self.interpolation = interpolation
+        self.resolution = resolution
+        self.exactTolerance = exactTolerance
+
+        # Same grid points as Plotting._getFlowMap so the plots can reuse them
+        self.xCoords = np.linspace(xMin, xMax, resolution, dtype=np.float64)
+        self.yCoords = np.linspace(yMin, yMax, resolution, dtype=np.float64)
+        self.dx = self.xCoords[1] - self.xCoords[0]
+        self.dy = self.yCoords[1] - self.yCoords[0]
+
+        self.xsMatrix, self.ysMatrix = np.meshgrid(self.xCoords, self.yCoords)
+        vxs, vys = getVelocitiesFromPositionsCartConverted(
+            postions=np.array([self.xsMatrix.ravel(), self.ysMatrix.ravel()]),
+            flowData=flowData
+        )
+        self.vxGrid = vxs.reshape(self.xsMatrix.shape)
+        self.vyGrid = vys.reshape(self.ysMatrix.shape)
+
+        # Cells touching a singular grid point can't be interpolated
+        self.exactCells = np.zeros((resolution - 1, resolution - 1), dtype=bool)
+        singular = ~(np.isfinite(self.vxGrid) & np.isfinite(self.vyGrid))
+        self.exactCells |= singular[:-1, :-1] | singular[1:, :-1] | singular[:-1, 1:] | singular[1:, 1:]
+
+        # Interpolation error of each cell, the largest found at the points of it where the error peaks
+        self.cellError = np.zeros(self.exactCells.shape)
+        fractions = (0,) + _errorFractions[interpolation]
+        for xFraction in fractions:
+            for yFraction in fractions:
+                if xFraction or yFraction:
+                    self.cellError = np.maximum(self.cellError, self._cellErrors(xFraction, yFraction))
+
+        # Optionally evaluate exactly in cells that interpolate badly (near singularities)
+        if exactTolerance is not None:
+            self.exactCells |= self.cellError > exactTolerance
+
+        interpolated = ~self.exactCells
+        self.maxError = self.cellError[interpolated].max(initial=0)
+        self.rmsError = np.sqrt(np.mean(self.cellError[interpolated] ** 2)) \
+            if interpolated.any() else 0.0
+
+    # Interpolation error of each cell at the point xFraction, yFraction of the way through it (a fraction of 0 is on
+    # both edges of the cell, the larger error of the two is taken), inf where the velocities aren't finite
+    def _cellErrors(self, xFraction: float, yFraction: float):
+
+        xs = self.xCoords if xFraction == 0 else self.xCoords[:-1] + xFraction * self.dx
+        ys = self.yCoords if yFraction == 0 else self.yCoords[:-1] + yFraction * self.dy
+        points = np.array([coords.ravel() for coords in np.meshgrid(xs, ys)])
+
+        exactVxs, exactVys = getVelocitiesFromPositionsCartConverted(
+            postions=points,
+            flowData=self.flowData
+        )
+        interpVxs, interpVys = self._interpolate(*points)
+
+        with np.errstate(invalid="ignore"):
+            errors = np.hypot(interpVxs - exactVxs, interpVys - exactVys).reshape(len(ys), len(xs))
+        errors[~np.isfinite(errors)] = np.inf
+
+        if xFraction == 0:
+            errors = np.maximum(errors[:, :-1], errors[:, 1:])
+        if yFraction == 0:
+            errors = np.maximum(errors[:-1], errors[1:])
+
+        return errors
+
+    # Whether this field was sampled on the same grid as the one given
+    def matchesGrid(self, xMin: float, xMax: float, yMin: float, yMax: float, resolution: int):
+        return resolution == self.resolution and \
+            np.allclose([xMin, xMax, yMin, yMax],
+                        [self.xCoords[0], self.xCoords[-1], self.yCoords[0], self.yCoords[-1]])
+
+    # Fractional grid index of each point, the cell it is in and whether it is inside the grid (points that aren't
+    # finite, such as particles that went through a singularity, are outside)
+    def _locate(self, x, y):
+
+        fx = (x - self.xCoords[0]) / self.dx
+        fy = (y - self.yCoords[0]) / self.dy
+
+        inside = (fx >= 0) & (fx <= self.resolution - 1) & \
+            (fy >= 0) & (fy <= self.resolution - 1)
+
+        # Put in the first cell so they can still be indexed
+        fx = np.where(np.isfinite(fx), fx, 0)
+        fy = np.where(np.isfinite(fy), fy, 0)
+
+        ix = np.clip(np.floor(fx), 0, self.resolution - 2).astype(np.int64)
+        iy = np.clip(np.floor(fy), 0, self.resolution - 2).astype(np.int64)
+
+        return fx - ix, fy - iy, ix, iy, inside
+
+    # Interpolated velocities (no exact fallback)
+    def _interpolate(self, x, y):
+
+        tx, ty, ix, iy, _ = self._locate(x, y)
+
+        if self.interpolation == "bilinear":
+            xWeights = (1 - tx, tx)
+            yWeights = (1 - ty, ty)
+            offsets = (0, 1)
+        else:
+            xWeights = _cubicWeights(tx)
+            yWeights = _cubicWeights(ty)
+            offsets = (-1, 0, 1, 2)
+
+        vxs = np.zeros(np.shape(x))
+        vys = np.zeros(np.shape(y))
+
+        for yOffset, yWeight in zip(offsets, yWeights):
+            rows = np.clip(iy + yOffset, 0, self.resolution - 1)
+
+            for xOffset, xWeight in zip(offsets, xWeights):
+                columns = np.clip(ix + xOffset, 0, self.resolution - 1)
+                weight = xWeight * yWeight
+
+                vxs += weight * self.vxGrid[rows, columns]
+                vys += weight * self.vyGrid[rows, columns]
+
+        return vxs, vys
+
+    # Velocities at x, y, evaluated exactly outside the grid and in cells marked as exact
+    def velocities(self, x, y):
+
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+
+        vxs, vys = self._interpolate(x, y)
+
+        _, _, ix, iy, inside = self._locate(x, y)
+        useExact = ~inside | self.exactCells[iy, ix]
+
+        if useExact.any():
+            exactVxs, exactVys = getVelocitiesFromPositionsCartConverted(
+                postions=np.array([x[useExact], y[useExact]]),
+                flowData=self.flowData
+            )
+            vxs[useExact] = exactVxs
+            vys[useExact] = exactVys
+
+        return vxs, vys
+
+    # Flow functions that advect using this field
+    def getSimFlowFunc(self):
+
+        simFlow = SimFlowFuncs()
+        simFlow.vxy = self.velocities
+        simFlow.sampledField = self
+        simFlow.psi = self.flowData.psi
+        simFlow.fingerprint = self.fingerprint
+
+        return simFlow
+
+    # Fingerprint of the interpolated flow, that of the exact flow together with the grid and the interpolation (None
+    # if the exact flow has none)
+    @property
+    def fingerprint(self):
+
+        if self.flowData.fingerprint is None:
+            return None
+
+        grid = (self.xCoords[0], self.xCoords[-1], self.yCoords[0], self.yCoords[-1], self.resolution,
+                self.interpolation, self.exactTolerance)
+        return hashlib.sha1(f"sampledField{self.flowData.fingerprint}{grid!r}".encode()).hexdigest()
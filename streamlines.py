@@ -0,0 +1,251 @@
+import contourpy
+import numpy as np
+
+
+# Shortest streamline kept and longest traced (in plot widths, as for plt.streamplot)
+minLength = 0.1
+maxLength = 4
+
+# Most contour levels drawn (singular stream functions would otherwise give thousands)
+maxLevels = 500
+
+
+# Bilinear interpolation of values on the flow map grid (rows along y, columns along x as from np.meshgrid, with any
+# further axes interpolated together)
+def interpolateGrid(values, xsMatrix, ysMatrix, x, y):
+
+    numY, numX = values.shape[:2]
+    i = np.clip((x - xsMatrix[0, 0]) / (xsMatrix[0, 1] - xsMatrix[0, 0]), 0, numX - 1)
+    j = np.clip((y - ysMatrix[0, 0]) / (ysMatrix[1, 0] - ysMatrix[0, 0]), 0, numY - 1)
+
+    i0 = np.minimum(i.astype(np.int64), numX - 2)
+    j0 = np.minimum(j.astype(np.int64), numY - 2)
+    fi = (i - i0).reshape(i.shape + (1,) * (values.ndim - 2))
+    fj = (j - j0).reshape(j.shape + (1,) * (values.ndim - 2))
+
+    return ((values[j0, i0] * (1 - fi) + values[j0, i0 + 1] * fi) * (1 - fj) +
+            (values[j0 + 1, i0] * (1 - fi) + values[j0 + 1, i0 + 1] * fi) * fj)
+
+
+# Step the widths are rounded to, so that runs of segments with the same width are drawn as one path (drawing one path
+# per segment, as plt.streamplot does, takes longer than finding the streamlines)
+widthStep = 1 / 16
+
+
+# Empty streamline arrays (see streamlineArrays)
+def _noStreamlines() -> dict:
+    return {"points": np.zeros((0, 2)), "lineStarts": np.zeros(1, dtype=np.int64), "linewidths": np.zeros(0),
+            "arrowTails": np.zeros((0, 2)), "arrowHeads": np.zeros((0, 2)), "arrowLinewidths": np.zeros(0)}
+
+
+# Streamlines (arrays of points ordered along the flow) as the arrays drawn by Plotting: the lines split where their
+# width, interpolated from linewidth, changes (points[lineStarts[i]:lineStarts[i + 1]] drawn with linewidths[i]), and an
+# arrow half way along each line, left out within arrowSpacing of an arrow already placed
+def streamlineArrays(lines: list, xsMatrix, ysMatrix, linewidth, arrowSpacing: float = 0) -> dict:
+
+    lines = [line for line in lines if len(line) > 1]
+    if len(lines) == 0:
+        return _noStreamlines()
+
+    pieces = []
+    pieceWidths = []
+    arrowTails = []
+    arrowHeads = []
+    for line in lines:
+
+        widths = np.round(interpolateGrid(linewidth, xsMatrix, ysMatrix, line[:-1, 0], line[:-1, 1]) / widthStep)
+        splits = np.concatenate(([0], np.flatnonzero(np.diff(widths)) + 1, [len(widths)]))
+        for start, end in zip(splits[:-1], splits[1:]):
+            pieces.append(line[start:end + 1])
+            pieceWidths.append(widths[start] * widthStep)
+
+        # Arrow from the point half way along the line towards the next one (as placed by plt.streamplot)
+        distance = np.cumsum(np.hypot(*np.diff(line, axis=0).T))
+        index = min(np.searchsorted(distance, distance[-1] * 0.5), len(line) - 2)
+        if arrowSpacing > 0 and len(arrowTails) > 0 and \
+                np.hypot(*(np.array(arrowTails) - line[index]).T).min() < arrowSpacing:
+            continue
+
+        arrowTails.append(line[index])
+        arrowHeads.append(line[index:index + 2].mean(axis=0))
+
+    arrowTails = np.array(arrowTails)
+
+    return {
+        "points": np.concatenate(pieces),
+        "lineStarts": np.concatenate(([0], np.cumsum([len(piece) for piece in pieces]))),
+        "linewidths": np.array(pieceWidths),
+        "arrowTails": arrowTails,
+        "arrowHeads": np.array(arrowHeads),
+        "arrowLinewidths": interpolateGrid(linewidth, xsMatrix, ysMatrix, arrowTails[:, 0], arrowTails[:, 1])
+    }
+
+
+# Streamlines as evenly spaced contours of the stream function psi (exact for streamFunctionFlow and
+# complexPotentialFlow). The lines bunch up where the flow is fast, as the flow between neighbouring lines is fixed
+def contourStreamlines(xsMatrix, ysMatrix, psi, vxs, vys, linewidth, density: float) -> dict:
+
+    dx = xsMatrix[0, 1] - xsMatrix[0, 0]
+    dy = ysMatrix[1, 0] - ysMatrix[0, 0]
+    speed = np.hypot(vxs, vys)
+
+    # Mask jumps in psi bigger than the flow between the points allows (branch cuts of logarithms and singularities)
+    mask = ~ np.isfinite(psi)
+    with np.errstate(invalid="ignore"):
+        jumpX = ~ (np.abs(np.diff(psi, axis=1)) <= 2 * dx * np.maximum(speed[:, 1:], speed[:, :-1]))
+        jumpY = ~ (np.abs(np.diff(psi, axis=0)) <= 2 * dy * np.maximum(speed[1:], speed[:-1]))
+    mask[:, 1:] |= jumpX
+    mask[:, :-1] |= jumpX
+    mask[1:] |= jumpY
+    mask[:-1] |= jumpY
+
+    if mask.all():
+        return _noStreamlines()
+
+    # Levels spaced so that lines are (on average) as far apart as plt.streamplot puts them
+    validPsi = psi[~ mask]
+    psiRange = validPsi.max() - validPsi.min()
+    spacing = (xsMatrix[0, -1] - xsMatrix[0, 0]) / (30 * density)
+    step = max(np.median(speed[~ mask]) * spacing, psiRange / maxLevels)
+    if not step > 0:
+        return _noStreamlines()
+
+    levels = np.arange(np.ceil(validPsi.min() / step), np.floor(validPsi.max() / step) + 1) * step
+
+    generator = contourpy.contour_generator(xsMatrix, ysMatrix, np.ma.array(psi, mask=mask),
+                                            line_type=contourpy.LineType.Separate)
+    lines = [line for levelLines in generator.multi_lines(levels) for line in levelLines if len(line) > 1]
+
+    # Drop the lines shorter than minLength
+    minimumLength = minLength * (xsMatrix[0, -1] - xsMatrix[0, 0])
+    lines = [line for line in lines if np.hypot(*np.diff(line, axis=0).T).sum() >= minimumLength]
+    if len(lines) == 0:
+        return _noStreamlines()
+
+    # Contours go either way round, flip those running against the flow
+    points = np.concatenate(lines)
+    tangents = np.diff(points, axis=0)
+    flows = tangents[:, 0] * interpolateGrid(vxs, xsMatrix, ysMatrix, points[:-1, 0], points[:-1, 1]) + \
+        tangents[:, 1] * interpolateGrid(vys, xsMatrix, ysMatrix, points[:-1, 0], points[:-1, 1])
+
+    lineStarts = np.concatenate(([0], np.cumsum([len(line) for line in lines])[:-1]))
+    flowAlongLines = np.add.reduceat(np.append(flows, 0), lineStarts)
+    lines = [line[::-1] if flowAlongLine < 0 else line for line, flowAlongLine in zip(lines, flowAlongLines)]
+
+    # Contours of small loops (around vortices) are close together, so only some of them get an arrow
+    return streamlineArrays(lines, xsMatrix, ysMatrix, linewidth, arrowSpacing=2 * spacing)
+
+
+# Points of every seed moved along the flow direction (all seeds at once with the midpoint method) until leaving the
+# grid or stopping, shape (steps + 1, seeds, 2) with nan after a seed stopped
+def _traceSeeds(xsMatrix, ysMatrix, vxs, vys, seeds, stepSize: float, numSteps: int):
+
+    xMin, xMax = xsMatrix[0, 0], xsMatrix[0, -1]
+    yMin, yMax = ysMatrix[0, 0], ysMatrix[-1, 0]
+
+    velocities = np.stack((vxs, vys), axis=-1)
+
+    def direction(x, y):
+        vx, vy = interpolateGrid(velocities, xsMatrix, ysMatrix, x, y).T
+        speed = np.hypot(vx, vy)
+
+        moving = speed > 0
+        speed[~ moving] = 1
+        return vx / speed, vy / speed, moving
+
+    points = np.full((numSteps + 1,) + seeds.shape, np.nan)
+    points[0] = seeds
+
+    tracing = np.arange(len(seeds))
+    x = seeds[:, 0].copy()
+    y = seeds[:, 1].copy()
+
+    for step in range(numSteps):
+
+        ux, uy, moving = direction(x, y)
+        ux, uy, movingMid = direction(x + 0.5 * stepSize * ux, y + 0.5 * stepSize * uy)
+        x = x + stepSize * ux
+        y = y + stepSize * uy
+
+        keep = moving & movingMid & (x >= xMin) & (x <= xMax) & (y >= yMin) & (y <= yMax)
+        tracing, x, y = tracing[keep], x[keep], y[keep]
+        if len(tracing) == 0:
+            break
+
+        points[step + 1, tracing, 0] = x
+        points[step + 1, tracing, 1] = y
+
+    return points
+
+
+# Points of a traced half streamline up to where it runs into a cell of another streamline (only if broken) or back
+# into one of its own cells (closing loops), adds the cells it went through to visited
+def _untilOccupied(points, cellSize, occupied, visited: set, brokenStreamlines: bool):
+
+    points = points[~ np.isnan(points[:, 0])]
+    cells = np.minimum((points / cellSize).astype(np.int64), occupied.shape[0] - 1)
+
+    current = tuple(cells[0])
+    for index in range(1, len(points)):
+
+        cell = tuple(cells[index])
+        if cell == current:
+            continue
+
+        if brokenStreamlines and occupied[cell[1], cell[0]]:
+            return points[:index]
+
+        # Back where the line has already been, kept up to this point so closed loops close
+        if cell in visited:
+            return points[:index + 1]
+
+        visited.add(current)
+        current = cell
+
+    visited.add(current)
+    return points
+
+
+# Streamlines traced from seeds spread over the plot, all seeds integrated at once. As for plt.streamplot lines only
+# start in cells no other line has been through, and with brokenStreamlines stop when running into one
+def traceStreamlines(xsMatrix, ysMatrix, vxs, vys, linewidth, density: float, brokenStreamlines: bool) -> dict:
+
+    origin = np.array([xsMatrix[0, 0], ysMatrix[0, 0]])
+    size = np.array([xsMatrix[0, -1], ysMatrix[-1, 0]]) - origin
+    numCells = max(int(30 * density), 1)
+    cellSize = size / numCells
+
+    # Seeds at the cell centres, the outer ones first
+    cellXs, cellYs = np.meshgrid(np.arange(numCells), np.arange(numCells))
+    cellXs, cellYs = cellXs.ravel(), cellYs.ravel()
+    order = np.argsort(np.minimum.reduce([cellXs, cellYs, numCells - 1 - cellXs, numCells - 1 - cellYs]),
+                       kind="stable")
+    seeds = origin + (np.column_stack((cellXs, cellYs))[order] + 0.5) * cellSize
+
+    stepSize = 0.2 * cellSize.min()
+    numSteps = int(0.5 * maxLength * size.max() / stepSize)
+    forward = _traceSeeds(xsMatrix, ysMatrix, vxs, vys, seeds, stepSize, numSteps) - origin
+    backward = _traceSeeds(xsMatrix, ysMatrix, - vxs, - vys, seeds, stepSize, numSteps) - origin
+
+    occupied = np.zeros((numCells, numCells), dtype=bool)
+    minimumLength = minLength * size.max()
+    lines = []
+    for seed in range(len(seeds)):
+
+        seedCell = np.minimum((forward[0, seed] / cellSize).astype(np.int64), numCells - 1)
+        if occupied[seedCell[1], seedCell[0]]:
+            continue
+
+        visited = set()
+        forwardPoints = _untilOccupied(forward[:, seed], cellSize, occupied, visited, brokenStreamlines)
+        backwardPoints = _untilOccupied(backward[:, seed], cellSize, occupied, visited, brokenStreamlines)
+        line = np.concatenate((backwardPoints[:0:-1], forwardPoints))
+
+        if len(line) < 2 or np.hypot(*np.diff(line, axis=0).T).sum() < minimumLength:
+            continue
+
+        for cellX, cellY in visited:
+            occupied[cellY, cellX] = True
+        lines.append(line + origin)
+
+    return streamlineArrays(lines, xsMatrix, ysMatrix, linewidth)
@@ -1,7 +1,10 @@
 from dataclasses import dataclass
+import os
 
 import numpy as np
 
+from trajectory import Trajectory, DiskTrajectory, interpolateFrames
+
 
 @dataclass
 class SimFlowFuncs():
@@ -16,98 +19,512 @@ class SimFlowFuncs():
     vr = None
     vtheta = None
 
+    # Fused polar flow function returning (vr, vtheta) in one call (in terms of an iterator.Coordinates with x, y, r,
+    # theta, cos, sin worked out once for all the flow functions)
+    vrtheta = None
+
     # Vector flow function (in terms of x, y, r, theta, xHat, yHat, rHat, thetaHat)
     v = None
 
+    # Fused cartesian flow function returning (vx, vy) in one call (in terms of x, y)
+    vxy = None
+
+    # Stream function of the whole flow (in terms of x, y), only set when every part of the flow has one. Used to
+    # draw the streamlines as its contours
+    psi = None
+
+    # Hash of the Flow definition these functions were made from
+    fingerprint = None
+
+    # Grid the flow was sampled on when advecting with interpolated velocities
+    sampledField = None
+
 
 @dataclass
 class SimSetupData():
 
-    # Simulation variables
+    # Simulation variables, subtimeSteps of None uses the integrator's default (32 for euler, 1 for rk4, see
+    # integrators.defaultSubtimeSteps)
     timeStep: float
-    subtimeSteps = 32
+    subtimeSteps: int = None
 
+    # Integrator used for each step: "euler", "rk4" (both use subtimeSteps) or "dopri5" (adaptive)
+    integrator: str = "euler"
 
-@dataclass
+    # Per-particle error control for the adaptive integrator
+    relativeTolerance: float = 1e-6
+    absoluteTolerance: float = 1e-8
+    minSubtimeStep: float = 1e-9
+
+    # Particles advanced together (each block goes through the whole step while its arrays are in cache)
+    blockSize: int = 8192
+
+    # Cap in bytes on the temporary memory used while advancing, lowers blockSize if needed (None for no cap)
+    maxEvaluationMemory: int = None
+
+    # Record where the time goes into Visualizer.profiler (see instrumentation.py)
+    profile: bool = False
+
+    # Floating point type the particle positions are stored and advanced in, "float32" halves the memory of the
+    # trajectory (adaptive step sizes, the flow elements and the velocity sums are always float64)
+    precision: str = "float64"  # or "float32"
+
+    # Only every storeEvery-th iteration is stored, with the velocities at it, the iterations between are reconstructed
+    # by cubic Hermite interpolation when plotted (see ParticleData.positionsAtTime)
+    storeEvery: int = 1
+
+    # Folder the trajectory is streamed to as it is simulated (memory mapped back to plot), None keeps it in memory
+    trajectoryPath: str = None
+
+    # File the state of the simulation is saved to every checkpointEvery iterations, so a run can be carried on with
+    # Visualizer.resume (None for no checkpoints)
+    checkpointPath: str = None
+    checkpointEvery: int = 100
+
+    # Number of worker processes the particles are shared between (1 runs in this process)
+    workers: int = 1
+
+    # Advect with velocities interpolated from a grid over the plot area sampled once (steady flows)
+    sampledField: bool = False
+    sampledFieldResolution: int = 300
+    sampledFieldInterpolation: str = "bilinear"  # or "bicubic"
+
+    # Cells with a larger interpolation error than this are evaluated exactly (None to always interpolate)
+    sampledFieldTolerance: float = None
+
+
+# The numpy dtype of a SimSetupData.precision
+def precisionDtype(precision: str) -> np.dtype:
+
+    if precision not in ("float32", "float64"):
+        raise ValueError(f"Unknown precision {precision}, choose from float32 or float64")
+
+    return np.dtype(precision)
+
+
+# Particles stored as arrays per quantity (positions, velocities, masses), each owned by the instance. The initial dye
+# is written shape by shape into preallocated blocks (see addShape), growing them geometrically when a shape doesn't
+# fit, and the shapes are kept as offsets into the particles
 class ParticleData():
 
-    # Particle positions, velocity, mass (so can add drifing effects)
-    positions = np.array([[[], []]])
-    velocities = np.array([[], []])
-    masses = np.array([])
+    __slots__ = ("_initialPositions", "_velocities", "_masses", "_numParticles", "_trajectory", "_frameVelocities",
+                 "_tail", "storeEvery", "firstIteration", "trajectoryPath", "shapeOffsets", "dyeRegions", "stepSizes",
+                 "simulator")
+
+    # capacity particles are allocated up front (adding more reallocates), positions and velocities are stored as dtype
+    def __init__(self, capacity: int = 0, dtype=np.float64):
+
+        # Initial positions, velocities and masses of the particles, the first numParticles are in use
+        self._initialPositions = np.empty((2, capacity), dtype=dtype)
+        self._velocities = np.zeros((2, capacity), dtype=dtype)
+        self._masses = np.zeros(capacity)
+        self._numParticles = 0
+
+        # Store of the past positions of the particles (one frame per storeEvery iterations, the first is the initial
+        # dye), made from the initial positions when first used
+        self._trajectory = None
+        self.storeEvery = 1
+
+        # Iteration of the first stored frame, above 0 for particles carried on from a checkpoint without the frames
+        # before it (frames are then stored every storeEvery iterations from it)
+        self.firstIteration = 0
+
+        # With storeEvery above 1, the velocities (change in position per iteration) at the stored frames, used to
+        # reconstruct the iterations between them (see positionsAtTime)
+        self._frameVelocities = None
+
+        # (number of stored frames, iterations since the last of them, positions) of the latest iteration when it
+        # isn't stored (None when it is), replaced as a whole so that other threads always see a consistent tail
+        self._tail = None
+
+        # Folder the trajectory is streamed to on disk (see storeTrajectoryOnDisk), None keeps it in memory
+        self.trajectoryPath = None
+
+        # Shape i is particles shapeOffsets[i] to shapeOffsets[i + 1], used to draw the shapes correctly
+        self.shapeOffsets = np.zeros(1, dtype=np.int64)
+
+        # Areas covered by the initial dye, ("rectangle", xMin, xMax, yMin, yMax) or ("circle", centerX, centerY,
+        # radius), used to draw the dye regions (see backwardMap.py)
+        self.dyeRegions = []
+
+        # Per-particle step sizes kept between iterations by adaptive integrators
+        self.stepSizes = None
+
+        # Called with a number of iterations to simulate further when positionsAtTime asks for frames not computed yet
+        # (set by the Visualizer, None to only use the frames already computed)
+        self.simulator = None
+
+    @property
+    def numParticles(self) -> int:
+        return self._numParticles
+
+    # Index of the first particle of each shape
+    @property
+    def shapeStarts(self) -> np.array:
+        return self.shapeOffsets[:-1]
+
+    # Particle velocity, mass (so can add drifing effects)
+    @property
+    def velocities(self) -> np.array:
+        return self._velocities[:, :self._numParticles]
+
+    @velocities.setter
+    def velocities(self, velocities: np.array):
+        self._velocities = velocities
 
-    # Store the past positions of the particles
-    positionHistory = []
+    @property
+    def masses(self) -> np.array:
+        return self._masses[:self._numParticles]
 
-    # Array of the index of the first particle in a shape used to draw the shapes correctly
-    shapeStarts = []
+    @masses.setter
+    def masses(self, masses: np.array):
+        self._masses = masses
+
+    # Floating point type the positions and velocities are stored in
+    @property
+    def dtype(self) -> np.dtype:
+        return self.trajectory.frames.dtype if self._initialPositions is None else self._initialPositions.dtype
 
-    # Positions at time finds the position of a particle for a given time
-    def positionsAtTime(self, iterationIndex: float):
+    # Converts the positions (every frame so far) and velocities to dtype, masses stay float64
+    def setDtype(self, dtype):
+
+        dtype = np.dtype(dtype)
+        if dtype == self.dtype:
+            return
+
+        if self._trajectory is not None:
+            self._trajectory = self._newTrajectory(self._trajectory.frames.astype(dtype), copy=False)
+        if self._frameVelocities is not None:
+            self._frameVelocities = self._newTrajectory(self._frameVelocities.frames.astype(dtype), copy=False,
+                                                        velocities=True)
+        if self._tail is not None:
+            self._tail = self._tail[:2] + (self._tail[2].astype(dtype),)
+        if self._initialPositions is not None:
+            self._initialPositions = self._initialPositions.astype(dtype)
+        self._velocities = self._velocities.astype(dtype)
+
+    # Make room for numParticles more particles without reallocating
+    def reserveParticles(self, numParticles: int):
+
+        self._initialPositionsForShapes()
+        capacity = self._numParticles + numParticles
+
+        for name in ("_initialPositions", "_velocities", "_masses"):
+            block = getattr(self, name)
+            if block.shape[-1] < capacity:
+                grown = np.zeros(block.shape[:-1] + (capacity,), dtype=block.dtype)
+                grown[..., :self._numParticles] = block[..., :self._numParticles]
+                setattr(self, name, grown)
+
+    # Number of particles that fit without reallocating
+    @property
+    def capacity(self) -> int:
+        positionsCapacity = self._numParticles if self._initialPositions is None else self._initialPositions.shape[1]
+        return min(positionsCapacity, self._velocities.shape[1], self._masses.shape[0])
+
+    # The initial positions block, taken back from the trajectory if it was made (dye can only be added before
+    # simulating)
+    def _initialPositionsForShapes(self):
+
+        if self._trajectory is None:
+            return
+
+        if self.numIterations > 0:
+            raise ValueError("Dye can't be added once the particles have been simulated")
+
+        if self._initialPositions is None:
+            self._initialPositions = self._trajectory.frames[0].copy()
+        self._trajectory = None
+        self._frameVelocities = None
 
-        # TODO make so renders more if needed
-        # Check that not accsessing iterations that don't exist
-        if iterationIndex >= len(self.positionHistory):
-            raise ValueError(
-                "Iteration index exceeds what is currently rendered")
+    # Adds a shape of numParticles particles (at rest, with mass particleMass), returns the view (2, numParticles) of
+    # the block its initial positions are to be written into
+    def addShape(self, numParticles: int, particleMass: float = 0) -> np.array:
+
+        # Grown geometrically so that adding many shapes copies each particle a bounded number of times
+        self._initialPositionsForShapes()
+        if self._numParticles + numParticles > self.capacity:
+            self.reserveParticles(max(numParticles, self._numParticles))
 
-        # Find bounding indices
-        floorIndex = int(np.floor(iterationIndex))
-        ceilIndex = int(np.ceil(iterationIndex))
+        start = self._numParticles
+        end = start + numParticles
+        self._numParticles = end
+        self.shapeOffsets = np.append(self.shapeOffsets, end)
+
+        self._velocities[:, start:end] = 0
+        self._masses[start:end] = particleMass
 
-        # Find bounding positions
-        floorPositions = self.positionHistory[floorIndex]
-        ceilPositions = self.positionHistory[ceilIndex]
+        return self._initialPositions[:, start:end]
+
+    # Store of the particle positions
+    @property
+    def trajectory(self):
+
+        # Uses the block of initial positions as it is when it is full
+        if self._trajectory is None:
+            self._trajectory = self._newTrajectory(self._initialPositions[None, :, :self._numParticles], copy=False)
+
+        return self._trajectory
 
-        # Find interp positions
-        frac, integer = np.modf(iterationIndex)
-        interpPos = floorPositions * frac + (1 - frac) * ceilPositions
+    # Trajectory store starting with frames (or the store of the frame velocities), on disk if a trajectoryPath is set
+    def _newTrajectory(self, frames: np.array, copy: bool = True, velocities: bool = False):
+
+        if self.trajectoryPath is None:
+            return Trajectory(frames, copy)
 
-        # Return the interp positions
-        return interpPos
+        if velocities:
+            return DiskTrajectory(os.path.join(self.trajectoryPath, "velocities"), frames)
 
-    def timePast(self):
-        return self.positions.shape[1]
+        # The shapes are kept with the frames so that the store can be plotted on its own (see ParticleData.open)
+        attributes = {
+            "shapeOffsets": [int(offset) for offset in self.shapeOffsets],
+            "dyeRegions": [[region[0]] + [float(value) for value in region[1:]] for region in self.dyeRegions],
+            "storeEvery": self.storeEvery,
+            "firstIteration": self.firstIteration
+        }
 
-    # Giving adding dye functionality
-    def __add__(self, new_particle):  # particleData1 + particleData2
+        return DiskTrajectory(self.trajectoryPath, frames, attributes)
+
+    # Only store every storeEvery-th iteration (with the velocities at it), the iterations between are reconstructed
+    # when asked for by positionsAtTime. Set before simulating
+    def setStoreEvery(self, storeEvery: int):
+
+        if storeEvery == self.storeEvery:
+            return
+        if storeEvery < 1:
+            raise ValueError("storeEvery must be at least 1")
+        if self.numIterations > 0:
+            raise ValueError("The iterations stored can't be changed once the particles have been simulated")
+
+        self.storeEvery = storeEvery
+        self._frameVelocities = None
+        if self._trajectory is not None:
+            self._trajectory = self._newTrajectory(self._trajectory.frames)
+
+    # Store of the velocities at the stored frames (None before the first is added or when every iteration is stored)
+    @property
+    def frameVelocities(self):
+        return self._frameVelocities
 
-        if type(new_particle) != ParticleData:
-            return TypeError
+    # Adds the velocities (change in position per iteration) at the next stored frame without them
+    def appendFrameVelocities(self, velocities: np.array):
 
-        # If no items in self then set self to the added item
-        if self.positions.size == 0:
-            self = new_particle
+        if self._frameVelocities is None:
+            self._frameVelocities = self._newTrajectory(velocities[None], velocities=True)
+        else:
+            self._frameVelocities.append(velocities)
+
+    # Number of iterations simulated so far
+    @property
+    def numIterations(self) -> int:
+
+        frames = self.positions
+        tail = self._tail
+        tailIterations = tail[1] if tail is not None and tail[0] == len(frames) else 0
+
+        return self.firstIteration + (len(frames) - 1) * self.storeEvery + tailIterations
+
+    # Positions after the latest iteration
+    @property
+    def latestPositions(self) -> np.array:
+
+        frames = self.positions
+        tail = self._tail
+
+        return tail[2] if tail is not None and tail[0] == len(frames) else frames[-1]
+
+    # Whether the positions after iteration are stored in the trajectory
+    def isStored(self, iteration: int) -> bool:
+        return (iteration - self.firstIteration) % self.storeEvery == 0
+
+    # Array the positions after the next iteration are to be written into (the next frame of the trajectory when it is
+    # stored), added with commitPositions
+    def nextPositions(self) -> np.array:
+
+        if self.isStored(self.numIterations + 1):
+            return self.trajectory.nextFrame()
+
+        return np.empty((2, self._numParticles), dtype=self.dtype)
+
+    def commitPositions(self, positions: np.array):
+        self.commitIterations(1, positions)
+
+    # Adds numIter iterations whose stored frames have been written into the trajectory, latestPositions are the
+    # positions after the last of them (only used when it isn't stored)
+    def commitIterations(self, numIter: int, latestPositions: np.array = None):
+
+        iteration = self.numIterations - self.firstIteration
+        storedFrames = (iteration + numIter) // self.storeEvery - iteration // self.storeEvery
+        tailIterations = (iteration + numIter) % self.storeEvery
+
+        # The tail is tagged with the number of frames it follows, so isn't used until they are all committed
+        if storedFrames > 0:
+            self.trajectory.commitFrames(storedFrames)
+        self._tail = None if tailIterations == 0 else (len(self.trajectory), tailIterations, latestPositions)
+
+    # Drops the iterations after numIterations (to simulate them again), latestPositions are the positions after
+    # numIterations (only used when it isn't stored)
+    def truncateIterations(self, numIterations: int, latestPositions: np.array = None):
+
+        numIterations -= self.firstIteration
+        if numIterations < 0:
+            raise ValueError(f"The frames start after iteration {numIterations + self.firstIteration}")
+
+        storedFrames = numIterations // self.storeEvery + 1
+        self.trajectory.truncate(storedFrames)
+        if self._frameVelocities is not None:
+            self._frameVelocities.truncate(storedFrames)
+
+        tailIterations = numIterations % self.storeEvery
+        self._tail = None if tailIterations == 0 else (len(self.trajectory), tailIterations, latestPositions)
+
+    # Streams the trajectory (the frames so far and every frame simulated from now on) to the folder path instead of
+    # keeping it in memory, for runs that don't fit in memory
+    def storeTrajectoryOnDisk(self, path: str):
+
+        # Already there (such as a store opened to carry on simulating)
+        if self.trajectoryPath is not None and os.path.abspath(self.trajectoryPath) == os.path.abspath(path):
+            return
+
+        self.trajectoryPath = path
+        if self._trajectory is not None:
+            self._trajectory = self._newTrajectory(self._trajectory.frames)
+        if self._frameVelocities is not None:
+            self._frameVelocities = self._newTrajectory(self._frameVelocities.frames, velocities=True)
+
+    # Writes a trajectory stored on disk out, so that opening it sees every frame stored so far
+    def flush(self):
+
+        self.trajectory.flush()
+        if self._frameVelocities is not None:
+            self._frameVelocities.flush()
+
+    # Particles of a trajectory stored on disk (see storeTrajectoryOnDisk), memory mapped so that frames are only read
+    # from disk when used. Read only unless writable (to simulate further)
+    @classmethod
+    def open(cls, path: str, writable: bool = False):
+
+        trajectory = DiskTrajectory.open(path, writable)
+        numParticles = trajectory.frames.shape[2]
+
+        particleData = cls(dtype=trajectory.frames.dtype)
+        particleData._trajectory = trajectory
+        particleData._initialPositions = None
+        particleData._numParticles = numParticles
+        particleData._velocities = np.zeros((2, numParticles), dtype=trajectory.frames.dtype)
+        particleData._masses = np.zeros(numParticles)
+        particleData.trajectoryPath = path
+        particleData.shapeOffsets = np.array(trajectory.attributes["shapeOffsets"], dtype=np.int64)
+        particleData.dyeRegions = [tuple(region) for region in trajectory.attributes["dyeRegions"]]
+        particleData.storeEvery = trajectory.attributes.get("storeEvery", 1)
+        particleData.firstIteration = trajectory.attributes.get("firstIteration", 0)
+
+        velocitiesPath = os.path.join(path, "velocities")
+        if os.path.exists(os.path.join(velocitiesPath, "index.json")):
+            particleData._frameVelocities = DiskTrajectory.open(velocitiesPath, writable)
+
+        return particleData
+
+    # Particle positions of every stored frame so far (every iteration unless storeEvery is above 1), a view of the
+    # trajectory store
+    @property
+    def positions(self):
+        return self.trajectory.frames
+
+    # Replaces the particles by ones at positions (numFrames, 2, numParticles), as a single shape
+    @positions.setter
+    def positions(self, positions: np.array):
+
+        self._numParticles = np.shape(positions)[2]
+        self.shapeOffsets = np.array([0, self._numParticles], dtype=np.int64)
+        self._trajectory = self._newTrajectory(positions)
+        self._frameVelocities = None
+        self._tail = None
+        self._initialPositions = None
+        self.firstIteration = 0
+
+        if self._velocities.shape[1] < self._numParticles:
+            self._velocities = np.zeros((2, self._numParticles), dtype=self._trajectory.frames.dtype)
+            self._masses = np.zeros(self._numParticles)
+        self._velocities = self._velocities.astype(self._trajectory.frames.dtype, copy=False)
+
+    # Add the positions after an iteration to the trajectory store
+    def appendPositions(self, new_positions: np.array):
+
+        positions = self.nextPositions()
+        positions[:] = new_positions
+        self.commitPositions(positions)
+
+    # Preallocate the trajectory store for numIter more iterations (shared for worker processes)
+    def reserveIterations(self, numIter: int, shared: bool = False):
+
+        iteration = self.numIterations - self.firstIteration
+        storedFrames = (iteration + numIter) // self.storeEvery - iteration // self.storeEvery
+
+        self.trajectory.reserve(storedFrames, shared)
+        if self._frameVelocities is not None:
+            self._frameVelocities.reserve(len(self.trajectory) + storedFrames - len(self._frameVelocities), shared)
+
+    # Positions at time finds the position of a particle for a given time
+    def positionsAtTime(self, iterationIndex: float):
+
+        # Simulate on from the last iteration up to the iterations needed
+        numIterations = self.numIterations
+        if iterationIndex > numIterations and self.simulator is not None:
+            self.simulator(int(np.ceil(iterationIndex)) - numIterations)
+
+        # Taken once, as frames may be added by another thread
+        frames = self.positions
+        tail = self._tail
+        if tail is not None and tail[0] != len(frames):
+            tail = None
+
+        lastStored = self.firstIteration + (len(frames) - 1) * self.storeEvery
+
+        # Check that not accsessing iterations that don't exist
+        if iterationIndex > lastStored + (0 if tail is None else tail[1]):
+            raise ValueError(
+                "Iteration index exceeds what is currently rendered")
+        if iterationIndex < self.firstIteration:
+            raise ValueError(f"Iterations before {self.firstIteration} aren't stored (the run was carried on from a "
+                             "checkpoint without them)")
+
+        # Iterations after the last stored frame are interpolated linearly up to the latest one
+        if iterationIndex > lastStored:
+            fraction = float(iterationIndex - lastStored) / tail[1]
+            return tail[2] if fraction == 1 else frames[-1] * (1 - fraction) + tail[2] * fraction
+
+        # Positions between stored frames are reconstructed from the velocities at them (linearly for a frame whose
+        # velocities aren't stored yet)
+        frameVelocities = None if self.storeEvery == 1 else self._frameVelocities
+        return interpolateFrames(frames, None if frameVelocities is None else frameVelocities.frames, self.storeEvery,
+                                 iterationIndex - self.firstIteration)
+
+    # Time simulated up to the latest iteration, with time steps of timeStep
+    def timePast(self, timeStep: float) -> float:
+        return self.numIterations * timeStep
+
+    # Giving adding dye functionality, the particles of new_particle are copied in after these (as shapes of their
+    # own)
+    def __add__(self, new_particle):  # particleData1 + particleData2
+
+        if not isinstance(new_particle, ParticleData):
+            return NotImplemented
 
         # If no items in new_particle then no effect
-        if new_particle.positions.size == 0:
+        if new_particle.numParticles == 0:
             return self
 
-        # Positions
-        self.positions = np.concatenate(
-            (self.positions,
-             new_particle.positions),
-            axis=2
-        )
-
-        # Velocity
-        self.velocities = np.concatenate(
-            (self.velocities,
-             new_particle.velocities),
-            axis=1
-        )
-
-        # Masses
-        self.masses = np.concatenate(
-            (self.masses,
-             new_particle.masses),
-            axis=1
-        )
-
-        # Shape starts
-        shapeStartOffset = len(self.shapeStarts) - 1
-        self.shapeStarts += [shapeStart +
-                             shapeStartOffset for shapeStart in new_particle.shapeStarts]
+        new_positions = new_particle.positions[0]
+        offset = self._numParticles
+        self.addShape(new_particle.numParticles)[:] = new_positions
+
+        self._velocities[:, offset:self._numParticles] = new_particle.velocities
+        self._masses[offset:self._numParticles] = new_particle.masses
+
+        # The whole of new_particle was added as one shape, which is split back into its own shapes
+        self.shapeOffsets = np.concatenate((self.shapeOffsets[:-1], offset + new_particle.shapeOffsets[1:]))
+        self.dyeRegions = self.dyeRegions + new_particle.dyeRegions
 
         return self
 
@@ -136,10 +553,16 @@ class PlottingData():
     plotInitPoints = True
     plotFinalPoints = True
 
+    # Draw the area the rectangle and circle dyes have been carried to, by tracing every pixel back to the start (see
+    # backwardMap.py), in plotParticles. finalRegionResolution is the number of pixels across the plot
+    plotFinalRegion = False
+    finalRegionResolution = 400
+
     # Save settings
     plotFolderFormat = "%Y-%m-%d %HH"
     plotFileFormat = "%Y-%m-%d %HH%MM%SS"
     plotSaveType = "png"
+    plotSaveDpi = 800
 
     # Plot dimentions
     plotSimWidth = 4
@@ -155,9 +578,39 @@ class PlottingData():
     minVelocity = -10
     streamLinesPlotDensity = 0.5
 
+    # How the streamlines are found (see streamlines.py): "contour" draws contours of the flow's stream function,
+    # "trace" traces all the seeds at once, "streamplot" uses plt.streamplot and "auto" uses contour when the flow has a
+    # stream function and trace otherwise
+    streamlineMethod = "auto"
+
+    # Reuse flow maps and streamlines of the same flow, bounds, resolution and clip limits (see flowMapCache.py),
+    # kept in memory and in .flowcache/flowmaps between runs
+    cacheFlowMaps = True
+    cacheFlowMapsOnDisk = True
+
     # Plotting axis labels
     xLabel = "x"
     yLabel = "y"
 
     # Interactive plot settings
     timeSteps_range = (0, 100)
+
+    # Memory for the dye positions interpolated between iterations kept by the interactive plot
+    frameCacheBytes = 256 * 2 ** 20
+
+    # Exported animations (see Plotting.exportAnimation), saved as plotSaveType is when no path is given. Frames are
+    # rendered by animationWorkers processes (1 renders them in this process)
+    animationSaveType = "mp4"
+    animationFps = 20
+    animationDpi = 100
+    animationWorkers = 1
+
+    # How the dye is drawn (see densityRaster.py): "vector" draws every particle as a marker, "raster" bins the
+    # particles (and the dye lines) into an image at the resolution of the plot, so drawing takes the same time however
+    # many particles there are, and "auto" rasterizes dyes of more than rasterMinParticles particles
+    dyeRendering = "auto"
+    rasterMinParticles = 200000
+    rasterAntialias = True
+
+    # The legend goes in the upper right instead of the best location with more particles than this
+    bestLegendMaxParticles = 100000
@@ -0,0 +1,43 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# Tests are run from a checkout so the modules are imported from the folder above
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from structs import ParticleData  # noqa: E402
+from useCustomFlow import Flow  # noqa: E402
+
+
+# Makes the flow of a solid body rotation about the origin, the particles move round circles at strength radians per
+# unit time
+@pytest.fixture
+def rotation():
+
+    def rotation(strength: float = 1.0):
+
+        flow = Flow()
+        flow.cartesianFlow(lambda x, y: - strength * y, lambda x, y: strength * x)
+        return flow.getSimFlowFunc()
+
+    return rotation
+
+
+# Makes particles along the x axis from 0.5 to 1.5 (a line through the rotation), stored on disk at trajectoryPath
+# when given
+@pytest.fixture
+def lineParticles():
+
+    def lineParticles(numParticles: int = 20, storeEvery: int = 1, trajectoryPath: str = None) -> ParticleData:
+
+        particleData = ParticleData()
+        particleData.positions = np.array([[np.linspace(0.5, 1.5, numParticles), np.zeros(numParticles)]])
+        particleData.setStoreEvery(storeEvery)
+        if trajectoryPath is not None:
+            particleData.storeTrajectoryOnDisk(trajectoryPath)
+
+        return particleData
+
+    return lineParticles
@@ -0,0 +1,103 @@
+import warnings
+
+import numpy as np
+import pytest
+
+from autodiff import complexDerivative, gradient2D
+from useCustomFlow import Flow
+
+
+# Points around (but not at) the origin
+_x, _y = np.meshgrid(np.linspace(- 2, 2, 9), np.linspace(- 1.25, 2.75, 9))
+_x, _y = _x.ravel(), _y.ravel()
+_rSquared = _x ** 2 + _y ** 2
+
+# Velocities of a vortex of circulation 3, a source of strength 2 and a stream of speed 1.5 along x, at the points
+_vortexVelocities = (- 3 * _y / (2 * np.pi * _rSquared), 3 * _x / (2 * np.pi * _rSquared))
+_sourceVelocities = (2 * _x / (2 * np.pi * _rSquared), 2 * _y / (2 * np.pi * _rSquared))
+_streamVelocities = (np.full(_x.shape, 1.5), np.zeros(_x.shape))
+
+_streamFunctions = [
+    (lambda x, y: - 3 / (4 * np.pi) * np.log(x ** 2 + y ** 2), _vortexVelocities),
+    (lambda x, y: 2 / (2 * np.pi) * np.arctan2(y, x), _sourceVelocities),
+    (lambda x, y: 1.5 * y, _streamVelocities)
+]
+
+_complexPotentials = [
+    (lambda z: - 3j / (2 * np.pi) * np.log(z), _vortexVelocities),
+    (lambda z: 2 / (2 * np.pi) * np.log(z), _sourceVelocities),
+    (lambda z: 1.5 * z, _streamVelocities)
+]
+
+
+# Velocities of flow at the points, failing if automatic differentiation fell back to finite differences
+def _exactVelocities(flow: Flow):
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        return flow.getSimFlowFunc().vxy(_x, _y)
+
+
+@pytest.mark.parametrize("streamFunction, expected", _streamFunctions)
+def test_streamFunctionVelocities(streamFunction, expected):
+
+    flow = Flow()
+    flow.streamFunctionFlow(streamFunction)
+
+    assert np.allclose(_exactVelocities(flow), expected, rtol=1e-13, atol=1e-13)
+
+
+@pytest.mark.parametrize("complexPotential, expected", _complexPotentials)
+def test_complexPotentialVelocities(complexPotential, expected):
+
+    flow = Flow()
+    flow.complexPotentialFlow(complexPotential)
+
+    assert np.allclose(_exactVelocities(flow), expected, rtol=1e-13, atol=1e-13)
+
+
+def test_derivatives():
+
+    x, y = np.array([- 1.5, 0.5, 2.0]), np.array([1.0, - 2.0, 3.0])
+
+    gradientX, gradientY = gradient2D(lambda x, y: np.abs(x) * y ** 2 + np.sin(x * y), x, y)
+    assert np.allclose(gradientX, np.sign(x) * y ** 2 + y * np.cos(x * y))
+    assert np.allclose(gradientY, 2 * np.abs(x) * y + x * np.cos(x * y))
+
+    z = x + y * 1j
+    assert np.allclose(complexDerivative(lambda z: z ** 3 + np.exp(z), z), 3 * z ** 2 + np.exp(z))
+
+    # A constant potential has no velocity
+    assert np.array_equal(complexDerivative(lambda z: 2.0, z), np.zeros(3))
+
+
+def test_complexAbsoluteIsRefused():
+
+    with pytest.raises(TypeError):
+        complexDerivative(lambda z: np.absolute(z), np.array([1 + 1j]))
+
+
+def test_fallbackToFiniteDifferences():
+
+    # np.fmod isn't supported by automatic differentiation, so the flow switches to finite differences (psi = x y
+    # between 0 and 10)
+    flow = Flow()
+    flow.streamFunctionFlow(lambda x, y: np.fmod(x, 10) * y)
+    vxy = flow.getSimFlowFunc().vxy
+    x, y = np.array([1.0, 2.5, 4.0]), np.array([- 1.0, 0.5, 3.0])
+
+    with pytest.warns(UserWarning, match="using finite differences"):
+        vx, vy = vxy(x, y)
+    assert np.allclose(vx, x, rtol=1e-8)
+    assert np.allclose(vy, - y, rtol=1e-8)
+
+    # Only warned about once, later calls go straight to finite differences
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        vxy(x, y)
+
+    # The same for a complex potential using |z|, which has no complex derivative
+    flow = Flow()
+    flow.complexPotentialFlow(lambda z: z * np.absolute(z))
+    with pytest.warns(UserWarning, match="using finite differences"):
+        flow.getSimFlowFunc().vxy(x, y)
@@ -0,0 +1,124 @@
+import numpy as np
+import pytest
+
+from structs import ParticleData, SimSetupData
+from iterator import iterateParticles
+from checkpoint import writeCheckpoint, readCheckpoint, resumeParticleData
+from useCustomFlow import Flow
+
+
+class _Strength():
+    value = 1.0
+
+
+# Read by a flow, which then has no fingerprint (an instance can't be hashed)
+_strength = _Strength()
+
+
+# Solid body rotation at the strength of _strength
+def _unhashableRotation():
+
+    flow = Flow()
+    flow.cartesianFlow(lambda x, y: - _strength.value * y, lambda x, y: _strength.value * x)
+    return flow.getSimFlowFunc()
+
+
+def _iterate(particleData: ParticleData, flowData, setupData: SimSetupData, numIter: int):
+    for _ in range(numIter):
+        iterateParticles(particleData, flowData, setupData)
+
+
+def test_roundTrip(tmp_path, rotation, lineParticles):
+
+    flowData = rotation()
+    setupData = SimSetupData(timeStep=0.05, integrator="dopri5")
+    particleData = lineParticles()
+    _iterate(particleData, flowData, setupData, 5)
+
+    path = str(tmp_path / "state.npz")
+    writeCheckpoint(path, particleData, setupData, flowData)
+    checkpoint = readCheckpoint(path)
+
+    assert checkpoint["iteration"] == 5
+    assert checkpoint["fingerprint"] == flowData.fingerprint
+    assert checkpoint["setup"]["integrator"] == "dopri5"
+    assert np.array_equal(checkpoint["positions"], particleData.latestPositions)
+    assert np.array_equal(checkpoint["velocities"], particleData.velocities)
+    assert np.array_equal(checkpoint["stepSizes"], particleData.stepSizes)
+
+
+@pytest.mark.parametrize("onDisk", [True, False])
+def test_resumeMatchesUninterruptedRun(tmp_path, rotation, lineParticles, onDisk):
+
+    flowData = rotation()
+    setupData = SimSetupData(timeStep=0.05, integrator="dopri5")
+    reference = lineParticles()
+    _iterate(reference, flowData, setupData, 12)
+
+    # Checkpointed after 8 iterations, then carried on past it before stopping
+    path = str(tmp_path / "state.npz")
+    particleData = lineParticles(trajectoryPath=str(tmp_path / "run") if onDisk else None)
+    _iterate(particleData, flowData, setupData, 8)
+    writeCheckpoint(path, particleData, setupData, flowData)
+    _iterate(particleData, flowData, setupData, 2)
+
+    resumed = resumeParticleData(path, flowData, setupData)
+    assert resumed.numIterations == 8
+    _iterate(resumed, flowData, setupData, 4)
+
+    assert resumed.numIterations == 12
+    for iteration in range(0 if onDisk else 8, 13):
+        assert np.array_equal(resumed.positionsAtTime(iteration), reference.positions[iteration])
+
+    # Without the trajectory on disk the iterations before the checkpoint are gone
+    if not onDisk:
+        assert resumed.firstIteration == 8
+        with pytest.raises(ValueError):
+            resumed.positionsAtTime(7)
+
+
+def test_resumeRefusesOtherFlowsAndSetups(tmp_path, rotation, lineParticles):
+
+    setupData = SimSetupData(timeStep=0.05)
+    particleData = lineParticles()
+    _iterate(particleData, rotation(), setupData, 3)
+
+    path = str(tmp_path / "state.npz")
+    writeCheckpoint(path, particleData, setupData, rotation())
+
+    with pytest.raises(ValueError, match="fingerprints differ"):
+        resumeParticleData(path, rotation(2.0), setupData)
+    with pytest.raises(ValueError, match="timeStep changed"):
+        resumeParticleData(path, rotation(), SimSetupData(timeStep=0.1))
+
+
+def test_resumeWithoutFingerprintNeedsForce(tmp_path, lineParticles):
+
+    flowData = _unhashableRotation()
+    assert flowData.fingerprint is None
+
+    setupData = SimSetupData(timeStep=0.05)
+    particleData = lineParticles()
+    _iterate(particleData, flowData, setupData, 3)
+
+    path = str(tmp_path / "state.npz")
+    writeCheckpoint(path, particleData, setupData, flowData)
+
+    with pytest.raises(ValueError, match="no fingerprint"):
+        resumeParticleData(path, flowData, setupData)
+    assert resumeParticleData(path, flowData, setupData, force=True).numIterations == 3
+
+
+def test_resumeWithMissingTrajectory(tmp_path, rotation, lineParticles):
+
+    flowData = rotation()
+    setupData = SimSetupData(timeStep=0.05)
+    particleData = lineParticles(trajectoryPath=str(tmp_path / "run"))
+    _iterate(particleData, flowData, setupData, 3)
+
+    path = str(tmp_path / "state.npz")
+    writeCheckpoint(path, particleData, setupData, flowData)
+    (tmp_path / "run").rename(tmp_path / "moved")
+
+    with pytest.raises(FileNotFoundError):
+        resumeParticleData(path, flowData, setupData)
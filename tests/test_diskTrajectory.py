@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+from structs import ParticleData, SimSetupData
+from iterator import iterateParticles
+from trajectory import DiskTrajectory
+
+
+def _frames(numFrames: int, numParticles: int = 10) -> np.array:
+    return np.arange(numFrames * 2 * numParticles, dtype=np.float64).reshape(numFrames, 2, numParticles)
+
+
+def test_reopen(tmp_path):
+
+    frames = _frames(5)
+    trajectory = DiskTrajectory(str(tmp_path), frames[:3], {"note": "kept"})
+    trajectory.append(frames[3])
+    trajectory.append(frames[4])
+    trajectory.flush()
+
+    reopened = DiskTrajectory.open(str(tmp_path))
+    assert len(reopened) == 5
+    assert reopened.attributes == {"note": "kept"}
+    assert np.array_equal(reopened.frames, frames)
+
+    # Opened read only unless writable
+    with pytest.raises(ValueError):
+        reopened.append(frames[0])
+
+
+# The index is only written when the store is flushed (or grown), not as each frame is committed
+def test_indexWrittenOnFlush(tmp_path):
+
+    frames = _frames(4)
+    trajectory = DiskTrajectory(str(tmp_path), frames[:2])
+    trajectory.append(frames[2])
+    trajectory.append(frames[3])
+    assert len(DiskTrajectory.open(str(tmp_path))) == 2
+
+    trajectory.flush()
+    reopened = DiskTrajectory.open(str(tmp_path))
+    assert len(reopened) == 4
+    assert np.array_equal(reopened.frames, frames)
+
+
+def test_truncateAndReopen(tmp_path):
+
+    frames = _frames(6)
+    trajectory = DiskTrajectory(str(tmp_path), frames)
+    trajectory.truncate(4)
+    assert len(DiskTrajectory.open(str(tmp_path))) == 4
+
+    # Frames after the truncation are written again
+    writable = DiskTrajectory.open(str(tmp_path), writable=True)
+    writable.append(frames[0])
+    writable.flush()
+    reopened = DiskTrajectory.open(str(tmp_path))
+    assert len(reopened) == 5
+    assert np.array_equal(reopened.frames[:4], frames[:4])
+    assert np.array_equal(reopened.frames[4], frames[0])
+
+
+def test_growKeepsFrames(tmp_path, monkeypatch):
+
+    # Grown a few frames at a time, so the file is extended many times
+    monkeypatch.setattr(DiskTrajectory, "chunkBytes", 2 * 10 * 8 * 3)
+
+    frames = _frames(50)
+    trajectory = DiskTrajectory(str(tmp_path), frames[:1])
+    first = trajectory.frames
+    for frame in frames[1:]:
+        trajectory.append(frame)
+    trajectory.flush()
+
+    assert np.array_equal(first, frames[:1])
+    assert np.array_equal(DiskTrajectory.open(str(tmp_path)).frames, frames)
+
+
+def test_particleDataOnDisk(tmp_path, rotation, lineParticles):
+
+    flowData = rotation()
+    setupData = SimSetupData(timeStep=0.05)
+    inMemory, onDisk = lineParticles(), lineParticles(trajectoryPath=str(tmp_path / "run"))
+
+    for _ in range(10):
+        iterateParticles(inMemory, flowData, setupData)
+        iterateParticles(onDisk, flowData, setupData)
+    onDisk.flush()
+
+    opened = ParticleData.open(str(tmp_path / "run"))
+    assert opened.numIterations == 10
+    assert np.array_equal(opened.positions, inMemory.positions)
+    assert np.array_equal(opened.shapeOffsets, inMemory.shapeOffsets)
@@ -0,0 +1,152 @@
+import matplotlib
+import numpy as np
+import pytest
+
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt  # noqa: E402
+
+from structs import ParticleData, PlottingData  # noqa: E402
+from flowMapCache import FlowMapCache, cacheKey, flowMapCache  # noqa: E402
+from plotter import Plotting  # noqa: E402
+from useCustomFlow import Flow  # noqa: E402
+
+
+# Read by _scaledRotation, changed by the tests to check the flow's fingerprint follows it
+_scale = np.array([1.0])
+
+
+# Solid body rotation at the strength of _scale
+def _scaledRotation():
+
+    flow = Flow()
+    flow.cartesianFlow(lambda x, y: - _scale[0] * y, lambda x, y: _scale[0] * x)
+    return flow.getSimFlowFunc()
+
+
+# An entry of nbytes bytes
+def _entry(nbytes: int, value: float = 0.0):
+    return {"values": np.full(nbytes // 8, value)}
+
+
+def test_getAndPut(tmp_path):
+
+    cache = FlowMapCache(folder=str(tmp_path))
+    assert cache.get("key", useDisk=False) is None
+
+    entry = _entry(64)
+    cache.put("key", entry, useDisk=False)
+
+    assert cache.get("key", useDisk=False) is entry
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert not any(tmp_path.iterdir())
+
+
+def test_leastRecentlyUsedEvicted(tmp_path):
+
+    cache = FlowMapCache(maxBytes=3 * 800, folder=str(tmp_path))
+    for key in ("a", "b", "c"):
+        cache.put(key, _entry(800), useDisk=False)
+
+    # Using a makes b the least recently used
+    cache.get("a", useDisk=False)
+    cache.put("d", _entry(800), useDisk=False)
+
+    assert cache.get("b", useDisk=False) is None
+    for key in ("a", "c", "d"):
+        assert cache.get(key, useDisk=False) is not None
+
+    # An entry over the limit on its own is still kept
+    cache.put("e", _entry(8000), useDisk=False)
+    assert cache.get("e", useDisk=False) is not None
+    assert cache.get("d", useDisk=False) is None
+
+
+def test_diskRoundTrip(tmp_path):
+
+    entry = _entry(800, 1.5)
+    FlowMapCache(folder=str(tmp_path)).put("key", entry)
+
+    cache = FlowMapCache(folder=str(tmp_path))
+    loaded = cache.get("key")
+
+    assert cache.diskHits == 1
+    assert np.array_equal(loaded["values"], entry["values"])
+
+    # Read from memory after the first time
+    assert cache.get("key") is loaded
+    assert cache.hits == 1
+
+
+def test_unreadableFileIsMissing(tmp_path):
+
+    (tmp_path / "key.npz").write_bytes(b"not an npz file")
+
+    cache = FlowMapCache(folder=str(tmp_path))
+    assert cache.get("key") is None
+    assert not (tmp_path / "key.npz").exists()
+
+
+def test_cacheKey():
+
+    assert cacheKey("flow", 1.0, 300) == cacheKey("flow", 1.0, 300)
+    assert cacheKey("flow", np.float64(1.0), np.int64(300)) == cacheKey("flow", 1.0, 300)
+    assert cacheKey("flow", np.array([0, 1])) == cacheKey("flow", [0, 1])
+
+    assert cacheKey("flow", 1.0, 300) != cacheKey("flow", 1.0, 301)
+    assert cacheKey("flow", 1.0) != cacheKey("flow", "1.0")
+    assert cacheKey("ab", "c") != cacheKey("a", "bc")
+
+
+# A flow reading a global array that changed must not be served the flow maps of the flow before the change
+def test_flowKeyFollowsGlobals():
+
+    plottingData = PlottingData()
+
+    try:
+        before = Plotting(_scaledRotation(), ParticleData(), plottingData)
+        same = Plotting(_scaledRotation(), ParticleData(), plottingData)
+
+        _scale[0] = 2.0
+        after = Plotting(_scaledRotation(), ParticleData(), plottingData)
+
+    finally:
+        _scale[0] = 1.0
+
+    assert before.flowData.fingerprint is not None
+    assert before._flowMapKey() == same._flowMapKey()
+    assert before._flowMapKey() != after._flowMapKey()
+
+
+# Streamlines drawn from the cache look the same as those plt.streamplot drew in the first place
+def test_cachedStreamplotMatches(rotation):
+
+    plottingData = PlottingData()
+    plottingData.streamlineMethod = "streamplot"
+    plottingData.flowMapResolution = 50
+    plottingData.cacheFlowMapsOnDisk = False
+
+    plotting = Plotting(rotation(), ParticleData(), plottingData)
+    flowMapCache.clear()
+    flowMapCache.hits = 0
+
+    axes = []
+    for _ in range(2):
+        figure, ax = plt.subplots()
+        plotting._plotStreamlines(ax, 2.0)
+        figure.canvas.draw()
+        axes.append(ax)
+
+    assert flowMapCache.hits == 1
+    drawn, cached = axes
+    assert len(drawn.patches) == len(cached.patches) > 0
+    for drawnArrow, cachedArrow in zip(drawn.patches, cached.patches):
+        assert drawnArrow.get_linewidth() == pytest.approx(cachedArrow.get_linewidth())
+        assert np.allclose(drawnArrow.get_path().vertices, cachedArrow.get_path().vertices)
+
+    drawnLines, = drawn.collections
+    cachedLines, = cached.collections
+    assert np.allclose(np.concatenate(drawnLines.get_segments()), np.concatenate(cachedLines.get_segments()))
+
+    plt.close("all")
+    flowMapCache.clear()
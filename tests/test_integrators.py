@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from structs import SimSetupData
+from iterator import advancePositions
+from integrators import rk4Step
+
+
+# Largest distance of the particles from where the rotation takes them after advancing duration with setupData
+def _rotationError(flowData, setupData: SimSetupData, duration: float = 1.0) -> float:
+
+    start = np.array([np.linspace(0.5, 1.5, 20), np.zeros(20)])
+    positions, stepSizes = start, None
+    for _ in range(round(duration / setupData.timeStep)):
+        positions, _, stepSizes = advancePositions(positions, flowData, setupData, stepSizes)
+
+    exact = start[0] * np.array([[np.cos(duration)], [np.sin(duration)]])
+    return np.abs(positions - exact).max()
+
+
+def test_rk4IsFourthOrder(rotation):
+
+    # Halving the time step divides the error by about 16
+    errors = [_rotationError(rotation(), SimSetupData(timeStep=timeStep, integrator="rk4"))
+              for timeStep in (0.2, 0.1, 0.05)]
+
+    assert 13 < errors[0] / errors[1] < 17
+    assert 13 < errors[1] / errors[2] < 17
+    assert errors[2] < 1e-7
+
+
+def test_rk4TakesOneSubstepByDefault():
+
+    calls = []
+
+    def velocityFunc(positions, out):
+        calls.append(positions.shape)
+        return np.negative(positions, out=out)
+
+    positions = np.ones((2, 5))
+    _, velocities, _ = rk4Step(positions, velocityFunc, 0.1, SimSetupData(timeStep=0.1, integrator="rk4"))
+
+    # Four stages and the velocity at the new positions
+    assert len(calls) == 5
+    assert np.allclose(velocities, - np.exp(- 0.1) * positions)
+
+    calls.clear()
+    rk4Step(positions, velocityFunc, 0.1, SimSetupData(timeStep=0.1, integrator="rk4", subtimeSteps=4))
+    assert len(calls) == 17
+
+
+@pytest.mark.parametrize("relativeTolerance", [1e-4, 1e-6, 1e-8])
+def test_dopri5WithinTolerance(rotation, relativeTolerance):
+
+    # A whole radian in one time step, the particles (up to 1.5 from the origin) sub-cycle to stay within tolerance
+    setupData = SimSetupData(timeStep=1.0, integrator="dopri5", relativeTolerance=relativeTolerance,
+                             absoluteTolerance=relativeTolerance / 100)
+
+    assert _rotationError(rotation(), setupData) < 1.5 * relativeTolerance
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from structs import SimSetupData
+from iterator import iterateParticles
+from parallel import ParallelIterator, forkSafeThreading
+
+
+# The flow is handed to forked workers (spawned ones would need cloudpickle to be sent the lambdas)
+pytestmark = pytest.mark.skipif(not forkSafeThreading(), reason="worker processes can't be forked")
+
+
+@pytest.mark.parametrize("integrator", ["euler", "dopri5"])
+@pytest.mark.parametrize("storeEvery", [1, 5])
+def test_workersMatchOneProcess(rotation, lineParticles, integrator, storeEvery):
+
+    flowData = rotation()
+    setupData = SimSetupData(timeStep=0.05, integrator=integrator, storeEvery=storeEvery, workers=2)
+
+    serial = lineParticles(200, storeEvery)
+    for _ in range(12):
+        iterateParticles(serial, flowData, setupData)
+
+    # Run in two goes, the first ending between stored frames when only every 5th is stored
+    parallel = lineParticles(200, storeEvery)
+    iterator = ParallelIterator(flowData, setupData, 2)
+    try:
+        iterator.iterate(parallel, 7)
+        iterator.iterate(parallel, 5)
+    finally:
+        iterator.close()
+
+    assert parallel.numIterations == 12
+    assert np.array_equal(parallel.positions, serial.positions)
+    assert np.array_equal(parallel.latestPositions, serial.latestPositions)
+    assert np.array_equal(parallel.velocities, serial.velocities)
+
+    if integrator == "dopri5":
+        assert np.array_equal(parallel.stepSizes, serial.stepSizes)
+    if storeEvery > 1:
+        assert np.array_equal(parallel.frameVelocities.frames, serial.frameVelocities.frames)
+        assert np.array_equal(parallel.positionsAtTime(8), serial.positionsAtTime(8))
@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+
+from sampledField import SampledField
+from useCustomFlow import Flow
+
+
+# A vortex on a grid point of the field (its velocity there is 0 rather than singular) in a uniform stream
+def _vortexInStream():
+
+    flow = Flow()
+    flow.vortices([0.0, 0.0], [2 * np.pi])
+    flow.uniformStream((1.0, 0.0))
+    return flow.getSimFlowFunc()
+
+
+_x, _y = np.random.default_rng(0).uniform(- 2, 2, (2, 50000))
+
+
+@pytest.mark.parametrize("interpolation", ["bilinear", "bicubic"])
+def test_errorWithinTolerance(interpolation):
+
+    flowData = _vortexInStream()
+    field = SampledField(flowData, - 2, 2, - 2, 2, resolution=41, interpolation=interpolation, exactTolerance=1e-2)
+    assert field.exactCells.any()
+    assert field.maxError <= 1e-2
+
+    vxs, vys = field.velocities(_x, _y)
+    exactVxs, exactVys = flowData.vxy(_x, _y)
+    errors = np.hypot(vxs - exactVxs, vys - exactVys)
+
+    # Points in the exact cells (round the vortex) are evaluated exactly, the rest are within about the tolerance
+    _, _, ix, iy, _ = field._locate(_x, _y)
+    exact = field.exactCells[iy, ix]
+    assert exact.any()
+    assert np.array_equal(vxs[exact], exactVxs[exact])
+    assert np.array_equal(vys[exact], exactVys[exact])
+    assert errors[~ exact].max() < 1.2e-2
+
+
+def test_cellErrorBoundsTheError():
+
+    # Without a tolerance every cell is interpolated, the cell errors bound the error across each cell
+    flowData = _vortexInStream()
+    field = SampledField(flowData, - 2, 2, - 2, 2, resolution=41)
+
+    vxs, vys = field.velocities(_x, _y)
+    exactVxs, exactVys = flowData.vxy(_x, _y)
+    errors = np.hypot(vxs - exactVxs, vys - exactVys)
+
+    # Away from the cells round the vortex, where the flow isn't smooth
+    _, _, ix, iy, _ = field._locate(_x, _y)
+    away = np.hypot(_x, _y) > 0.3
+    assert np.all(errors[away] <= field.cellError[iy, ix][away])
+
+
+def test_singularCellsAndPointsOutsideAreExact():
+
+    # A source on the grid point at the origin, the four cells round it can't be interpolated
+    flow = Flow()
+    flow.streamFunctionFlow(lambda x, y: np.arctan2(y, x) / (2 * np.pi))
+    flowData = flow.getSimFlowFunc()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        field = SampledField(flowData, - 2, 2, - 2, 2, resolution=41)
+
+    singularCells = np.zeros(field.exactCells.shape, dtype=bool)
+    singularCells[19:21, 19:21] = True
+    assert np.array_equal(field.exactCells, singularCells)
+
+    x = np.array([0.05, - 0.02, 3.0, np.nan, np.inf, 1.0])
+    y = np.array([0.03, - 0.07, 0.5, 0.0, 1.0, - 1.0])
+    with np.errstate(invalid="ignore"):
+        vxs, vys = field.velocities(x, y)
+        exactVxs, exactVys = flowData.vxy(x, y)
+
+    # Near the source, outside the grid and not finite
+    assert np.array_equal(vxs[:5], exactVxs[:5], equal_nan=True)
+    assert np.array_equal(vys[:5], exactVys[:5], equal_nan=True)
+    assert np.isclose(vxs[5], exactVxs[5], rtol=1e-2) and np.isclose(vys[5], exactVys[5], rtol=1e-2)
+
+
+def test_fingerprint():
+
+    flowData = _vortexInStream()
+    field = SampledField(flowData, - 2, 2, - 2, 2, resolution=41)
+
+    assert field.getSimFlowFunc().fingerprint == field.fingerprint
+    assert field.fingerprint not in (None, flowData.fingerprint)
+    assert field.fingerprint == SampledField(flowData, - 2, 2, - 2, 2, resolution=41).fingerprint
+    assert field.fingerprint != SampledField(flowData, - 2, 2, - 2, 2, resolution=51).fingerprint
+    assert field.fingerprint != SampledField(flowData, - 2, 2, - 2, 2, resolution=41,
+                                             interpolation="bicubic").fingerprint
@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+from structs import ParticleData, SimSetupData
+from iterator import iterateParticles
+from trajectory import interpolateFrames
+
+
+# The particles simulated numIter iterations through flowData (storing every particleData.storeEvery-th)
+def _simulate(particleData: ParticleData, flowData, numIter: int) -> ParticleData:
+
+    setupData = SimSetupData(timeStep=0.05, storeEvery=particleData.storeEvery)
+    for _ in range(numIter):
+        iterateParticles(particleData, flowData, setupData)
+
+    return particleData
+
+
+# Frames and velocities (change in position per iteration) of a particle on the unit circle, stored every storeEvery
+# iterations of angle step, and the exact positions at each iteration
+def _circleFrames(storeEvery: int, step: float, numFrames: int):
+
+    angles = np.arange(numFrames) * storeEvery * step
+    frames = np.stack([np.cos(angles), np.sin(angles)])[:, None].transpose(2, 0, 1)
+    velocities = np.stack([- np.sin(angles), np.cos(angles)])[:, None].transpose(2, 0, 1) * step
+
+    return frames, velocities
+
+
+def test_storedIterationsAreExact(rotation, lineParticles):
+
+    full = _simulate(lineParticles(), rotation(), 20)
+    decimated = _simulate(lineParticles(storeEvery=5), rotation(), 20)
+
+    assert len(decimated.positions) == 5
+    for iteration in range(0, 21, 5):
+        assert np.array_equal(decimated.positionsAtTime(iteration), full.positions[iteration])
+
+
+def test_hermiteIsFourthOrder():
+
+    # Halving the spacing of the frames divides the error by about 16 (4 for linear interpolation)
+    errors = {}
+    for storeEvery in (4, 8):
+        frames, velocities = _circleFrames(storeEvery, 0.05, 64 // storeEvery + 1)
+
+        hermite, linear = [], []
+        for iterationIndex in np.arange(0, 64, 0.5):
+            angle = iterationIndex * 0.05
+            exact = np.array([[np.cos(angle)], [np.sin(angle)]])
+            hermite.append(np.abs(interpolateFrames(frames, velocities, storeEvery, iterationIndex) - exact).max())
+            linear.append(np.abs(interpolateFrames(frames, None, storeEvery, iterationIndex) - exact).max())
+
+        errors[storeEvery] = (max(hermite), max(linear))
+
+    assert errors[8][0] / errors[4][0] > 12
+    assert 3 < errors[8][1] / errors[4][1] < 5
+    assert errors[4][0] < errors[4][1] / 100
+
+
+def test_linearWithoutVelocities():
+
+    frames = np.array([[[0.0], [0.0]], [[4.0], [8.0]], [[8.0], [0.0]]])
+
+    # The weights favour the nearer frame
+    assert np.allclose(interpolateFrames(frames, None, 4, 1), [[1.0], [2.0]])
+    assert np.allclose(interpolateFrames(frames, None, 1, 0.25), [[1.0], [2.0]])
+
+    # A frame whose velocities aren't stored yet is interpolated linearly
+    velocities = np.ones((1, 2, 1))
+    assert np.allclose(interpolateFrames(frames, velocities, 4, 6), [[6.0], [4.0]])
+
+    # Stored iterations are views of the frames
+    assert interpolateFrames(frames, velocities, 4, 4).base is not None
+
+
+def test_iterationsAfterTheLastStoredFrame(rotation, lineParticles):
+
+    full = _simulate(lineParticles(), rotation(), 13)
+    particleData = _simulate(lineParticles(storeEvery=5), rotation(), 13)
+
+    assert particleData.numIterations == 13
+    assert len(particleData.positions) == 3
+    assert np.array_equal(particleData.latestPositions, full.positions[13])
+    assert np.array_equal(particleData.positionsAtTime(13), full.positions[13])
+
+    # Linear from the last stored frame (iteration 10) to the latest positions
+    expected = full.positions[10] * 2 / 3 + full.positions[13] / 3
+    assert np.allclose(particleData.positionsAtTime(11), expected)
+
+    with pytest.raises(ValueError):
+        particleData.positionsAtTime(14)
+
+
+# The time of the latest positions doesn't depend on how many frames are stored
+@pytest.mark.parametrize("storeEvery", [1, 4])
+def test_timePast(rotation, lineParticles, storeEvery):
+
+    particleData = _simulate(lineParticles(storeEvery=storeEvery), rotation(), 10)
+    assert particleData.timePast(0.05) == pytest.approx(0.5)
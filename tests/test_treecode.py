@@ -0,0 +1,48 @@
+import numpy as np
+
+from treecode import ElementTree
+from useCustomFlow import Flow
+
+
+# Flow of 2000 random vortices and 1000 random doublets inside [-2, 2]^2 (enough to be summed with the tree)
+def _randomFlow() -> Flow:
+
+    rng = np.random.default_rng(0)
+    flow = Flow()
+    flow.vortices(rng.uniform(- 2, 2, (2000, 2)), rng.normal(size=2000))
+    flow.doublets(rng.uniform(- 2, 2, (1000, 2)), rng.normal(size=1000), rng.uniform(0, 2 * np.pi, 1000))
+
+    return flow
+
+
+# Points over and around the elements
+_x, _y = np.random.default_rng(1).uniform(- 2.5, 2.5, (2, 2000))
+
+
+# Error of the velocities at the points relative to the mean speed of the direct summation
+def _relativeErrors(flow: Flow, vxs: np.array, vys: np.array) -> np.array:
+
+    directVxs, directVys = flow.elements.velocities(_x, _y)
+    return np.hypot(vxs - directVxs, vys - directVys) / np.mean(np.hypot(directVxs, directVys))
+
+
+def test_flowUsesTreeSummation():
+
+    flow = _randomFlow()
+    assert len(flow.elements) >= flow.elements.minTreeElements
+
+    errors = _relativeErrors(flow, *flow.getSimFlowFunc().vxy(_x, _y))
+    assert flow._elementTree is not None
+
+    # About 5e-6 and 5e-4 with the default opening angle and order
+    assert np.median(errors) < 5e-5
+    assert errors.max() < 5e-3
+
+
+def test_smallerOpeningAngleIsMoreAccurate():
+
+    flow = _randomFlow()
+    errors = _relativeErrors(flow, *ElementTree(flow.elements.parameters, 16).velocities(_x, _y, 0.3))
+
+    assert np.median(errors) < 1e-9
+    assert errors.max() < 2e-8
@@ -0,0 +1,288 @@
+from multiprocessing import shared_memory
+import json
+import os
+import threading
+import weakref
+
+import numpy as np
+
+
+# Positions at a (fractional) iteration index from frames stored every storeEvery iterations. Iterations between
+# frames are reconstructed by cubic Hermite interpolation from the positions and velocities (change in position per
+# iteration) at the frames on either side, or linearly when every iteration is stored (velocities is then None). Stored
+# iterations are returned as views of the frames
+def interpolateFrames(frames: np.array, velocities: np.array, storeEvery: int, iterationIndex: float) -> np.array:
+
+    frame = min(int(np.floor(iterationIndex / storeEvery)), len(frames) - 1)
+    fraction = float(iterationIndex / storeEvery - frame)
+    if fraction == 0:
+        return frames[frame]
+
+    start = frames[frame]
+    end = frames[frame + 1]
+    if velocities is None or len(velocities) <= frame + 1:
+        return start * (1 - fraction) + end * fraction
+
+    # Hermite basis functions, with the velocities scaled to the change in position over the whole interval
+    squared = fraction * fraction
+    cubed = squared * fraction
+    startTangent = storeEvery * (cubed - 2 * squared + fraction)
+    endTangent = storeEvery * (cubed - squared)
+
+    positions = start * (2 * cubed - 3 * squared + 1)
+    positions += end * (3 * squared - 2 * cubed)
+    positions += velocities[frame] * startTangent
+    positions += velocities[frame + 1] * endTangent
+
+    return positions
+
+
+# Growable store of particle positions with one (2, numParticles) frame per iteration. One thread can add frames while
+# others read them: frames are written beyond the end and only become visible once committed, and a reallocated buffer
+# is swapped in together with the frame count
+class Trajectory():
+
+    # Minimum number of frames added when the buffer has to grow
+    chunkFrames = 64
+
+    # Frames are stored in their own floating point precision (others as float64). With copy=False frames already in a
+    # single block are used as the buffer as they are
+    def __init__(self, frames: np.array, copy: bool = True):
+
+        frames = np.asarray(frames)
+        if not np.issubdtype(frames.dtype, np.floating):
+            frames = frames.astype(np.float64)
+
+        # Frames are kept in a single block so that slices of it are views
+        self._count = frames.shape[0]
+        if not copy and frames.flags.c_contiguous:
+            self._buffer = frames
+        else:
+            self._buffer = np.empty((self._count,) + frames.shape[1:],
+                                    dtype=frames.dtype)
+            self._buffer[:] = frames
+
+        # Set when the buffer lives in shared memory (so worker processes can write into it)
+        self._sharedMemory = None
+
+        # Guards swapping the buffer and changing the frame count
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        return self.frames[index]
+
+    # View of the frames stored so far (frames already stored are never changed, so the view stays valid)
+    @property
+    def frames(self):
+        with self._lock:
+            return self._buffer[:self._count]
+
+    # Number of frames that fit without reallocating
+    @property
+    def capacity(self):
+        return self._buffer.shape[0]
+
+    # Where other processes can find the buffer, ("memory", shared memory name) or ("file", path) (None if private)
+    @property
+    def sharedLocation(self):
+        return ("memory", self._sharedMemory.name) if self._sharedMemory else None
+
+    # Resize the buffer so that it holds exactly capacity frames
+    def _resize(self, capacity: int, shared: bool = False):
+
+        shape = (capacity,) + self._buffer.shape[1:]
+
+        if shared:
+            sharedMemory = shared_memory.SharedMemory(
+                create=True, size=max(int(np.prod(shape)) * self._buffer.itemsize, 1))
+            buffer = np.ndarray(shape, dtype=self._buffer.dtype,
+                                buffer=sharedMemory.buf)
+
+            # The name is removed once the trajectory is done with it (the memory lives on while in use)
+            weakref.finalize(buffer, sharedMemory.unlink)
+        else:
+            sharedMemory = None
+            buffer = np.empty(shape, dtype=self._buffer.dtype)
+
+        with self._lock:
+            buffer[:self._count] = self._buffer[:self._count]
+            self._buffer = buffer
+            self._sharedMemory = sharedMemory
+
+    # Make sure numFrames more frames can be appended without reallocating (optionally in shared memory)
+    def reserve(self, numFrames: int, shared: bool = False):
+
+        # Small reservations (such as frames simulated as they are needed) grow the buffer geometrically like append
+        if self._count + numFrames > self.capacity:
+            self._resize(max(self._count + numFrames,
+                             self.capacity + max(self.capacity, self.chunkFrames)), shared)
+        elif shared and self._sharedMemory is None:
+            self._resize(self.capacity, shared)
+
+    # Add numFrames frames that have already been written into the buffer (by worker processes)
+    def commitFrames(self, numFrames: int):
+
+        if self._count + numFrames > self.capacity:
+            raise ValueError("Can not commit more frames than have been reserved")
+
+        with self._lock:
+            self._count += numFrames
+
+    # Slot in the buffer for the next frame, to be written in place and then added with commitFrames(1)
+    def nextFrame(self) -> np.array:
+
+        # Grow geometrically, in chunks of at least chunkFrames
+        if self._count == self.capacity:
+            self._resize(self.capacity + max(self.capacity, self.chunkFrames))
+
+        return self._buffer[self._count]
+
+    # Add a frame to the end of the trajectory (amortized O(1))
+    def append(self, frame: np.array):
+
+        self.nextFrame()[:] = frame
+        self.commitFrames(1)
+
+    # Drop the frames after the first numFrames (to simulate them again, views of them must not be in use)
+    def truncate(self, numFrames: int):
+
+        with self._lock:
+            self._count = min(self._count, numFrames)
+
+    # Make sure the frames are stored (only stores on disk hold any back)
+    def flush(self):
+        pass
+
+
+# Trajectory streamed to a folder on disk as it is simulated, for runs with more frames than fit in memory. The frames
+# are one raw block (frames.dat) memory mapped back zero-copy, so only the frames that are used are read, and an index
+# (index.json) records the frame count, shape and dtype each time the store is flushed or grown. The file grows a
+# chunk of chunkBytes at a time without copying the frames already written, and other processes can map the same file
+class DiskTrajectory(Trajectory):
+
+    # Minimum size in bytes the frames file grows by
+    chunkBytes = 64 * 2 ** 20
+
+    # Writes frames (numFrames, 2, numParticles) to a new store at path (replacing any store there), attributes are
+    # kept in the index alongside the frames
+    def __init__(self, path: str, frames: np.array, attributes: dict = None):
+
+        frames = np.asarray(frames)
+        if not np.issubdtype(frames.dtype, np.floating):
+            frames = frames.astype(np.float64)
+
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.attributes = {} if attributes is None else attributes
+        self.writable = True
+        self._count = frames.shape[0]
+        self._sharedMemory = None
+        self._lock = threading.Lock()
+
+        # Written beside any old frames file and swapped in, so that views of the old frames stay valid
+        temporaryPath = self._framesPath + ".tmp"
+        with open(temporaryPath, "wb") as file:
+            file.truncate(max(frames.nbytes, 1))
+        buffer = np.memmap(temporaryPath, dtype=frames.dtype, mode="r+", shape=frames.shape)
+        buffer[:] = frames
+        buffer.flush()
+        os.replace(temporaryPath, self._framesPath)
+
+        self._buffer = buffer.view(np.ndarray)
+        self._writeIndex()
+
+    # Maps the store at path back (read only unless writable), nothing is read until the frames are used
+    @classmethod
+    def open(cls, path: str, writable: bool = False):
+
+        with open(os.path.join(path, "index.json")) as file:
+            index = json.load(file)
+
+        trajectory = cls.__new__(cls)
+        trajectory.path = path
+        trajectory.attributes = index["attributes"]
+        trajectory.writable = writable
+        trajectory._count = index["numFrames"]
+        trajectory._sharedMemory = None
+        trajectory._lock = threading.Lock()
+
+        shape = (index["capacity"],) + tuple(index["frameShape"])
+        trajectory._buffer = np.memmap(trajectory._framesPath, dtype=np.dtype(index["dtype"]),
+                                       mode="r+" if writable else "r", shape=shape).view(np.ndarray)
+
+        return trajectory
+
+    @property
+    def _framesPath(self):
+        return os.path.join(self.path, "frames.dat")
+
+    @property
+    def sharedLocation(self):
+        return ("file", self._framesPath)
+
+    # Replaced atomically so that a store being read (or reopened after a crash) always has a complete index
+    def _writeIndex(self):
+
+        index = {
+            "numFrames": self._count,
+            "capacity": self.capacity,
+            "frameShape": list(self._buffer.shape[1:]),
+            "dtype": self._buffer.dtype.str,
+            "attributes": self.attributes
+        }
+
+        temporaryPath = os.path.join(self.path, "index.json.tmp")
+        with open(temporaryPath, "w") as file:
+            json.dump(index, file)
+        os.replace(temporaryPath, os.path.join(self.path, "index.json"))
+
+    # The file is extended in place (the frames already written aren't copied), it is always shared between processes
+    def _resize(self, capacity: int, shared: bool = False):
+
+        frameShape = self._buffer.shape[1:]
+        frameBytes = max(int(np.prod(frameShape)) * self._buffer.itemsize, 1)
+        capacity = max(capacity, self._count + self.chunkBytes // frameBytes)
+
+        with open(self._framesPath, "r+b") as file:
+            file.truncate(capacity * frameBytes)
+        buffer = np.memmap(self._framesPath, dtype=self._buffer.dtype, mode="r+",
+                           shape=(capacity,) + frameShape).view(np.ndarray)
+
+        with self._lock:
+            self._buffer = buffer
+        self._writeIndex()
+
+    def _checkWritable(self):
+        if not self.writable:
+            raise ValueError(f"The trajectory at {self.path} was opened read only")
+
+    def reserve(self, numFrames: int, shared: bool = False):
+
+        if numFrames > 0:
+            self._checkWritable()
+        if self._count + numFrames > self.capacity:
+            self._resize(self._count + numFrames)
+
+    def truncate(self, numFrames: int):
+
+        self._checkWritable()
+        super().truncate(numFrames)
+        self._writeIndex()
+
+    def nextFrame(self) -> np.array:
+
+        self._checkWritable()
+        if self._count == self.capacity:
+            self._resize(self._count + 1)
+
+        return self._buffer[self._count]
+
+    # Writes the frames still in memory out to the file, and the frame count to the index (which isn't rewritten as
+    # each frame is committed, so frames committed since the last flush aren't seen when the store is opened)
+    def flush(self):
+        if self.writable:
+            self._buffer.base.flush()
+            self._writeIndex()
@@ -0,0 +1,212 @@
+import numpy as np
+from numba import njit, prange
+
+from flowElements import elementVelocity
+
+
+# Number of bits per axis used for the Morton ordering (limits the depth of the tree)
+_maxDepth = 16
+
+# Far field expansions are only used this many core radii away from the elements
+_coreFactor = 4
+
+
+# Morton (Z order) code of each element, interleaving the bits of its quantized x and y
+@njit(cache=True)
+def _mortonCodes(xs, ys, xMin, yMin, size):
+
+    codes = np.empty(xs.shape[0], dtype=np.int64)
+    scale = (2 ** _maxDepth - 1) / size
+
+    for i in range(xs.shape[0]):
+        qx = int((xs[i] - xMin) * scale)
+        qy = int((ys[i] - yMin) * scale)
+
+        code = 0
+        for bit in range(_maxDepth):
+            code |= ((qx >> bit) & 1) << (2 * bit)
+            code |= ((qy >> bit) & 1) << (2 * bit + 1)
+        codes[i] = code
+
+    return codes
+
+
+# Multipole coefficients a_k of every node so that w(z) ~ sum_k a_k / (z - zc) ** (k + 1)
+@njit(parallel=True, cache=True)
+def _multipoles(xs, ys, cRe, cIm, powers, nodeStart, nodeEnd, nodeCx, nodeCy, order):
+
+    numNodes = nodeStart.shape[0]
+    multipoles = np.zeros((numNodes, order + 1), dtype=np.complex128)
+
+    for node in prange(numNodes):
+        zc = complex(nodeCx[node], nodeCy[node])
+
+        for j in range(nodeStart[node], nodeEnd[node]):
+            c = complex(cRe[j], cIm[j])
+            d = complex(xs[j], ys[j]) - zc
+
+            # c / (z - zj) = sum_k c d^k / (z - zc)^(k + 1)
+            if powers[j] == 1:
+                dk = 1.0 + 0j
+                for k in range(order + 1):
+                    multipoles[node, k] += c * dk
+                    dk *= d
+
+            # c / (z - zj)^2 = sum_k c k d^(k - 1) / (z - zc)^(k + 1)
+            else:
+                dk = 1.0 + 0j
+                for k in range(1, order + 1):
+                    multipoles[node, k] += c * k * dk
+                    dk *= d
+
+    return multipoles
+
+
+@njit(parallel=True, cache=True)
+def _treeVelocitiesKernel(xs, ys, exs, eys, cRe, cIm, powers, coreRadii, coreModelIds,
+                          nodeStart, nodeEnd, nodeChildren, nodeCx, nodeCy, nodeRadius, nodeMaxCore,
+                          multipoles, theta, vxs, vys):
+
+    order = multipoles.shape[1] - 1
+
+    for i in prange(xs.shape[0]):
+        z = complex(xs[i], ys[i])
+        w = 0j
+        vx = 0.0
+        vy = 0.0
+
+        stack = np.empty(4 * _maxDepth + 4, dtype=np.int64)
+        stack[0] = 0
+        stackSize = 1
+
+        while stackSize > 0:
+            stackSize -= 1
+            node = stack[stackSize]
+
+            dz = z - complex(nodeCx[node], nodeCy[node])
+            distance = abs(dz)
+
+            # Far enough away that the node can be replaced by its expansion
+            if nodeRadius[node] < theta * distance and \
+                    distance - nodeRadius[node] > _coreFactor * nodeMaxCore[node]:
+                t = 1 / dz
+                expansion = multipoles[node, order]
+                for k in range(order - 1, -1, -1):
+                    expansion = expansion * t + multipoles[node, k]
+                w += expansion * t
+
+            # Leaves close by are summed directly
+            elif nodeChildren[node, 0] == -1 and nodeChildren[node, 1] == -1 and \
+                    nodeChildren[node, 2] == -1 and nodeChildren[node, 3] == -1:
+                start = nodeStart[node]
+                end = nodeEnd[node]
+                nodeVx, nodeVy = elementVelocity(xs[i], ys[i],
+                                                 exs[start:end], eys[start:end],
+                                                 cRe[start:end], cIm[start:end],
+                                                 powers[start:end], coreRadii[start:end],
+                                                 coreModelIds[start:end])
+                vx += nodeVx
+                vy += nodeVy
+
+            else:
+                for child in range(4):
+                    if nodeChildren[node, child] != -1:
+                        stack[stackSize] = nodeChildren[node, child]
+                        stackSize += 1
+
+        # w = vx - i vy
+        vxs[i] = vx + w.real
+        vys[i] = vy - w.imag
+
+
+# Quadtree over the point elements of a FlowElements with a multipole expansion for each node
+class ElementTree():
+
+    def __init__(self, parameters: tuple, order: int, leafSize: int = 32):
+
+        self.parameters = parameters
+        self.order = order
+
+        xs, ys, cRe, cIm, powers, coreRadii, coreModelIds = parameters
+
+        # Uniform streams are the same everywhere so are summed once
+        isUniform = powers == 0
+        self.uniformVelocity = complex(cRe[isUniform].sum(), cIm[isUniform].sum())
+
+        # Sort the point elements along the Morton curve so every node is a contiguous range
+        points = np.flatnonzero(~isUniform)
+        xMin, yMin = xs[points].min(initial=0), ys[points].min(initial=0)
+        size = max(xs[points].max(initial=0) - xMin,
+                   ys[points].max(initial=0) - yMin, 1e-12)
+
+        codes = _mortonCodes(xs[points], ys[points], xMin, yMin, size)
+        sortOrder = np.argsort(codes, kind="stable")
+        self.codes = codes[sortOrder]
+        self.elementParameters = tuple(np.ascontiguousarray(parameter[points][sortOrder])
+                                       for parameter in parameters)
+
+        # Build the nodes (the root covers the bounding square of the elements)
+        nodes = []
+        self._buildNode(nodes, 0, len(points), 0,
+                        xMin + size / 2, yMin + size / 2, size / 2, leafSize)
+
+        self.nodeStart = np.array([node[0] for node in nodes], dtype=np.int64)
+        self.nodeEnd = np.array([node[1] for node in nodes], dtype=np.int64)
+        self.nodeCx = np.array([node[2] for node in nodes])
+        self.nodeCy = np.array([node[3] for node in nodes])
+        self.nodeChildren = np.array([node[4] for node in nodes], dtype=np.int64)
+
+        # Radius of the smallest circle about the node center holding all its elements
+        exs, eys = self.elementParameters[:2]
+        elementCoreRadii = self.elementParameters[5]
+        self.nodeRadius = np.array([
+            np.sqrt(((exs[start:end] - cx) ** 2 + (eys[start:end] - cy) ** 2).max(initial=0))
+            for start, end, cx, cy, _ in nodes
+        ])
+        self.nodeMaxCore = np.array([elementCoreRadii[start:end].max(initial=0)
+                                     for start, end, _, _, _ in nodes])
+
+        self.multipoles = _multipoles(*self.elementParameters[:5],
+                                      self.nodeStart, self.nodeEnd,
+                                      self.nodeCx, self.nodeCy, self.order)
+
+    # Adds the node covering elements start to end and (recursively) its children
+    def _buildNode(self, nodes, start, end, level, cx, cy, halfSize, leafSize):
+
+        nodeIndex = len(nodes)
+        children = [-1, -1, -1, -1]
+        nodes.append([start, end, cx, cy, children])
+
+        if end - start <= leafSize or level == _maxDepth:
+            return nodeIndex
+
+        # Quadrant of each element at this level, these are sorted within the node
+        shift = 2 * (_maxDepth - level - 1)
+        quadrants = (self.codes[start:end] >> shift) & 3
+        bounds = start + np.searchsorted(quadrants, [0, 1, 2, 3, 4])
+
+        for quadrant in range(4):
+            if bounds[quadrant + 1] > bounds[quadrant]:
+                children[quadrant] = self._buildNode(
+                    nodes, bounds[quadrant], bounds[quadrant + 1], level + 1,
+                    cx + (halfSize / 2 if quadrant & 1 else - halfSize / 2),
+                    cy + (halfSize / 2 if quadrant & 2 else - halfSize / 2),
+                    halfSize / 2, leafSize)
+
+        return nodeIndex
+
+    # Velocities (vx, vy) of all the elements at the points xs, ys
+    def velocities(self, xs: np.array, ys: np.array, theta: float):
+
+        vxs = np.empty_like(xs)
+        vys = np.empty_like(ys)
+
+        _treeVelocitiesKernel(xs, ys, *self.elementParameters,
+                              self.nodeStart, self.nodeEnd, self.nodeChildren,
+                              self.nodeCx, self.nodeCy, self.nodeRadius, self.nodeMaxCore,
+                              self.multipoles, theta, vxs, vys)
+
+        vxs += self.uniformVelocity.real
+        vys -= self.uniformVelocity.imag
+
+        return vxs, vys
@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from structs import ParticleData
+from structs import ParticleData, precisionDtype
 
 import numpy as np
 
@@ -7,34 +7,34 @@ import numpy as np
 @dataclass
 class Dye():
 
-    particlesData = ParticleData()
+    # Number of particles reserved up front, so that every shape is written into one block (more can still be added)
+    capacity: int = 0
 
-    # Private method to get a particle data object with data for a line of dye
-    def _getLineDye(self,
+    # Floating point type the positions are made in (see SimSetupData.precision)
+    precision: str = "float64"
+
+    def __post_init__(self):
+        self.particlesData = ParticleData(self.capacity, precisionDtype(self.precision))
+
+    # Private method to write a line of dye into the particle data
+    def _addLineDye(self,
                     lineStart: np.array,
                     lineEnd: np.array,
                     numParticles: np.int64,
-                    particleMass: np.float64) -> ParticleData:
-
-        # Define particle data
-        particleData = ParticleData()
+                    particleMass: np.float64) -> None:
 
         # Set particle values
-        particleData.positions = np.expand_dims(np.linspace(
-            lineStart, lineEnd, numParticles).T, axis=0)
-        particleData.velocities = np.zeros((2, numParticles))
-        particleData.masses = np.zeros((2, numParticles))
-
-        # Return the created particle data
-        return particleData
+        positions = self.particlesData.addShape(numParticles, particleMass)
+        positions[0] = np.linspace(lineStart[0], lineEnd[0], numParticles)
+        positions[1] = np.linspace(lineStart[1], lineEnd[1], numParticles)
 
-    # Private method to get a particle data object with data for a rectangle of dye
-    def _getRectangleDye(self,
+    # Private method to write a rectangle of dye into the particle data
+    def _addRectangleDye(self,
                          height: np.float64,
                          width: np.float64,
                          center: np.array,
                          numParticles: np.int64,
-                         particleMass: np.float64) -> ParticleData:
+                         particleMass: np.float64) -> None:
 
         # Corners in clockwise formation starting from the bottom left
         bottomLeft = center + np.array([- height, - width]) * 0.5
@@ -43,43 +43,31 @@ class Dye():
         bottomRight = center + np.array([- height, width]) * 0.5
 
         # Loop through verticies
-        particleData = self._getLineDye(
-            bottomLeft, topLeft, numParticles // 4, particleMass)
-        particleData += self._getLineDye(topLeft,
-                                         topRight, numParticles // 4, particleMass)
-        particleData += self._getLineDye(topRight,
-                                         bottomRight, numParticles // 4, particleMass)
-        particleData += self._getLineDye(bottomRight,
-                                         bottomLeft, numParticles // 4, particleMass)
-
-        # Return the created particle data
-        return particleData
-
-    # Private method to get a particle data object with data for a circle of dye
-    def _getCircleDye(self,
+        self._addLineDye(bottomLeft, topLeft, numParticles // 4, particleMass)
+        self._addLineDye(topLeft, topRight, numParticles // 4, particleMass)
+        self._addLineDye(topRight, bottomRight, numParticles // 4, particleMass)
+        self._addLineDye(bottomRight, bottomLeft, numParticles // 4, particleMass)
+
+        # The area inside the edges
+        self.particlesData.dyeRegions.append(
+            ("rectangle", bottomLeft[0], topRight[0], bottomLeft[1], topRight[1]))
+
+    # Private method to write a circle of dye into the particle data
+    def _addCircleDye(self,
                       circleCenter: np.array,
                       circleRadius: np.float64,
                       numParticles: np.int64,
-                      particleMass: np.float64) -> ParticleData:
-
-        # Define particle data
-        particleData = ParticleData()
+                      particleMass: np.float64) -> None:
 
         # Create points evenly as a function of theta
         evenPoints = np.linspace(0, 2 * np.pi, numParticles)
 
         # Distorbute these points around a circle
-        particleData.positions = np.expand_dims(np.row_stack(
-            (circleRadius * np.cos(evenPoints) + circleCenter[0],
-             circleRadius * np.sin(evenPoints) + circleCenter[1])
-        ), axis=0)
-
-        # Set other particle values
-        particleData.velocities = np.zeros((2, numParticles))
-        particleData.masses = np.zeros((2, numParticles))
+        positions = self.particlesData.addShape(numParticles, particleMass)
+        positions[0] = circleRadius * np.cos(evenPoints) + circleCenter[0]
+        positions[1] = circleRadius * np.sin(evenPoints) + circleCenter[1]
 
-        # Return the created particle data
-        return particleData
+        self.particlesData.dyeRegions.append(("circle", circleCenter[0], circleCenter[1], circleRadius))
 
     # Returns the particle data
     def getParticleData(self):
@@ -91,7 +79,7 @@ class Dye():
                 lineEnd: np.array,
                 numParticles: np.int64,
                 particleMass: np.float64) -> None:
-        self.particlesData += self._getLineDye(
+        self._addLineDye(
             lineStart,
             lineEnd,
             numParticles,
@@ -105,7 +93,7 @@ class Dye():
                      center: np.array,
                      numParticles: np.int64,
                      particleMass: np.float64) -> None:
-        self.particlesData += self._getRectangleDye(
+        self._addRectangleDye(
             height,
             width,
             center,
@@ -119,7 +107,7 @@ class Dye():
                   circleRadius: np.float64,
                   shapeParticles: np.int64,
                   particleMass: np.float64) -> None:
-        self.particlesData += self._getCircleDye(
+        self._addCircleDye(
             circleCenter,
             circleRadius,
             shapeParticles,
@@ -1,7 +1,31 @@
 from structs import SimFlowFuncs
+from flowCompiler import flowFingerprint, compileFlowKernel
+from autodiff import complexDerivative, gradient2D
+from flowElements import FlowElements
+from treecode import ElementTree
+import warnings
 import numpy as np
 
 
+# Uses the exact flow, switching to the finite difference flow for good if the exact one can't be evaluated
+def _exactWithFallback(exactFlow, finiteDifferenceFlow):
+
+    useExact = [True]
+
+    def flow(x, y):
+        if useExact[0]:
+            try:
+                return exactFlow(x, y)
+            except (TypeError, AttributeError, ValueError) as error:
+                useExact[0] = False
+                warnings.warn(
+                    f"Automatic differentiation failed ({error}), using finite differences for this flow")
+
+        return finiteDifferenceFlow(x, y)
+
+    return flow
+
+
 class Flow():
 
     def __init__(self):
@@ -11,6 +35,10 @@ class Flow():
             "polarFlow": []
         }
 
+        # Point vortices, sources, doublets and uniform streams stored as parameter arrays
+        self.elements = FlowElements()
+        self._elementTree = None
+
     def cartesianFlow(self, relativeFlowFunctionX, relativeFlowFunctionY,
                       functionOffset=None):
         # Relative flow function must have form lambda x, y: some function
@@ -18,87 +46,253 @@ class Flow():
         if functionOffset:
 
             self.flowFunctions["cartesianFlow"].append({
-                "vx": lambda x, y: relativeFlowFunctionX(x - functionOffset[0], y - functionOffset[1]),
-                "vy": lambda x, y: relativeFlowFunctionY(x - functionOffset[0], y - functionOffset[1])
+                "vxy": lambda x, y: (relativeFlowFunctionX(x - functionOffset[0], y - functionOffset[1]),
+                                     relativeFlowFunctionY(x - functionOffset[0], y - functionOffset[1])),
+                "type": "cartesianFlow",
+                "functions": (relativeFlowFunctionX, relativeFlowFunctionY),
+                "offset": functionOffset
             })
 
         else:
 
             self.flowFunctions["cartesianFlow"].append({
-                "vx": lambda x, y: relativeFlowFunctionX(x, y),
-                "vy": lambda x, y: relativeFlowFunctionY(x, y)
+                "vxy": lambda x, y: (relativeFlowFunctionX(x, y),
+                                     relativeFlowFunctionY(x, y)),
+                "type": "cartesianFlow",
+                "functions": (relativeFlowFunctionX, relativeFlowFunctionY),
+                "offset": None
             })
 
     def polarFlow(self, relativeFlowFunctionR, relativeFlowFunctionTheta,
                   functionOffsetCartesian=None, functionOffsetPolar=None):
         # Relative flow function must have form lambda r, theta: some function
 
+        # Each entry works out its (offset) coordinates once for both components
         if functionOffsetCartesian:
 
-            def offsetR(r, theta, xOff, yOff): return np.sqrt(
-                (r * np.cos(theta) + xOff) ** 2 +
-                (r * np.sin(theta) + yOff) ** 2
-            )
+            def offsetFlow(coordinates, xOff=functionOffsetCartesian[0], yOff=functionOffsetCartesian[1]):
+                x = coordinates.x + xOff
+                y = coordinates.y + yOff
+                r = np.sqrt(x ** 2 + y ** 2)
+                theta = np.arctan2(y, x)
 
-            def offsetTheta(r, theta, xOff, yOff): return np.arctan2(
-                (r * np.sin(theta) + yOff), (r * np.cos(theta) + xOff)
-            )
+                return relativeFlowFunctionR(r, theta), relativeFlowFunctionTheta(r, theta)
 
             self.flowFunctions["polarFlow"].append({
-                "vr": lambda r, theta: relativeFlowFunctionR(
-                    offsetR(r, theta, *functionOffsetCartesian), offsetTheta(r,
-                                                                             theta, *functionOffsetCartesian)
-                ),
-                "vtheta": lambda r, theta: relativeFlowFunctionTheta(
-                    offsetR(r, theta, *functionOffsetCartesian), offsetTheta(r,
-                                                                             theta, *functionOffsetCartesian)
-                )
+                "vrtheta": offsetFlow,
+                "type": "polarFlowCartesianOffset",
+                "functions": (relativeFlowFunctionR, relativeFlowFunctionTheta),
+                "offset": functionOffsetCartesian
             })
 
         elif functionOffsetPolar:
 
+            def offsetFlow(coordinates, rOff=functionOffsetPolar[0], thetaOff=functionOffsetPolar[1]):
+                r = coordinates.r - rOff
+                theta = coordinates.theta - thetaOff
+
+                return relativeFlowFunctionR(r, theta), relativeFlowFunctionTheta(r, theta)
+
             self.flowFunctions["polarFlow"].append({
-                "vr": lambda r, theta: relativeFlowFunctionR(r - functionOffsetPolar[0], theta - functionOffsetPolar[0]),
-                "vtheta": lambda r, theta: relativeFlowFunctionTheta(r - functionOffsetPolar[0], theta - functionOffsetPolar[0])
+                "vrtheta": offsetFlow,
+                "type": "polarFlowPolarOffset",
+                "functions": (relativeFlowFunctionR, relativeFlowFunctionTheta),
+                "offset": functionOffsetPolar
             })
 
         else:
             self.flowFunctions["polarFlow"].append({
-                "vr": lambda r, theta: relativeFlowFunctionR(r, theta),
-                "vtheta": lambda r, theta: relativeFlowFunctionTheta(r, theta)
+                "vrtheta": lambda coordinates: (relativeFlowFunctionR(coordinates.r, coordinates.theta),
+                                                relativeFlowFunctionTheta(coordinates.r, coordinates.theta)),
+                "type": "polarFlow",
+                "functions": (relativeFlowFunctionR, relativeFlowFunctionTheta),
+                "offset": None
             })
 
-    def streamFunctionFlow(self, streamFunction, functionOffset=None):
+    def streamFunctionFlow(self, streamFunction, functionOffset=None, streamFunctionGradient=None):
         # Adds a flow using a stream function
+        # streamFunctionGradient (optional) is a function of x, y returning (d/dx, d/dy) of the stream function
 
         compute_gradientX = lambda f, x, y, h=1e-5: (
             f(x + h, y) - f(x - h, y)) / (2 * h)
         compute_gradientY = lambda f, x, y, h=1e-5: (
             f(x, y + h) - f(x, y - h)) / (2 * h)
 
+        # vx = d/dy streamFunction, vy = - d/dx streamFunction
+        if streamFunctionGradient:
+            def relativeFlow(x, y):
+                gradientX, gradientY = streamFunctionGradient(x, y)
+                return gradientY, - gradientX
+
+            functions = (streamFunction, streamFunctionGradient)
+
+        else:
+            def finiteDifferenceFlow(x, y): return (
+                compute_gradientY(streamFunction, x, y),
+                - compute_gradientX(streamFunction, x, y)
+            )
+
+            def exactFlow(x, y):
+                gradientX, gradientY = gradient2D(streamFunction, x, y)
+                return gradientY, - gradientX
+
+            relativeFlow = _exactWithFallback(exactFlow, finiteDifferenceFlow)
+            functions = (streamFunction,)
+
+        self._addRelativeCartesianFlow(
+            relativeFlow, "streamFunctionFlow", functions, functionOffset, streamFunction)
+
+    def complexPotentialFlow(self, complexPotential, functionOffset=None, complexVelocity=None):
+        # complexPotential is a function of z = x + iy
+        # complexVelocity (optional) is dW/dz as a function of z, otherwise it is found by automatic differentiation
+
+        # complex(x, y) = x + iy
+
+        # dW/dz = vx - i vy
+        if complexVelocity:
+            def relativeFlow(x, y):
+                dWdz = complexVelocity(x + y * 1j)
+                return np.real(dWdz), - np.imag(dWdz)
+
+            functions = (complexPotential, complexVelocity)
+
+        else:
+            # Potential is holomorphic so a central difference along x gives dW/dz
+            def finiteDifferenceFlow(x, y, h=1e-5):
+                dWdz = (complexPotential(x + h + y * 1j) -
+                        complexPotential(x - h + y * 1j)) / (2 * h)
+                return np.real(dWdz), - np.imag(dWdz)
+
+            def exactFlow(x, y):
+                dWdz = complexDerivative(complexPotential, x + y * 1j)
+                return np.real(dWdz), - np.imag(dWdz)
+
+            relativeFlow = _exactWithFallback(exactFlow, finiteDifferenceFlow)
+            functions = (complexPotential,)
+
+        # The stream function is the imaginary part of the complex potential
+        def streamFunction(x, y): return np.imag(complexPotential(x + y * 1j))
+
+        self._addRelativeCartesianFlow(
+            relativeFlow, "complexPotentialFlow", functions, functionOffset, streamFunction)
+
+    # Adds a cartesian flow given by one function of x, y returning (vx, vy), and its stream function
+    def _addRelativeCartesianFlow(self, relativeFlow, flowType, functions, functionOffset, streamFunction):
+
         if functionOffset:
 
             self.flowFunctions["cartesianFlow"].append({
-                "vx": lambda x, y: compute_gradientY(streamFunction, x - functionOffset[0], y - functionOffset[1]),
-                "vy": lambda x, y: - compute_gradientX(streamFunction, x - functionOffset[0], y - functionOffset[1])
+                "vxy": lambda x, y: relativeFlow(x - functionOffset[0], y - functionOffset[1]),
+                "psi": lambda x, y: streamFunction(x - functionOffset[0], y - functionOffset[1]),
+                "type": flowType,
+                "functions": functions,
+                "offset": functionOffset
             })
 
         else:
 
             self.flowFunctions["cartesianFlow"].append({
-                "vx": lambda x, y: compute_gradientY(streamFunction, x, y),
-                "vy": lambda x, y: - compute_gradientX(streamFunction, x, y)
+                "vxy": relativeFlow,
+                "psi": streamFunction,
+                "type": flowType,
+                "functions": functions,
+                "offset": None
             })
 
-    def complexPotentialFlow(self, complexPotential, functionOffset=None):
-        # complexPotential is a function of z = x + iy
+    # Adds analytic elements, all of them are evaluated together as a single flow
+    def _addElements(self, positions, coefficients, power, coreRadii=0, coreModel="rankine"):
 
-        # complex(x, y) = x + iy
+        # First element added, register the element flow
+        if len(self.elements) == 0:
+            self.flowFunctions["cartesianFlow"].append({
+                "vxy": self._elementVelocities,
+                "psi": self._elementStreamFunction,
+                "type": "flowElements",
+                "functions": (),
+                "offset": None,
+                "elements": self.elements
+            })
+
+        self.elements.add(positions, coefficients, power, coreRadii, coreModel)
+
+    # Velocities of the analytic elements, using tree summation when there are many of them
+    def _elementVelocities(self, x, y):
+
+        if len(self.elements) < self.elements.minTreeElements:
+            return self.elements.velocities(x, y)
 
-        self.streamFunctionFlow(
-            streamFunction=lambda x, y: np.imag(complexPotential(x + y * 1j)),
-            functionOffset=functionOffset
-        )
+        # Rebuild the tree if elements were added or the settings changed
+        if self._elementTree is None or \
+                self._elementTree.parameters is not self.elements.parameters or \
+                self._elementTree.order != self.elements.treeOrder:
+            self._elementTree = ElementTree(self.elements.parameters,
+                                            self.elements.treeOrder, self.elements.treeLeafSize)
+
+        x, y = np.broadcast_arrays(np.asarray(x, dtype=np.float64),
+                                   np.asarray(y, dtype=np.float64))
+        vxs, vys = self._elementTree.velocities(np.ascontiguousarray(x).ravel(),
+                                                np.ascontiguousarray(y).ravel(),
+                                                self.elements.treeTheta)
+
+        return vxs.reshape(x.shape), vys.reshape(y.shape)
+
+    def _elementStreamFunction(self, x, y):
+        return self.elements.streamFunction(x, y)
+
+    # Stream function of the whole flow, None if part of it has no (cheap) stream function
+    def _streamFunction(self):
+
+        entries = self.flowFunctions["cartesianFlow"]
+        if len(self.flowFunctions["polarFlow"]) != 0 or len(entries) == 0 or \
+                any("psi" not in entry for entry in entries):
+            return None
+
+        # Elements summed with the tree have too many terms to evaluate the stream function directly
+        if len(self.elements) != 0 and (not self.elements.hasStreamFunction or
+                                        len(self.elements) >= self.elements.minTreeElements):
+            return None
+
+        def psiFunc(x, y):
+            sumPsi = 0
+            for entry in entries:
+                sumPsi += entry["psi"](x, y)
+            return sumPsi
+
+        return psiFunc
+
+    def vortices(self, positions, circulations, coreRadii=0, coreModel="rankine"):
+        # Point vortices at positions (a single (x, y) or an array of them), positive circulation is anticlockwise
+        # coreRadii > 0 smooths the velocity inside the core using coreModel ("rankine" or "lambOseen")
+
+        # W = - i circulation log(z - z0) / (2 pi)
+        self._addElements(positions, - 1j * np.asarray(circulations) / (2 * np.pi), 1,
+                          coreRadii, coreModel)
+
+    def sources(self, positions, strengths, coreRadii=0, coreModel="rankine"):
+        # Point sources at positions, the strength is the volume flux out of the source
+
+        # W = strength log(z - z0) / (2 pi)
+        self._addElements(positions, np.asarray(strengths) / (2 * np.pi), 1,
+                          coreRadii, coreModel)
+
+    def sinks(self, positions, strengths, coreRadii=0, coreModel="rankine"):
+        # Point sinks at positions, the strength is the volume flux into the sink
+
+        self.sources(positions, - np.asarray(strengths), coreRadii, coreModel)
+
+    def doublets(self, positions, strengths, angles=0, coreRadii=0, coreModel="rankine"):
+        # Doublets at positions, angles gives the direction of the doublet axis
+
+        # W = strength e^(i angle) / (2 pi (z - z0))
+        self._addElements(positions,
+                          - np.asarray(strengths) * np.exp(1j * np.asarray(angles)) / (2 * np.pi), 2,
+                          coreRadii, coreModel)
+
+    def uniformStream(self, velocity):
+        # Uniform stream with velocity (vx, vy)
+
+        # W = (vx - i vy) z
+        self._addElements((0, 0), complex(velocity[0], - velocity[1]), 0)
 
     # def complexPotential(complexPotentialFunction):
     #     # A complex potentail is such that the vx - ivy = d_z complexPotentialFunction
@@ -106,46 +300,83 @@ class Flow():
     #     # The imaginary part of the complex potential function is the stream function
     #     # which describes z = x + iy
 
-    def getSimFlowFunc(self):
+    # Stable hash of the flow definition
+    def fingerprint(self):
+        return flowFingerprint(self.flowFunctions)
+
+    # Fuse all of the primitives into one parallel numba kernel (falls back to getSimFlowFunc if it can't)
+    def compile(self):
+
+        # Large element sets use tree summation so are left out of the kernel
+        useTree = len(self.elements) >= self.elements.minTreeElements
+        flowFunctions = {
+            flowType: [entry for entry in entries
+                       if not (useTree and entry["type"] == "flowElements")]
+            for flowType, entries in self.flowFunctions.items()
+        }
+
+        kernel = compileFlowKernel(flowFunctions, flowFingerprint(flowFunctions))
+
+        if kernel is None:
+            return self.getSimFlowFunc()
+
+        def vxyFunc(x, y):
+            xs = np.ascontiguousarray(x, dtype=np.float64)
+            ys = np.ascontiguousarray(y, dtype=np.float64)
+            vxs = np.empty_like(xs)
+            vys = np.empty_like(ys)
+
+            kernel(xs, ys, vxs, vys)
+
+            if useTree:
+                elementVxs, elementVys = self._elementVelocities(xs, ys)
+                vxs += elementVxs
+                vys += elementVys
+
+            return vxs, vys
 
         simFlow = SimFlowFuncs()
+        simFlow.vxy = vxyFunc
+        simFlow.psi = self._streamFunction()
+        simFlow.fingerprint = self.fingerprint()
 
-        # Handle cartesianFlow
-        if len(self.flowFunctions["cartesianFlow"]) != 0:
-            def vxFunc(x, y):
-                sumFlow = 0
+        return simFlow
 
-                for flowFunc in self.flowFunctions["cartesianFlow"]:
-                    sumFlow += flowFunc["vx"](x, y)
-                return sumFlow
+    def getSimFlowFunc(self, jit=False):
+
+        if jit:
+            return self.compile()
 
-            def vyFunc(x, y):
-                sumFlow = 0
+        simFlow = SimFlowFuncs()
+        simFlow.psi = self._streamFunction()
+        simFlow.fingerprint = self.fingerprint()
+
+        # Handle cartesianFlow
+        if len(self.flowFunctions["cartesianFlow"]) != 0:
+            def vxyFunc(x, y):
+                sumFlowX = 0
+                sumFlowY = 0
 
                 for flowFunc in self.flowFunctions["cartesianFlow"]:
-                    sumFlow += flowFunc["vy"](x, y)
-                return sumFlow
+                    vx, vy = flowFunc["vxy"](x, y)
+                    sumFlowX += vx
+                    sumFlowY += vy
+                return sumFlowX, sumFlowY
 
-            simFlow.vx = vxFunc
-            simFlow.vy = vyFunc
+            simFlow.vxy = vxyFunc
 
         # Handle polarFlow
         if len(self.flowFunctions["polarFlow"]) != 0:
-            def vrFunc(r, theta):
-                sumFlow = 0
-
-                for flowFunc in self.flowFunctions["polarFlow"]:
-                    sumFlow += flowFunc["vr"](r, theta)
-                return sumFlow
-
-            def vthetaFunc(r, theta):
-                sumFlow = 0
+            def vrthetaFunc(coordinates):
+                sumFlowR = 0
+                sumFlowTheta = 0
 
                 for flowFunc in self.flowFunctions["polarFlow"]:
-                    sumFlow += flowFunc["vtheta"](r, theta)
-                return sumFlow
+                    vr, vtheta = flowFunc["vrtheta"](coordinates)
+                    sumFlowR += vr
+                    sumFlowTheta += vtheta
+                return sumFlowR, sumFlowTheta
 
-            simFlow.vr = vrFunc
-            simFlow.vtheta = vthetaFunc
+            simFlow.vrtheta = vrthetaFunc
 
         return simFlow
@@ -1,12 +1,13 @@
 from dataclasses import dataclass
-from matplotlib.widgets import RangeSlider
-import mpl_interactions.ipyplot as iplt
 
-import numpy as np
-
-from structs import SimFlowFuncs, SimSetupData, ParticleData, PlottingData
+from structs import SimFlowFuncs, SimSetupData, ParticleData, PlottingData, precisionDtype
 from iterator import iterateParticles
+from parallel import ParallelIterator, forkSafeThreading
 from plotter import Plotting
+from sampledField import SampledField
+from backgroundSimulation import BackgroundSimulation
+from instrumentation import Profiler, phase
+from checkpoint import writeCheckpoint, resumeParticleData
 
 
 @dataclass
@@ -25,21 +26,159 @@ class Visualizer():
     plottingData: PlottingData
 
     def __post_init__(self):
+
+        # Worker processes (simulating or rendering animations) are forked later on, which numba has to be set up for
+        # before it runs anything
+        if self.setupData.workers > 1 or self.plottingData.animationWorkers > 1:
+            forkSafeThreading()
+
+        # The particles are simulated and stored in the precision asked for (the dye may have been made in another)
+        self.particleData.setDtype(precisionDtype(self.setupData.precision))
+        self.particleData.setStoreEvery(self.setupData.storeEvery)
+        if self.setupData.trajectoryPath is not None:
+            self.particleData.storeTrajectoryOnDisk(self.setupData.trajectoryPath)
+
+        # Records where the time of the run goes when enabled
+        self.profiler = Profiler()
+        if self.setupData.profile:
+            self.profiler.enable()
+
         self.plotter = Plotting(
-            self.flowData, self.particleData, self.plottingData)
+            self.flowData, self.particleData, self.plottingData, self.setupData)
+
+        # Created on the first parallel iteration
+        self.parallelIterator = None
+
+        # Set while frames are being simulated in a background thread
+        self.backgroundSimulation = None
+
+        # Frames are simulated as they are asked for (e.g. by the interactive plot)
+        self.particleData.simulator = self.iterate
+
+        # Sample the flow once over the plot area (the plots reuse the same grid)
+        if self.setupData.sampledField:
+            self.sampledField = SampledField(
+                self.flowData,
+                self.plotter.xMin, self.plotter.xMax,
+                self.plotter.yMin, self.plotter.yMax,
+                resolution=self.setupData.sampledFieldResolution,
+                interpolation=self.setupData.sampledFieldInterpolation,
+                exactTolerance=self.setupData.sampledFieldTolerance
+            )
+
+            self.flowData = self.sampledField.getSimFlowFunc()
+            self.plotter.flowData = self.flowData
+
+    # Visualizer carrying on the run checkpointed at checkpointPath (setupData.checkpointPath by default), see
+    # checkpoint.resumeParticleData. New frames are appended to the checkpointed trajectory when it was stored on disk
+    @classmethod
+    def resume(cls, flowData: SimFlowFuncs, setupData: SimSetupData, plottingData: PlottingData,
+               checkpointPath: str = None, force: bool = False):
+
+        particleData = resumeParticleData(checkpointPath or setupData.checkpointPath, flowData, setupData, force)
+        return cls(flowData, setupData, particleData, plottingData)
 
     # Iterate the particles one step in time
     def iterate(self, numIter=1):
 
-        # TODO: @Joshua13764 Each loop takes ~ 500ms to run! This needs to be optimised!
-        for _ in range(numIter):
+        if self.backgroundSimulation is not None and self.backgroundSimulation.running:
+            raise RuntimeError(
+                "The particles are being simulated in the background, call stopBackground first")
+
+        self._iterate(numIter)
+
+        # A trajectory on disk can be opened from the frames so far
+        with phase("trajectory.store"):
+            self.particleData.flush()
+
+    def _iterate(self, numIter=1):
+
+        if self.setupData.checkpointPath is None:
+            self._advance(numIter)
+            return
+
+        # Simulated up to each checkpoint in turn
+        checkpointEvery = self.setupData.checkpointEvery
+        while numIter > 0:
+            iteration = self.particleData.numIterations
+            steps = min(numIter, checkpointEvery - iteration % checkpointEvery)
+
+            self._advance(steps)
+            numIter -= steps
+
+            if (iteration + steps) % checkpointEvery == 0:
+                with phase("checkpoint"):
+                    writeCheckpoint(self.setupData.checkpointPath, self.particleData, self.setupData, self.flowData)
 
+    def _advance(self, numIter=1):
+
+        # Particles are independent so are split between worker processes
+        if self.setupData.workers > 1:
+
+            # The pool (and the flow sent to it) is kept for later iterations
+            if self.parallelIterator is None:
+                self.parallelIterator = ParallelIterator(
+                    self.flowData, self.setupData, self.setupData.workers)
+
+            self.parallelIterator.iterate(self.particleData, numIter)
+            return
+
+        # Allocate the whole run up front so that each iteration only writes its frame
+        with phase("trajectory.store"):
+            self.particleData.reserveIterations(numIter)
+
+        for _ in range(numIter):
             iterateParticles(self.particleData, self.flowData, self.setupData)
 
-    # Plot the particles currently
-    def plot(self, interactive=False):
+    # Keep simulating numIter more iterations in a background thread (frames can be used as soon as they are done)
+    def simulateInBackground(self, numIter: int) -> BackgroundSimulation:
+
+        self.stopBackground()
+        self.backgroundSimulation = BackgroundSimulation(self, numIter).start()
+
+        # Frames asked for that aren't done yet are waited for instead of simulated a second time
+        self.particleData.simulator = self.backgroundSimulation.waitForIterations
+
+        return self.backgroundSimulation
+
+    def stopBackground(self):
+
+        if self.backgroundSimulation is not None:
+            self.backgroundSimulation.stop()
+            self.backgroundSimulation = None
+            self.particleData.simulator = self.iterate
+
+    # Plot the particles currently, with background=True the interactive plot opens straight away and its time slider
+    # extends as the frames are simulated
+    def plot(self, interactive=False, background=False):
+
+        if interactive and background:
+            self.simulateInBackground(max(self.plottingData.timeSteps_range[1]
+                                          - self.particleData.numIterations, 0))
+
+        with phase("plot"):
+            self._plot(interactive, background)
+
+        # Once the window is closed (the simulation is left running when the figure isn't shown)
+        if background and self.plottingData.showFigure:
+            self.stopBackground()
+
+    # Render the dye over timeSteps_range as an animation file without opening a window (frames not simulated yet are
+    # simulated first), see Plotting.exportAnimation. Returns the time taken per frame
+    def exportAnimation(self, path=None, fps=None, workers=None):
+
+        lastFrame = self.plottingData.timeSteps_range[1]
+        self.particleData.positionsAtTime(lastFrame)
+
+        with phase("animation"):
+            return self.plotter.exportAnimation(path, range(self.particleData.firstIteration, lastFrame + 1), fps,
+                                                workers)
+
+    def _plot(self, interactive=False, background=False):
         if interactive:
             self.plotter.plotInteractiveParticles(args={'interactive': True,
-                                                        'timeStep': self.setupData.timeStep})
+                                                        'timeStep': self.setupData.timeStep,
+                                                        'background': background,
+                                                        'backgroundSimulation': self.backgroundSimulation})
         else:
             self.plotter.plotParticles()